@@ -1,13 +1,24 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify, session, flash, current_app
+from flask import Flask, render_template, stream_template, request, redirect, url_for, jsonify, session, flash, current_app, abort, send_file, Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, inspect as sa_inspect
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import contains_eager, selectinload
+from sqlalchemy.schema import CreateTable
 from flask_mail import Mail, Message
 from flask_wtf import FlaskForm, CSRFProtect
-from wtforms import StringField, PasswordField, EmailField, TextAreaField, SelectField, SubmitField, HiddenField
-from wtforms.validators import DataRequired, Email, Length, EqualTo, ValidationError
+from wtforms import StringField, PasswordField, EmailField, TextAreaField, SelectField, SubmitField, HiddenField, FloatField, IntegerField
+from wtforms.validators import DataRequired, Email, Length, EqualTo, ValidationError, NumberRange, Optional
 from datetime import datetime, timedelta
 import os
+import io
+import csv
+import json
+import time
+import atexit
 import hashlib
 import secrets
+from collections import namedtuple
+from itertools import groupby
 import bcrypt
 from itsdangerous import URLSafeTimedSerializer
 import re
@@ -15,89 +26,28 @@ import requests
 from urllib.parse import urljoin, urlparse
 from urllib.parse import urlparse
 import mimetypes
-
-def validate_image_url(url):
-    """
-    Validate that a URL points to a legitimate image and is safe to use.
-    Returns (is_valid, error_message)
-    """
-    if not url or not url.strip():
-        return True, None  # Empty URLs are allowed
-    
-    url = url.strip()
-    
-    # Parse the URL
-    try:
-        parsed = urlparse(url)
-    except Exception:
-        return False, "Invalid URL format"
-    
-    # Check protocol - only allow http/https
-    if parsed.scheme not in ['http', 'https']:
-        return False, "Only HTTP and HTTPS URLs are allowed"
-    
-    # Check for suspicious patterns that might indicate XSS attempts
-    suspicious_patterns = [
-        r'javascript:',
-        r'data:',
-        r'vbscript:',
-        r'onload\s*=',
-        r'onerror\s*=',
-        r'onclick\s*=',
-        r'<script',
-        r'</script>',
-        r'<iframe',
-        r'<object',
-        r'<embed',
-        r'<link',
-        r'<meta',
-        r'<style',
-        r'expression\s*\(',
-        r'url\s*\(',
-        r'@import',
-    ]
-    
-    for pattern in suspicious_patterns:
-        if re.search(pattern, url, re.IGNORECASE):
-            return False, "URL contains potentially dangerous content"
-    
-    # Check if URL looks like an image based on extension
-    image_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.webp', '.svg', '.bmp', '.ico']
-    url_lower = url.lower()
-    
-    # Check file extension
-    has_image_extension = any(url_lower.endswith(ext) for ext in image_extensions)
-    
-    # If it doesn't have an image extension, try to validate by making a HEAD request
-    if not has_image_extension:
-        try:
-            # Make a HEAD request to check content type without downloading the full file
-            response = requests.head(url, timeout=10, allow_redirects=True)
-            
-            if response.status_code == 200:
-                content_type = response.headers.get('content-type', '').lower()
-                if not content_type.startswith('image/'):
-                    return False, "URL does not point to an image file"
-            else:
-                return False, f"Could not verify image (HTTP {response.status_code})"
-                
-        except requests.exceptions.RequestException as e:
-            return False, f"Could not verify image URL: {str(e)}"
-    
-    # Additional security checks
-    # Check for localhost/internal IPs (optional - comment out if you want to allow local images)
-    if parsed.hostname:
-        if parsed.hostname in ['localhost', '127.0.0.1', '0.0.0.0']:
-            return False, "Local URLs are not allowed for security reasons"
-        
-        # Check for private IP ranges
-        if parsed.hostname.startswith('192.168.') or parsed.hostname.startswith('10.') or parsed.hostname.startswith('172.'):
-            return False, "Private network URLs are not allowed"
-    
-    return True, None
+from profiler import SamplingProfiler
+from scheduler import Scheduler
+from assets import StaticAssets
+from compression import ResponseCompression
+from cache import FamilySnapshotCache, SQLiteCacheBackend, ChildSnapshot, GiftSnapshot
+from enrichment import BackgroundPool, MetadataFetcher, canonical_url
+from linkcheck import LinkChecker, DEAD
+from outbound import OutboundClient
+from imagecheck import ImageURLValidator
+from writebehind import WriteBehindBuffer
+from ranking import key_between, spread
+from prices import parse_price
+from archive import write_archive, read_archive, extract_files, serialize_row, deserialize_row
+from backup import create_backup, list_backups, restore_backup, verify_backup
+from sharding import ShardRouter, RoutingSession, ShardMovingError, DEFAULT_SHARD, get_router, parse_shards, shard_of, use_family, for_each_shard, move_family
+import glob
+import tarfile
+import click
+from jinja2 import FileSystemBytecodeCache
 
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///wishlist.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///wishlist.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'your-secret-key-change-in-production')
 app.config['MAIL_SERVER'] = os.environ.get('MAIL_SERVER', 'smtp.gmail.com')
@@ -106,18 +56,153 @@ app.config['MAIL_USE_TLS'] = os.environ.get('MAIL_USE_TLS', 'true').lower() in [
 app.config['MAIL_USERNAME'] = os.environ.get('MAIL_USERNAME')
 app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD')
 app.config['MAIL_DEFAULT_SENDER'] = os.environ.get('MAIL_DEFAULT_SENDER', 'noreply@wishlist.com')
-
-db = SQLAlchemy(app)
+app.config['PROFILER_DIR'] = os.environ.get('PROFILER_DIR')
+app.config['PROFILER_INTERVAL'] = float(os.environ.get('PROFILER_INTERVAL', 0.005))
+app.config['PROFILER_MAX_PROFILES'] = int(os.environ.get('PROFILER_MAX_PROFILES', 50))
+app.config['SCHEDULER_ENABLED'] = os.environ.get('SCHEDULER_ENABLED', 'true').lower() in ['true', 'on', '1']
+# Preforking servers start the scheduler in each worker instead (see gunicorn.conf.py)
+app.config['WRITE_BEHIND_INTERVAL'] = int(os.environ.get('WRITE_BEHIND_INTERVAL', 5))
+app.config['WRITE_BEHIND_MAX_KEYS'] = int(os.environ.get('WRITE_BEHIND_MAX_KEYS', 10000))
+app.config['SCHEDULER_AUTOSTART'] = os.environ.get('SCHEDULER_AUTOSTART', 'true').lower() in ['true', 'on', '1']
+app.config['RESET_TOKEN_MAX_OUTSTANDING'] = int(os.environ.get('RESET_TOKEN_MAX_OUTSTANDING', 3))
+app.config['RESET_TOKEN_PRUNE_INTERVAL'] = int(os.environ.get('RESET_TOKEN_PRUNE_INTERVAL', 3600))
+app.config['RESET_TOKEN_PRUNE_BATCH'] = int(os.environ.get('RESET_TOKEN_PRUNE_BATCH', 500))
+app.config['COMPRESS_ENABLED'] = os.environ.get('COMPRESS_ENABLED', 'true').lower() in ['true', 'on', '1']
+app.config['COMPRESS_MIN_SIZE'] = int(os.environ.get('COMPRESS_MIN_SIZE', 500))
+app.config['STATIC_OFFLOAD'] = os.environ.get('STATIC_OFFLOAD', '')  # '', 'x-accel' or 'x-sendfile'
+app.config['STATIC_ACCEL_PREFIX'] = os.environ.get('STATIC_ACCEL_PREFIX', '/protected-uploads/')
+app.config['UPLOADS_MAX_AGE'] = int(os.environ.get('UPLOADS_MAX_AGE', 86400))
+app.config['JINJA_CACHE_DIR'] = os.environ.get('JINJA_CACHE_DIR', os.path.join(app.instance_path, 'jinja_cache'))
+app.config['TEMPLATE_PREWARM'] = os.environ.get('TEMPLATE_PREWARM', 'true').lower() in ['true', 'on', '1']
+app.config['FAMILY_CACHE_SIZE'] = int(os.environ.get('FAMILY_CACHE_SIZE', 256))
+app.config['FAMILY_CACHE_BACKEND'] = os.environ.get('FAMILY_CACHE_BACKEND', 'local')
+app.config['FAMILY_CACHE_PATH'] = os.environ.get('FAMILY_CACHE_PATH', os.path.join(app.instance_path, 'family_cache.db'))
+app.config['LINK_ENRICHMENT_ENABLED'] = os.environ.get('LINK_ENRICHMENT_ENABLED', 'true').lower() in ['true', 'on', '1']
+app.config['LINK_ENRICHMENT_WORKERS'] = int(os.environ.get('LINK_ENRICHMENT_WORKERS', 2))
+app.config['LINK_ENRICHMENT_QUEUE'] = int(os.environ.get('LINK_ENRICHMENT_QUEUE', 100))
+app.config['LINK_METADATA_TTL_HOURS'] = int(os.environ.get('LINK_METADATA_TTL_HOURS', 168))
+app.config['LINK_FETCH_HOST_INTERVAL'] = float(os.environ.get('LINK_FETCH_HOST_INTERVAL', 1.0))
+app.config['LINK_FETCH_ALLOW_PRIVATE'] = os.environ.get('LINK_FETCH_ALLOW_PRIVATE', 'false').lower() in ['true', 'on', '1']
+app.config['OUTBOUND_CONNECT_TIMEOUT'] = float(os.environ.get('OUTBOUND_CONNECT_TIMEOUT', 3.05))
+app.config['OUTBOUND_READ_TIMEOUT'] = float(os.environ.get('OUTBOUND_READ_TIMEOUT', 10))
+app.config['OUTBOUND_MAX_BYTES'] = int(os.environ.get('OUTBOUND_MAX_BYTES', 1024 * 1024))
+app.config['OUTBOUND_POOL_SIZE'] = int(os.environ.get('OUTBOUND_POOL_SIZE', 10))
+app.config['OUTBOUND_BREAKER_THRESHOLD'] = int(os.environ.get('OUTBOUND_BREAKER_THRESHOLD', 5))
+app.config['OUTBOUND_BREAKER_COOLDOWN'] = float(os.environ.get('OUTBOUND_BREAKER_COOLDOWN', 30))
+app.config['ARCHIVE_DIR'] = os.environ.get('ARCHIVE_DIR', os.path.join(app.instance_path, 'archives'))
+app.config['ARCHIVE_GRACE_DAYS'] = int(os.environ.get('ARCHIVE_GRACE_DAYS', 30))
+app.config['ARCHIVE_INTERVAL'] = int(os.environ.get('ARCHIVE_INTERVAL', 24 * 3600))
+app.config['ARCHIVE_BATCH'] = int(os.environ.get('ARCHIVE_BATCH', 10))
+app.config['ARCHIVE_DELETE_CHUNK'] = int(os.environ.get('ARCHIVE_DELETE_CHUNK', 500))
+app.config['BACKUP_ENABLED'] = os.environ.get('BACKUP_ENABLED', 'true').lower() in ['true', 'on', '1']
+app.config['BACKUP_DIR'] = os.environ.get('BACKUP_DIR', os.path.join(app.instance_path, 'backups'))
+app.config['BACKUP_INTERVAL'] = int(os.environ.get('BACKUP_INTERVAL', 24 * 3600))
+app.config['BACKUP_HOURS'] = os.environ.get('BACKUP_HOURS', '2-5')  # UTC hours a scheduled backup may start, '' for any
+app.config['BACKUP_KEEP'] = int(os.environ.get('BACKUP_KEEP', 14))
+app.config['BACKUP_PAGES_PER_STEP'] = int(os.environ.get('BACKUP_PAGES_PER_STEP', 256))
+app.config['BACKUP_STEP_SLEEP'] = float(os.environ.get('BACKUP_STEP_SLEEP', 0.05))
+app.config['LINK_SWEEP_INTERVAL'] = int(os.environ.get('LINK_SWEEP_INTERVAL', 6 * 3600))
+app.config['LINK_SWEEP_MIN_AGE_HOURS'] = int(os.environ.get('LINK_SWEEP_MIN_AGE_HOURS', 72))
+app.config['LINK_SWEEP_BATCH'] = int(os.environ.get('LINK_SWEEP_BATCH', 200))
+app.config['LINK_SWEEP_CONCURRENCY'] = int(os.environ.get('LINK_SWEEP_CONCURRENCY', 10))
+app.config['LINK_SWEEP_PER_HOST'] = int(os.environ.get('LINK_SWEEP_PER_HOST', 2))
+app.config['CHANGE_LOG_RETENTION_DAYS'] = int(os.environ.get('CHANGE_LOG_RETENTION_DAYS', 365))  # 0 keeps events forever
+app.config['CHANGE_EVENT_PRUNE_BATCH'] = int(os.environ.get('CHANGE_EVENT_PRUNE_BATCH', 1000))
+app.config['CHANGE_FEED_BATCH'] = int(os.environ.get('CHANGE_FEED_BATCH', 500))
+app.config['CHANGE_FEED_MAX'] = int(os.environ.get('CHANGE_FEED_MAX', 10000))
+app.config['CHANGE_FEED_MAX_WAIT'] = float(os.environ.get('CHANGE_FEED_MAX_WAIT', 30))  # longest long poll, seconds
+app.config['CHANGE_FEED_POLL_INTERVAL'] = float(os.environ.get('CHANGE_FEED_POLL_INTERVAL', 1))
+app.config['RANK_MAX_LENGTH'] = int(os.environ.get('RANK_MAX_LENGTH', 24))
+app.config['RANK_REBALANCE_INTERVAL'] = int(os.environ.get('RANK_REBALANCE_INTERVAL', 3600))
+app.config['RANK_REBALANCE_BATCH'] = int(os.environ.get('RANK_REBALANCE_BATCH', 100))
+app.config['PRICE_BACKFILL_BATCH'] = int(os.environ.get('PRICE_BACKFILL_BATCH', 500))
+app.config['FAMILY_PAGE_BATCH'] = int(os.environ.get('FAMILY_PAGE_BATCH', 200))  # rows fetched at a time
+app.config['FAMILY_PAGE_FLUSH_BYTES'] = int(os.environ.get('FAMILY_PAGE_FLUSH_BYTES', 4096))
+app.config['PWA_ENABLED'] = os.environ.get('PWA_ENABLED', 'true').lower() in ['true', 'on', '1']
+app.config['PWA_IMAGE_CACHE_ENTRIES'] = int(os.environ.get('PWA_IMAGE_CACHE_ENTRIES', 80))
+app.config['SHARDING_ENABLED'] = os.environ.get('SHARDING_ENABLED', 'false').lower() in ['true', 'on', '1']
+app.config['SHARD_DIRECTORY_URL'] = os.environ.get('SHARD_DIRECTORY_URL', 'sqlite:///' + os.path.join(app.instance_path, 'shards.db'))
+app.config['SHARDS'] = os.environ.get('SHARDS', '')  # name=url,name=url; 'default' is the main database
+app.config['SHARD_CACHE_TTL'] = float(os.environ.get('SHARD_CACHE_TTL', 2))
+
+# Compiled templates are shared between workers and survive restarts
+if app.config['JINJA_CACHE_DIR']:
+    os.makedirs(app.config['JINJA_CACHE_DIR'], exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config['JINJA_CACHE_DIR'])
+
+# Routes child and gift statements to the family's shard when sharding is enabled
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
 mail = Mail(app)
 csrf = CSRFProtect(app)
+profiler = SamplingProfiler(app)
+scheduler = Scheduler(app)
+static_assets = StaticAssets(app)
+compression = ResponseCompression(app)
+# last_login and view counters; see writebehind.py for what a crash can lose
+write_behind = WriteBehindBuffer(app, db, app.config['WRITE_BEHIND_MAX_KEYS'], engines=lambda shard: get_router().engine(shard))
+
+if app.config['FAMILY_CACHE_BACKEND'] == 'sqlite':
+    os.makedirs(os.path.dirname(app.config['FAMILY_CACHE_PATH']), exist_ok=True)
+    family_cache = FamilySnapshotCache(app.config['FAMILY_CACHE_SIZE'], SQLiteCacheBackend(app.config['FAMILY_CACHE_PATH']))
+else:
+    family_cache = FamilySnapshotCache(app.config['FAMILY_CACHE_SIZE'])
+
+# Every external call goes through this client
+outbound_client = OutboundClient(
+    timeout=(app.config['OUTBOUND_CONNECT_TIMEOUT'], app.config['OUTBOUND_READ_TIMEOUT']),
+    max_bytes=app.config['OUTBOUND_MAX_BYTES'],
+    pool_size=app.config['OUTBOUND_POOL_SIZE'],
+    breaker_threshold=app.config['OUTBOUND_BREAKER_THRESHOLD'],
+    breaker_cooldown=app.config['OUTBOUND_BREAKER_COOLDOWN']
+)
+
+link_pool = BackgroundPool(app, app.config['LINK_ENRICHMENT_WORKERS'], app.config['LINK_ENRICHMENT_QUEUE'])
+link_fetcher = MetadataFetcher(
+    outbound_client,
+    min_host_interval=app.config['LINK_FETCH_HOST_INTERVAL'],
+    allow_private=app.config['LINK_FETCH_ALLOW_PRIVATE']
+)
+link_checker = LinkChecker(
+    outbound_client,
+    concurrency=app.config['LINK_SWEEP_CONCURRENCY'],
+    per_host=app.config['LINK_SWEEP_PER_HOST'],
+    allow_private=app.config['LINK_FETCH_ALLOW_PRIVATE']
+)
+image_validator = ImageURLValidator(
+    outbound_client,
+    allow_private=app.config['LINK_FETCH_ALLOW_PRIVATE'],
+    max_workers=app.config['LINK_SWEEP_CONCURRENCY']
+)
+
+def validate_image_url(url):
+    """
+    Validate that a URL points to a legitimate image and is safe to use.
+    Returns (is_valid, error_message)
+    """
+    return image_validator.validate(url)
+
+# Families' children and gifts; everything else stays in the main database
+SHARDED_TABLES = ('child', 'gift')
+
+if app.config['SHARDING_ENABLED']:
+    if app.config['SHARD_DIRECTORY_URL'].startswith('sqlite:///'):
+        os.makedirs(app.instance_path, exist_ok=True)
+    ShardRouter(db, app.config['SHARD_DIRECTORY_URL'], parse_shards(app.config['SHARDS']),
+                SHARDED_TABLES, cache_ttl=app.config['SHARD_CACHE_TTL']).init_app(app)
 
 # Database Models
 class Family(db.Model):
+    # Ids are never handed out again after a purge; cached snapshots and archives are keyed by them
+    __table_args__ = {'sqlite_autoincrement': True}
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     password_hash = db.Column(db.String(255), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_active = db.Column(db.Boolean, default=True)
+    # Set on deactivation; the family is archived and purged ARCHIVE_GRACE_DAYS later
+    deactivated_at = db.Column(db.DateTime)
+    # Bumped on every change to the family's children or gifts
+    data_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     # Relationships
     children = db.relationship('Child', backref='family', lazy=True, cascade='all, delete-orphan')
@@ -150,17 +235,22 @@ class SuperAdmin(db.Model):
         return f'<SuperAdmin {self.email}>'
 
 class Child(db.Model):
+    __table_args__ = {'sqlite_autoincrement': True}
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     age = db.Column(db.Integer)
     family_id = db.Column(db.Integer, db.ForeignKey('family.id'), nullable=False)
-    gifts = db.relationship('Gift', backref='child', lazy=True, cascade='all, delete-orphan')
+    gifts = db.relationship('Gift', backref='child', lazy=True, cascade='all, delete-orphan', order_by='Gift.rank')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     def __repr__(self):
         return f'<Child {self.name}>'
 
 class Gift(db.Model):
+    # A child's list is read in rank order straight from this index, price filters from the second
+    __table_args__ = (db.Index('ix_gift_child_rank', 'child_id', 'rank'),
+                      db.Index('ix_gift_child_price', 'child_id', 'price_min'),
+                      {'sqlite_autoincrement': True})
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text)
@@ -170,20 +260,86 @@ class Gift(db.Model):
     price_range = db.Column(db.String(100))
     is_purchased = db.Column(db.Boolean, default=False)
     purchased_by = db.Column(db.String(100))
+    purchased_at = db.Column(db.DateTime)
     child_id = db.Column(db.Integer, db.ForeignKey('child.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Results of the periodic link sweep: None (not checked yet), 'ok', 'dead' or 'error'
+    link_status = db.Column(db.String(10))
+    link2_status = db.Column(db.String(10))
+    image_status = db.Column(db.String(10))
+    links_checked_at = db.Column(db.DateTime)
+    # Written through write_behind, may lag a few seconds behind
+    view_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Position in the child's list, a fractional key from ranking.py; None until rebalance_ranks ran
+    rank = db.Column(db.String(100))
+    # Parsed from price_range by apply_price; price_range stays what users see
+    price_min = db.Column(db.Float)
+    price_max = db.Column(db.Float)
+    price_currency = db.Column(db.String(3))
 
     def __repr__(self):
         return f'<Gift {self.name}>'
 
 class PasswordResetToken(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    email = db.Column(db.String(120), nullable=False)
-    token = db.Column(db.String(255), nullable=False)
-    expires_at = db.Column(db.DateTime, nullable=False)
+    email = db.Column(db.String(120), nullable=False, index=True)
+    # Only the SHA-256 digest of the emailed token is stored
+    token_hash = db.Column(db.String(64), nullable=False, unique=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
     used = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+class LinkMetadata(db.Model):
+    """Metadata parsed from a shop page, shared by all gifts linking to it"""
+    id = db.Column(db.Integer, primary_key=True)
+    url = db.Column(db.String(500), unique=True, nullable=False)  # canonical URL
+    title = db.Column(db.String(300))
+    image_url = db.Column(db.String(500))
+    price = db.Column(db.String(50))
+    currency = db.Column(db.String(10))
+    status = db.Column(db.String(20), nullable=False, default='ok')
+    fetched_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class GiftActivityDaily(db.Model):
+    """Gift counters per UTC day and family, maintained with every change; family_id 0 is all families"""
+    __table_args__ = (db.UniqueConstraint('day', 'family_id'),)
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    family_id = db.Column(db.Integer, nullable=False)
+    added = db.Column(db.Integer, nullable=False, default=0)
+    purchased = db.Column(db.Integer, nullable=False, default=0)
+    unmarked = db.Column(db.Integer, nullable=False, default=0)
+    deleted = db.Column(db.Integer, nullable=False, default=0)
+
+class ChangeEvent(db.Model):
+    """
+    Append-only log of changes to children and gifts. Ids only grow (SQLite
+    AUTOINCREMENT never reuses them and writers commit one at a time), so
+    consumers keep the last id they processed as their cursor.
+    """
+    __table_args__ = (
+        db.Index('ix_change_event_entity', 'entity', 'entity_id'),
+        {'sqlite_autoincrement': True},
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    family_id = db.Column(db.Integer, nullable=False, index=True)
+    entity = db.Column(db.String(10), nullable=False)  # 'child' or 'gift'
+    entity_id = db.Column(db.Integer, nullable=False)
+    action = db.Column(db.String(10), nullable=False)  # added, edited, deleted, purchased, unmarked
+    actor = db.Column(db.String(120))  # admin email or buyer name
+    data = db.Column(db.Text)  # JSON: changed fields as [old, new], or the removed values
+
+class UrlCheck(db.Model):
+    """Last sweep result for a URL, with the validators for the next conditional request"""
+    id = db.Column(db.Integer, primary_key=True)
+    url = db.Column(db.String(500), unique=True, nullable=False)
+    status = db.Column(db.String(10), nullable=False)
+    http_status = db.Column(db.Integer)
+    etag = db.Column(db.String(200))
+    last_modified = db.Column(db.String(100))
+    checked_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
 # Forms
 class FamilyLoginForm(FlaskForm):
     password = PasswordField('Rodinné heslo', validators=[DataRequired()])
@@ -240,6 +396,12 @@ class AdminUserForm(FlaskForm):
     password = PasswordField('Heslo', validators=[Length(min=6)])
     submit = SubmitField('Uložiť')
 
+class ProfilerSettingsForm(FlaskForm):
+    sample_rate = FloatField('Podiel profilovaných požiadaviek (0 - 1)', default=0.0, validators=[NumberRange(min=0, max=1)])
+    endpoint = StringField('Len pre endpoint (voliteľné)', validators=[Optional(), Length(max=100)])
+    minutes = IntegerField('Trvanie v minútach', default=10, validators=[NumberRange(min=1, max=240)])
+    submit = SubmitField('Uložiť')
+
 # Utility functions
 def hash_password(password):
     return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
@@ -250,10 +412,37 @@ def check_password(password, password_hash):
 def generate_reset_token():
     return secrets.token_urlsafe(32)
 
+def hash_reset_token(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+def prune_reset_tokens(batch_size=None):
+    """Delete used and expired reset tokens in batches, returns the number removed"""
+    batch_size = batch_size or app.config['RESET_TOKEN_PRUNE_BATCH']
+    removed = 0
+    while True:
+        ids = [row[0] for row in db.session.query(PasswordResetToken.id).filter(
+            db.or_(PasswordResetToken.used == True, PasswordResetToken.expires_at < datetime.utcnow())
+        ).limit(batch_size).all()]
+        if not ids:
+            break
+        PasswordResetToken.query.filter(PasswordResetToken.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        removed += len(ids)
+        if len(ids) < batch_size:
+            break
+    return removed
+
+def revoke_reset_token(token):
+    """Mark a reset token used, for links whose e-mail never went out"""
+    with app.app_context():
+        PasswordResetToken.query.filter_by(token_hash=hash_reset_token(token)).update({'used': True})
+        db.session.commit()
+
+EMAIL_QUEUED = 'queued'
+
 def send_reset_email(email, token, user_type='admin'):
+    """True once Brevo accepted the e-mail, EMAIL_QUEUED when it is sent in the background, else False"""
     try:
-        import requests
-        
         reset_url = f"{request.url_root}reset-password/{token}"
         
         # Brevo API configuration
@@ -320,8 +509,17 @@ Tím Rodinného Zoznamu Darčekov
             """
         }
         
+        # Under asgi.py the event loop sends it and no worker thread waits for Brevo.
+        # The outcome is not known yet; a failed send revokes the link so asking again is not throttled
+        async_outbound = app.extensions.get('async_outbound')
+        if async_outbound is not None:
+            async_outbound.post_in_background(
+                url, expected_status=201, on_failure=lambda: revoke_reset_token(token), headers=headers, json=data
+            )
+            return EMAIL_QUEUED
+        
         # Send request
-        response = requests.post(url, headers=headers, json=data)
+        response = outbound_client.post(url, headers=headers, json=data)
         
         if response.status_code == 201:
             return True
@@ -333,6 +531,750 @@ Tím Rodinného Zoznamu Darčekov
         print(f"Error sending email: {e}")
         return False
 
+# Family snapshots
+def touch_family(family_id):
+    """Mark a family's lists as changed; call before committing the change"""
+    family_table = Family.__table__
+    db.session.execute(
+        family_table.update()
+        .where(family_table.c.id == family_id)
+        .values(data_version=family_table.c.data_version + 1)
+    )
+    family_cache.invalidate(family_id)
+
+# Read path for the list pages: Core selects of only the columns a page shows,
+# returned as namedtuples, which have no per-row __dict__, identity map entry
+# or change tracking. bench_read_path.py compares it with loading ORM objects.
+ChildRow = namedtuple('ChildRow', ['id', 'name'])
+AdminGiftRow = namedtuple('AdminGiftRow', [
+    'id', 'name', 'description', 'image_url', 'image_status', 'is_purchased', 'purchased_by', 'view_count',
+])
+# The admin list shows the first 50 characters of a description and whether there are more
+ADMIN_DESCRIPTION_LENGTH = 51
+
+def gift_columns(fields, **expressions):
+    """Gift columns named like `fields`, in order, with `expressions` standing in for some of them"""
+    table = Gift.__table__
+    # Rows from before is_purchased had a default hold NULL
+    expressions.setdefault('is_purchased', db.type_coerce(db.func.coalesce(table.c.is_purchased, False), db.Boolean))
+    return [expressions[field].label(field) if field in expressions else table.c[field] for field in fields]
+
+def build_family_snapshot(family_id):
+    """Children ordered by name, each with gifts available first, as plain tuples"""
+    child_table, gift_table = Child.__table__, Gift.__table__
+    children = db.session.execute(
+        db.select(child_table.c.id, child_table.c.name, child_table.c.age)
+        .where(child_table.c.family_id == family_id).order_by(child_table.c.name)
+    ).all()
+    gifts = db.session.execute(
+        db.select(*gift_columns(GiftSnapshot._fields))
+        .join(child_table, child_table.c.id == gift_table.c.child_id)
+        .where(child_table.c.family_id == family_id)
+        .order_by(gift_table.c.is_purchased, gift_table.c.rank, gift_table.c.created_at)
+    )
+    
+    gifts_by_child = {}
+    for row in gifts:
+        gifts_by_child.setdefault(row.child_id, []).append(GiftSnapshot._make(row))
+    return tuple(
+        ChildSnapshot(child_id, name, age, tuple(gifts_by_child.get(child_id, ())))
+        for child_id, name, age in children
+    )
+
+def get_family_snapshot(family_id):
+    """Cached snapshot of a family; a hit costs one primary key lookup and no ORM work"""
+    family_table = Family.__table__
+    version = db.session.execute(
+        db.select(family_table.c.data_version).where(family_table.c.id == family_id)
+    ).scalar()
+    if version is None:
+        return ()
+    return family_cache.get(family_id, version, lambda: build_family_snapshot(family_id))
+
+def iter_family_children(family_id):
+    """
+    Children of a family with their gifts, in snapshot order, from one ordered
+    join read in batches; each child is yielded as soon as its rows are in
+    """
+    child_table, gift_table = Child.__table__, Gift.__table__
+    rows = db.session.execute(
+        db.select(
+            child_table.c.id, child_table.c.name, child_table.c.age,
+            # The page shows neither descriptions nor second links
+            *gift_columns(GiftSnapshot._fields, description=db.null(), link2=db.null())
+        ).select_from(child_table.outerjoin(gift_table, gift_table.c.child_id == child_table.c.id))
+        .where(child_table.c.family_id == family_id)
+        .order_by(child_table.c.name, child_table.c.id, gift_table.c.is_purchased, gift_table.c.rank,
+                  gift_table.c.created_at)
+        .execution_options(yield_per=app.config['FAMILY_PAGE_BATCH'])
+    )
+    for (child_id, name, age), group in groupby(rows, key=lambda row: tuple(row[:3])):
+        # Children without gifts come back as one row of NULL gift columns
+        gifts = tuple(GiftSnapshot._make(row[3:]) for row in group if row[3] is not None)
+        yield ChildSnapshot(child_id, name, age, gifts)
+
+def buffered_stream(chunks, size):
+    """Join template chunks until `size` bytes are collected, so each flush carries a useful amount of HTML"""
+    buffer, length = [], 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield ''.join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+# Gift activity rollups
+ACTIVITY_COLUMNS = ('added', 'purchased', 'unmarked', 'deleted')
+
+def record_gift_activity(family_id, column, count=1, day=None):
+    """Add to today's counters of a family and of all families; call before committing the change"""
+    if count <= 0:
+        return
+    table = GiftActivityDaily.__table__
+    day = day or datetime.utcnow().date()
+    rows = [dict({c: 0 for c in ACTIVITY_COLUMNS}, day=day, family_id=key, **{column: count})
+            for key in (family_id, 0)]
+    
+    dialect = db.engine.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        statement = insert(table).values(rows)
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=[table.c.day, table.c.family_id],
+            set_={column: table.c[column] + statement.excluded[column]}
+        ))
+        return
+    
+    for row in rows:
+        updated = db.session.execute(
+            table.update()
+            .where(table.c.day == day, table.c.family_id == row['family_id'])
+            .values({column: table.c[column] + count})
+        ).rowcount
+        if not updated:
+            db.session.execute(table.insert().values(row))
+
+def rebuild_gift_activity():
+    """Recount added and purchased per day from the gifts that still exist"""
+    table = GiftActivityDaily.__table__
+    db.session.execute(table.delete())
+    for _ in for_each_shard(db):
+        for column, timestamp in (('added', Gift.created_at), ('purchased', Gift.purchased_at)):
+            day = db.func.date(timestamp)
+            counts = db.session.query(day, Child.family_id, db.func.count(Gift.id)).join(Child).filter(
+                timestamp.isnot(None)
+            ).group_by(day, Child.family_id).all()
+            for day_value, family_id, count in counts:
+                day_value = day_value if not isinstance(day_value, str) else datetime.strptime(day_value, '%Y-%m-%d').date()
+                record_gift_activity(family_id, column, count, day=day_value)
+    db.session.commit()
+
+def gift_activity(family_id=0, days=30):
+    """Daily counters for the last `days` days, with missing days filled with zeros"""
+    end = datetime.utcnow().date()
+    start = end - timedelta(days=days - 1)
+    rows = {row.day: row for row in GiftActivityDaily.query.filter(
+        GiftActivityDaily.family_id == family_id,
+        GiftActivityDaily.day >= start
+    )}
+    result = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        row = rows.get(day)
+        result.append(dict({c: getattr(row, c) if row else 0 for c in ACTIVITY_COLUMNS}, day=day))
+    return result
+
+# Change log
+def record_change(family_id, target, action, actor=None, data=None):
+    """
+    Log a change to a Child or Gift, given as the object or as (table name, id);
+    the events are inserted in one batch when the session commits
+    """
+    db.session.info.setdefault('change_events', []).append((family_id, target, action, actor, data))
+
+def changed_fields(obj, values):
+    """{field: [old, new]} for the values that differ from obj's current ones"""
+    return {field: [getattr(obj, field), value] for field, value in values.items() if getattr(obj, field) != value}
+
+@event.listens_for(db.session, 'before_commit')
+def write_change_events(db_session):
+    events = db_session.info.pop('change_events', None)
+    if not events:
+        return
+    db_session.flush()  # ids of rows added in this transaction
+    now = datetime.utcnow()
+    rows = []
+    for family_id, target, action, actor, data in events:
+        entity, entity_id = target if isinstance(target, tuple) else (target.__tablename__, target.id)
+        rows.append({
+            'created_at': now,
+            'family_id': family_id,
+            'entity': entity,
+            'entity_id': entity_id,
+            'action': action,
+            'actor': (actor or '')[:120] or None,
+            'data': json.dumps(data, ensure_ascii=False, default=str) if data else None,
+        })
+    db_session.execute(ChangeEvent.__table__.insert(), rows)
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def discard_change_events(db_session, previous_transaction):
+    db_session.info.pop('change_events', None)
+
+def change_to_dict(row):
+    return {
+        'id': row.id, 'created_at': row.created_at.isoformat(), 'family_id': row.family_id,
+        'entity': row.entity, 'entity_id': row.entity_id, 'action': row.action,
+        'actor': row.actor, 'data': json.loads(row.data) if row.data else None,
+    }
+
+def change_feed_args(args):
+    """(after, family, limit, wait) of a change feed request, clamped to the configured maximums"""
+    limit = args.get('limit', app.config['CHANGE_FEED_MAX'], type=int)
+    wait = args.get('wait', 0, type=float)
+    return (args.get('after', 0, type=int), args.get('family', type=int),
+            min(max(limit, 1), app.config['CHANGE_FEED_MAX']), min(max(wait, 0), app.config['CHANGE_FEED_MAX_WAIT']))
+
+def change_batch(after, family_id=None, limit=None):
+    """Up to `limit` change events with an id above `after`, oldest first, as dicts"""
+    table = ChangeEvent.__table__
+    query = db.select(table).where(table.c.id > after)
+    if family_id is not None:
+        query = query.where(table.c.family_id == family_id)
+    rows = db.session.execute(query.order_by(table.c.id).limit(limit or app.config['CHANGE_FEED_BATCH']))
+    return [change_to_dict(row) for row in rows]
+
+def gift_history(family_id, gift_id, limit=20):
+    """Newest change events of a family's gift; gift ids repeat across shards, so the family is part of the key"""
+    return ChangeEvent.query.filter_by(family_id=family_id, entity='gift', entity_id=gift_id).order_by(
+        ChangeEvent.id.desc()
+    ).limit(limit).all()
+
+def remap_change_events(family_id, new_ids):
+    """Point a family's events at new row ids, given as {entity: {old id: new id}}, after a move to another shard"""
+    table = ChangeEvent.__table__
+    for entity, ids in new_ids.items():
+        if ids:
+            # One statement per entity: an old id may be another row's new id
+            db.session.execute(table.update().where(
+                table.c.family_id == family_id, table.c.entity == entity, table.c.entity_id.in_(list(ids))
+            ).values(entity_id=db.case(ids, value=table.c.entity_id)))
+
+def prune_change_events(batch_size=None):
+    """Delete events older than CHANGE_LOG_RETENTION_DAYS in batches, returns the number removed"""
+    if not app.config['CHANGE_LOG_RETENTION_DAYS']:
+        return 0
+    batch_size = batch_size or app.config['CHANGE_EVENT_PRUNE_BATCH']
+    cutoff = datetime.utcnow() - timedelta(days=app.config['CHANGE_LOG_RETENTION_DAYS'])
+    table = ChangeEvent.__table__
+    removed = 0
+    while True:
+        # Oldest first, so the newest id (the consumers' cursor) is never removed early
+        ids = db.session.execute(
+            db.select(table.c.id).where(table.c.created_at < cutoff).order_by(table.c.id).limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            return removed
+        db.session.execute(table.delete().where(table.c.id.in_(ids)))
+        db.session.commit()
+        removed += len(ids)
+
+# Gift ranking
+def list_order(table):
+    """Order of a child's gifts as the admin arranged them; unranked gifts from before ranking come first"""
+    return (table.c.rank.nulls_first(), table.c.created_at, table.c.id)
+
+def last_rank(child_id):
+    """Highest rank in a child's list, read from the end of the (child_id, rank) index"""
+    return db.session.execute(
+        db.select(db.func.max(Gift.__table__.c.rank)).where(Gift.__table__.c.child_id == child_id)
+    ).scalar()
+
+def rebalance_child_ranks(child_id):
+    """Give a child's gifts short, evenly spaced ranks in their current order"""
+    table = Gift.__table__
+    ids = db.session.execute(
+        db.select(table.c.id).where(table.c.child_id == child_id).order_by(*list_order(table))
+    ).scalars().all()
+    if ids:
+        db.session.execute(table.update().where(table.c.id == db.bindparam('gift_id')).values(rank=db.bindparam('new_rank')),
+                           [{'gift_id': gift_id, 'new_rank': rank} for gift_id, rank in zip(ids, spread(len(ids)))])
+    return len(ids)
+
+def rebalance_ranks(batch_size=None):
+    """Rebalance lists with unranked gifts or keys longer than RANK_MAX_LENGTH, one short transaction per child"""
+    batch_size = batch_size or app.config['RANK_REBALANCE_BATCH']
+    table = Gift.__table__
+    rebalanced = 0
+    for _ in for_each_shard(db):
+        while True:
+            child_ids = db.session.execute(
+                db.select(table.c.child_id).where(
+                    db.or_(table.c.rank.is_(None), db.func.length(table.c.rank) > app.config['RANK_MAX_LENGTH'])
+                ).distinct().limit(batch_size)
+            ).scalars().all()
+            for child_id in child_ids:
+                rebalance_child_ranks(child_id)
+                db.session.commit()
+            rebalanced += len(child_ids)
+            if len(child_ids) < batch_size:
+                break
+    return rebalanced
+
+def appended_rank(child_id, gift_ids):
+    """
+    SQL rank that places `gift_ids` after the end of a child's list in the
+    given order, each with a key of its own
+    """
+    ranks, rank = {}, last_rank(child_id)
+    for gift_id in gift_ids:
+        rank = ranks[gift_id] = key_between(rank, None)
+    return db.case(ranks, value=Gift.__table__.c.id) if ranks else db.null()
+
+# Structured prices
+def apply_price(gift):
+    """Set a gift's price columns from its price_range text"""
+    gift.price_min, gift.price_max, gift.price_currency = parse_price(gift.price_range)
+
+def backfill_prices(batch_size=None):
+    """Parse the price text of gifts without price columns, in keyset batches by id; returns the number parsed"""
+    batch_size = batch_size or app.config['PRICE_BACKFILL_BATCH']
+    table = Gift.__table__
+    update = table.update().where(table.c.id == db.bindparam('gift_id')).values(
+        price_min=db.bindparam('low'), price_max=db.bindparam('high'), price_currency=db.bindparam('currency'))
+    parsed = 0
+    for _ in for_each_shard(db):
+        last_id = 0
+        while True:
+            rows = db.session.execute(
+                db.select(table.c.id, table.c.price_range).where(
+                    table.c.id > last_id, table.c.price_min.is_(None), table.c.price_max.is_(None),
+                    table.c.price_range.is_not(None), table.c.price_range != ''
+                ).order_by(table.c.id).limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            values = [dict(zip(('low', 'high', 'currency'), parse_price(row.price_range)), gift_id=row.id)
+                      for row in rows]
+            values = [row for row in values if row['low'] is not None]
+            if values:
+                db.session.execute(update, values)
+            db.session.commit()
+            parsed += len(values)
+    return parsed
+
+PRICE_SORTS = ('price', 'price_desc')
+
+def price_filters():
+    """Gift list filters from the query string; empty values mean no filter"""
+    sort = request.args.get('sort', '')
+    return {
+        'max_price': request.args.get('max_price', type=float),
+        'available': request.args.get('available') == '1',
+        'sort': sort if sort in PRICE_SORTS else '',
+    }
+
+def filtered_gifts(child_id, columns, max_price=None, available=False, sort=''):
+    """Select of `columns` for a child's gifts narrowed by the filters, in rank or price order"""
+    table = Gift.__table__
+    query = db.select(*columns).where(table.c.child_id == child_id)
+    if max_price is not None:
+        # Served by the (child_id, price_min) index; gifts without a parsed price drop out
+        query = query.where(table.c.price_min <= max_price)
+    if available:
+        query = query.where(table.c.is_purchased.is_not(True))
+    if sort == 'price':
+        return query.order_by(table.c.price_min.nulls_last(), table.c.rank)
+    if sort == 'price_desc':
+        return query.order_by(db.func.coalesce(table.c.price_max, table.c.price_min).desc().nulls_last(), table.c.rank)
+    return query.order_by(table.c.rank)
+
+# Bulk gift operations
+BULK_ACTIONS = ('delete', 'unmark', 'move', 'copy', 'duplicate')
+
+# Copied gifts start over as new, unpurchased and unviewed
+COPIED_GIFT_COLUMNS = ('name', 'description', 'link', 'link2', 'image_url', 'price_range',
+                       'price_min', 'price_max', 'price_currency',
+                       'link_status', 'link2_status', 'image_status', 'links_checked_at')
+
+def copy_gifts(source_child_id, target_child_id, gift_ids=None):
+    """
+    Copy a child's gifts (all, or `gift_ids` in list order) to the end of
+    another child's list with one INSERT ... SELECT; returns the new ids
+    """
+    table = Gift.__table__
+    selected = table.c.child_id == source_child_id
+    if gift_ids is None:
+        gift_ids = db.session.execute(db.select(table.c.id).where(selected).order_by(*list_order(table))).scalars().all()
+    source = db.select(
+        *(table.c[column] for column in COPIED_GIFT_COLUMNS),
+        db.literal(target_child_id), db.literal(datetime.utcnow(), db.DateTime), db.literal(False, db.Boolean),
+        appended_rank(target_child_id, gift_ids)
+    ).where(selected, table.c.id.in_(gift_ids)).order_by(table.c.id)
+    statement = table.insert().from_select(
+        list(COPIED_GIFT_COLUMNS) + ['child_id', 'created_at', 'is_purchased', 'rank'], source)
+    
+    if db.engine.dialect.insert_returning:
+        return list(db.session.execute(statement.returning(table.c.id)).scalars())
+    before = db.session.execute(db.select(db.func.max(table.c.id))).scalar() or 0
+    db.session.execute(statement)
+    return list(db.session.execute(
+        db.select(table.c.id).where(table.c.child_id == target_child_id, table.c.id > before)
+    ).scalars())
+
+# Link enrichment
+CURRENCY_SYMBOLS = {'EUR': '€', 'USD': '$', 'GBP': '£', 'CZK': 'Kč'}
+
+def get_link_metadata(url):
+    """Metadata for a link, fetched at most once per LINK_METADATA_TTL_HOURS for all gifts"""
+    key = canonical_url(url)[:500]
+    entry = LinkMetadata.query.filter_by(url=key).first()
+    fresh_after = datetime.utcnow() - timedelta(hours=app.config['LINK_METADATA_TTL_HOURS'])
+    if entry and entry.fetched_at > fresh_after:
+        return entry
+    
+    if entry is None:
+        entry = LinkMetadata(url=key)
+        db.session.add(entry)
+    try:
+        data = link_fetcher.fetch(url)
+        entry.title = (data['title'] or '')[:300] or None
+        entry.image_url = (data['image'] or '')[:500] or None
+        entry.price = (data['price'] or '')[:50] or None
+        entry.currency = (data['currency'] or '')[:10] or None
+        entry.status = 'ok'
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"Could not fetch link metadata for {url}: {e}")
+        entry.status = 'error'
+    entry.fetched_at = datetime.utcnow()
+    
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another worker fetched the same page at the same time
+        db.session.rollback()
+        entry = LinkMetadata.query.filter_by(url=key).first()
+    return entry
+
+def enrich_gift_links(gift_id, family_id=None):
+    """Fill a gift's empty image and price from its shop links (runs in the background)"""
+    with use_family(family_id):
+        gift = db.session.get(Gift, gift_id)
+        if gift is None:
+            return
+        entries = [get_link_metadata(link) for link in (gift.link, gift.link2) if link]
+        
+        gift = db.session.get(Gift, gift_id)
+        if gift is None:
+            return
+        updated = False
+        entries = [entry for entry in entries if entry is not None and entry.status == 'ok']
+        if not gift.image_url:
+            # The first candidate that validates wins; both links' images are checked together
+            candidates = [entry.image_url for entry in entries if entry.image_url]
+            results = image_validator.validate_many(candidates)
+            image_url = next((url for url in candidates if results[url][0]), None)
+            if image_url:
+                gift.image_url = image_url
+                updated = True
+        for entry in entries:
+            if not gift.price_range and entry.price:
+                currency = CURRENCY_SYMBOLS.get((entry.currency or '').upper(), entry.currency or '')
+                gift.price_range = f"{entry.price} {currency}".strip()
+                apply_price(gift)
+                updated = True
+        if updated:
+            touch_family(gift.child.family_id)
+            db.session.commit()
+
+def enqueue_link_enrichment(gift):
+    """Enrich a gift's links in the background once the current transaction commits"""
+    if app.config['LINK_ENRICHMENT_ENABLED'] and (gift.link or gift.link2):
+        if gift.id is None:
+            db.session.flush()
+        # The family tells the background job which shard the gift is on
+        db.session.info.setdefault('enrich_gifts', set()).add((gift.id, session.get('family_id')))
+
+@event.listens_for(db.session, 'after_commit')
+def submit_link_enrichment(db_session):
+    for gift_id, family_id in db_session.info.pop('enrich_gifts', ()):
+        link_pool.submit(enrich_gift_links, gift_id, family_id)
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def discard_link_enrichment(db_session, previous_transaction):
+    db_session.info.pop('enrich_gifts', None)
+
+def link_suggestions(gift):
+    """Already fetched metadata for a gift's links, for the edit form"""
+    urls = [canonical_url(link)[:500] for link in (gift.link, gift.link2) if link]
+    if not urls:
+        return []
+    return LinkMetadata.query.filter(LinkMetadata.url.in_(urls), LinkMetadata.status == 'ok').all()
+
+# Link sweep
+def sweep_links(batch_size=None):
+    """Re-check stored links and remote images of gifts not checked for LINK_SWEEP_MIN_AGE_HOURS"""
+    batch_size = batch_size or app.config['LINK_SWEEP_BATCH']
+    stale_before = datetime.utcnow() - timedelta(hours=app.config['LINK_SWEEP_MIN_AGE_HOURS'])
+    checked = 0
+    for _ in for_each_shard(db):
+        last_id = 0
+        while True:
+            # Keyset batches keep each transaction short however many gifts there are
+            rows = db.session.query(Gift, Child.family_id).join(Child).filter(
+                Gift.id > last_id,
+                db.or_(Gift.links_checked_at.is_(None), Gift.links_checked_at < stale_before)
+            ).order_by(Gift.id).limit(batch_size).all()
+            if not rows:
+                break
+            last_id = rows[-1][0].id
+            
+            urls = set()
+            for gift, family_id in rows:
+                urls.update(url for url in (gift.link, gift.link2, gift.image_url)
+                            if url and url.startswith(('http://', 'https://')))
+            known = {check.url: check for check in UrlCheck.query.filter(UrlCheck.url.in_(urls))} if urls else {}
+            
+            # A URL shared by several gifts is requested once per sweep
+            pending = [url for url in urls if url not in known or known[url].checked_at < stale_before]
+            items = [(url, known[url].etag, known[url].last_modified) if url in known else (url, None, None)
+                     for url in pending]
+            now = datetime.utcnow()
+            for result in link_checker.check_all(items):
+                check = known.get(result.url)
+                if check is None:
+                    check = known[result.url] = UrlCheck(url=result.url)
+                    db.session.add(check)
+                check.status = result.status
+                check.http_status = result.http_status
+                check.etag = (result.etag or '')[:200] or None
+                check.last_modified = (result.last_modified or '')[:100] or None
+                check.checked_at = now
+            
+            # Images that no longer pass validation are hidden like dead ones, without a request
+            images = image_validator.validate_many(
+                [gift.image_url for gift, _ in rows if gift.image_url], probe=False)
+            
+            changed_families = set()
+            for gift, family_id in rows:
+                statuses = tuple(known[url].status if url in known else None
+                                 for url in (gift.link, gift.link2, gift.image_url))
+                if gift.image_url and not images[gift.image_url][0]:
+                    statuses = statuses[:2] + (DEAD,)
+                if statuses != (gift.link_status, gift.link2_status, gift.image_status):
+                    gift.link_status, gift.link2_status, gift.image_status = statuses
+                    changed_families.add(family_id)
+                gift.links_checked_at = now
+            for family_id in changed_families:
+                touch_family(family_id)
+            db.session.commit()
+            checked += len(rows)
+    return checked
+
+def reset_link_status(gift):
+    """Forget sweep results after a gift's links or image were edited"""
+    gift.link_status = gift.link2_status = gift.image_status = None
+    gift.links_checked_at = None
+
+# Family archival
+UPLOAD_URL_PREFIX = '/static/uploads/'
+
+def family_rows(family_id):
+    """Serialized rows of everything that belongs to a family, by table name, parents first"""
+    def rows(model, criterion):
+        table = model.__table__
+        result = db.session.execute(db.select(table).where(criterion).order_by(table.c.id)).mappings()
+        return [serialize_row(table, row) for row in result]
+    
+    child_ids = db.select(Child.__table__.c.id).where(Child.__table__.c.family_id == family_id)
+    return {
+        'family': rows(Family, Family.__table__.c.id == family_id),
+        'child': rows(Child, Child.__table__.c.family_id == family_id),
+        'gift': rows(Gift, Gift.__table__.c.child_id.in_(child_ids)),
+        'admin_user': rows(AdminUser, AdminUser.__table__.c.family_id == family_id),
+        'gift_activity_daily': rows(GiftActivityDaily, GiftActivityDaily.__table__.c.family_id == family_id),
+    }
+
+def upload_path(image_url):
+    return os.path.join(app.static_folder, 'uploads', os.path.basename(image_url))
+
+def purge_family(family_id, chunk_size=None):
+    """Delete a family's rows in short transactions, its family row last"""
+    chunk_size = chunk_size or app.config['ARCHIVE_DELETE_CHUNK']
+    gift_table, child_table = Gift.__table__, Child.__table__
+    child_ids = db.select(child_table.c.id).where(child_table.c.family_id == family_id)
+    
+    uploads = set()
+    while True:
+        chunk = db.session.execute(
+            db.select(gift_table.c.id, gift_table.c.image_url)
+            .where(gift_table.c.child_id.in_(child_ids)).limit(chunk_size)
+        ).all()
+        if not chunk:
+            break
+        uploads.update(url for _, url in chunk if url and url.startswith(UPLOAD_URL_PREFIX))
+        db.session.execute(gift_table.delete().where(gift_table.c.id.in_([gift_id for gift_id, _ in chunk])))
+        db.session.commit()
+    
+    emails = db.select(AdminUser.__table__.c.email).where(AdminUser.__table__.c.family_id == family_id)
+    db.session.execute(PasswordResetToken.__table__.delete().where(PasswordResetToken.__table__.c.email.in_(emails)))
+    for model in (Child, AdminUser, GiftActivityDaily, ChangeEvent):
+        db.session.execute(model.__table__.delete().where(model.__table__.c.family_id == family_id))
+    db.session.execute(Family.__table__.delete().where(Family.__table__.c.id == family_id))
+    db.session.commit()
+    # Other workers read the shared backend too; their own entries can't be reached without the id
+    family_cache.forget(family_id)
+    if get_router():
+        get_router().set(family_id, DEFAULT_SHARD)  # drops the directory entry
+    
+    # Uploaded files are only removed when no remaining gift uses them
+    still_used = {url for (url,) in db.session.query(Gift.image_url).filter(Gift.image_url.in_(uploads))} if uploads else set()
+    for url in uploads - still_used:
+        try:
+            os.remove(upload_path(url))
+        except OSError:
+            pass
+
+def interrupted_archive(family_id, family):
+    """
+    Archive that an interrupted run wrote for this very family, or None.
+    Family ids are reused after a purge, so the manifest must name the family
+    and its creation time; archives of an earlier family with the id never match
+    """
+    for path in sorted(glob.glob(os.path.join(app.config['ARCHIVE_DIR'], f'family-{family_id}-*.tar.gz'))):
+        try:
+            manifest, _ = read_archive(path)
+        except (OSError, ValueError, KeyError, tarfile.TarError):
+            continue
+        if (manifest.get('family_id'), manifest.get('family_name'), manifest.get('family_created_at')) == (
+                family_id, family['name'], family['created_at']):
+            return path
+    return None
+
+def archive_family(family_id):
+    """Export a family with its uploads to ARCHIVE_DIR, verify the archive, then purge the family"""
+    with use_family(family_id):
+        tables = family_rows(family_id)
+        if not tables['family']:
+            return None
+        family = tables['family'][0]
+        # An earlier run may have written the archive and been interrupted while purging
+        path = interrupted_archive(family_id, family)
+        if path is None:
+            uploads = sorted({gift['image_url'] for gift in tables['gift']
+                              if gift['image_url'] and gift['image_url'].startswith(UPLOAD_URL_PREFIX)})
+            path = os.path.join(app.config['ARCHIVE_DIR'],
+                                f"family-{family_id}-{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}-{secrets.token_hex(4)}.tar.gz")
+            write_archive(path, {'family_id': family_id, 'family_name': family['name'],
+                                 'family_created_at': family['created_at']}, tables,
+                          [(os.path.basename(url), upload_path(url)) for url in uploads])
+            read_archive(path)
+        purge_family(family_id)
+    return path
+
+def archive_deactivated_families(limit=None):
+    """Archive families deactivated more than ARCHIVE_GRACE_DAYS ago, oldest first"""
+    now = datetime.utcnow()
+    # Families deactivated before deactivated_at existed start their grace period now
+    Family.query.filter(Family.is_active.is_(False), Family.deactivated_at.is_(None)).update(
+        {'deactivated_at': now}, synchronize_session=False
+    )
+    db.session.commit()
+    
+    cutoff = now - timedelta(days=app.config['ARCHIVE_GRACE_DAYS'])
+    family_ids = [family_id for (family_id,) in db.session.query(Family.id).filter(
+        Family.is_active.is_(False), Family.deactivated_at < cutoff
+    ).order_by(Family.deactivated_at).limit(limit or app.config['ARCHIVE_BATCH'])]
+    return [archive_family(family_id) for family_id in family_ids]
+
+def restore_family(path):
+    """Re-import an archived family as a new, active family; returns its id"""
+    manifest, tables = read_archive(path)
+    family_table = Family.__table__
+    family = deserialize_row(family_table, tables['family'][0])
+    family.pop('id')
+    family.update(is_active=True, deactivated_at=None)
+    
+    try:
+        # Ids may have been reused since, so every row gets a new one
+        family_id = db.session.execute(family_table.insert().values(family)).inserted_primary_key[0]
+        if get_router():
+            get_router().assign(family_id)
+        with use_family(family_id):
+            child_ids = {}
+            for data in tables.get('child', []):
+                child = deserialize_row(Child.__table__, data)
+                old_id = child.pop('id')
+                child['family_id'] = family_id
+                child_ids[old_id] = db.session.execute(Child.__table__.insert().values(child)).inserted_primary_key[0]
+            
+            related = (
+                (Gift, 'gift', lambda row: row.update(child_id=child_ids[row['child_id']])),
+                (AdminUser, 'admin_user', lambda row: row.update(family_id=family_id)),
+                (GiftActivityDaily, 'gift_activity_daily', lambda row: row.update(family_id=family_id)),
+            )
+            for model, name, remap in related:
+                rows = []
+                for data in tables.get(name, []):
+                    row = deserialize_row(model.__table__, data)
+                    row.pop('id')
+                    remap(row)
+                    rows.append(row)
+                if rows:
+                    db.session.execute(model.__table__.insert(), rows)
+        db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        if get_router():
+            get_router().set(family_id, DEFAULT_SHARD)
+        raise ValueError(f'Family {manifest["family_name"]} conflicts with existing data (admin email taken?): {e.orig}')
+    
+    upload_dir = os.path.join(app.static_folder, 'uploads')
+    os.makedirs(upload_dir, exist_ok=True)
+    extract_files(path, upload_dir)
+    return family_id
+
+# Backups
+def database_path():
+    """Filesystem path of the SQLite database, None for other databases"""
+    url = db.engine.url
+    if url.get_backend_name() != 'sqlite' or url.database in (None, '', ':memory:'):
+        return None
+    return url.database
+
+def backup_database():
+    """Snapshot the database into BACKUP_DIR"""
+    path = database_path()
+    if path is None:
+        raise ValueError('Online backups are only supported for SQLite databases')
+    return create_backup(path, app.config['BACKUP_DIR'], pages=app.config['BACKUP_PAGES_PER_STEP'],
+                         sleep=app.config['BACKUP_STEP_SLEEP'], keep=app.config['BACKUP_KEEP'])
+
+def in_backup_window(hour):
+    window = app.config['BACKUP_HOURS'].strip()
+    if not window:
+        return True
+    start, _, end = window.partition('-')
+    start, end = int(start), int(end or start)
+    return start <= hour <= end if start <= end else hour >= start or hour <= end
+
+def backup_due(now=None):
+    """True inside the backup window when the newest snapshot is older than BACKUP_INTERVAL"""
+    now = now or datetime.utcnow()
+    if not in_backup_window(now.hour):
+        return False
+    backups = list_backups(app.config['BACKUP_DIR'])
+    if not backups:
+        return True
+    newest = datetime.utcfromtimestamp(os.path.getmtime(backups[0]))
+    return (now - newest).total_seconds() >= app.config['BACKUP_INTERVAL'] - 60
+
 # Authentication decorators
 def require_family_auth(f):
     def decorated_function(*args, **kwargs):
@@ -358,9 +1300,96 @@ def require_superadmin_auth(f):
     decorated_function.__name__ = f.__name__
     return decorated_function
 
+# Columns added after the first release: (table, column, DDL type)
+ADDED_COLUMNS = [
+    ('family', 'data_version', 'INTEGER NOT NULL DEFAULT 0'),
+    ('family', 'deactivated_at', 'DATETIME'),
+    ('gift', 'link_status', 'VARCHAR(10)'),
+    ('gift', 'link2_status', 'VARCHAR(10)'),
+    ('gift', 'image_status', 'VARCHAR(10)'),
+    ('gift', 'links_checked_at', 'DATETIME'),
+    ('gift', 'view_count', 'INTEGER NOT NULL DEFAULT 0'),
+    ('gift', 'purchased_at', 'DATETIME'),
+    ('gift', 'rank', 'VARCHAR(100)'),
+    ('gift', 'price_min', 'FLOAT'),
+    ('gift', 'price_max', 'FLOAT'),
+    ('gift', 'price_currency', 'VARCHAR(3)'),
+]
+
+# Tables whose ids must never be reused, so a purged family's cache entries and history can't resurface
+AUTOINCREMENT_TABLES = ('family', 'child', 'gift')
+
+def rebuild_with_autoincrement(engine, table):
+    """
+    Recreate a table created without AUTOINCREMENT, keeping its rows and ids.
+    SQLite can't change a primary key in place, so the rows move to a new table
+    """
+    with engine.begin() as conn:
+        sql = conn.execute(db.text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                           {'name': table.name}).scalar()
+        if sql is None or 'AUTOINCREMENT' in sql.upper():
+            return False
+        inspector = sa_inspect(conn)
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        columns = ', '.join(column.name for column in table.columns if column.name in existing)
+        # Shards keep no keys to tables that live in the main database
+        keys = [constraint for constraint in table.foreign_key_constraints
+                if inspector.has_table(constraint.referred_table.name)]
+        ddl = str(CreateTable(table, include_foreign_key_constraints=keys).compile(conn)).strip()
+        conn.execute(db.text(ddl.replace(f'CREATE TABLE {table.name} (', f'CREATE TABLE {table.name}_rebuild (', 1)))
+        conn.execute(db.text(f'INSERT INTO {table.name}_rebuild ({columns}) SELECT {columns} FROM {table.name}'))
+        conn.execute(db.text(f'DROP TABLE {table.name}'))
+        conn.execute(db.text(f'ALTER TABLE {table.name}_rebuild RENAME TO {table.name}'))
+        for index in table.indexes:
+            index.create(conn)
+    return True
+
+def migrate_schema(engine=None):
+    """Bring tables created by older versions up to date, in the main database or a shard; returns the added columns"""
+    engine = engine or db.engine
+    inspector = sa_inspect(engine)
+    added = []
+    
+    for table, column, ddl in ADDED_COLUMNS:
+        if inspector.has_table(table) and column not in {c['name'] for c in inspector.get_columns(table)}:
+            with engine.begin() as conn:
+                conn.execute(db.text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'))
+            added.append((table, column))
+    
+    # Indexes added to tables that already exist
+    for table in db.metadata.sorted_tables:
+        if inspector.has_table(table.name):
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for index in table.indexes:
+                if {column.name for column in index.columns} <= existing:
+                    index.create(engine, checkfirst=True)
+    
+    # Ids freed by purges used to be handed out again; entries cached under them are dropped once
+    if engine.dialect.name == 'sqlite':
+        rebuilt = [name for name in AUTOINCREMENT_TABLES
+                   if inspector.has_table(name) and rebuild_with_autoincrement(engine, db.metadata.tables[name])]
+        if rebuilt:
+            family_cache.clear()
+            print(f"Rebuilt {', '.join(rebuilt)} so ids are never reused")
+    
+    # Reset tokens used to be stored in plaintext; they live for an hour, so drop them
+    if inspector.has_table('password_reset_token'):
+        columns = {column['name'] for column in inspector.get_columns('password_reset_token')}
+        if 'token_hash' not in columns:
+            PasswordResetToken.__table__.drop(engine)
+    return added
+
 # Create tables
 with app.app_context():
+    added = migrate_schema()
     db.create_all()
+    if get_router():
+        for name in get_router().shard_urls:
+            added += migrate_schema(get_router().engine(name))
+        get_router().create_all()
+    # Existing prices are parsed once, right after their columns appear
+    if ('gift', 'price_min') in added:
+        print(f"Parsed prices of {backfill_prices()} gifts")
     
     # Create default superadmin if none exists
     if not SuperAdmin.query.first():
@@ -373,6 +1402,14 @@ with app.app_context():
         db.session.commit()
         print("Default superadmin created: admin@wishlist.com / admin123")
 
+def prewarm_templates():
+    """Compile every template up front so the first requests don't pay for it"""
+    for name in app.jinja_env.list_templates(extensions=['html']):
+        app.jinja_env.get_template(name)
+
+if app.config['TEMPLATE_PREWARM']:
+    prewarm_templates()
+
 # Public Routes
 @app.route('/')
 def index():
@@ -419,7 +1456,7 @@ def family_logout():
 def family_dashboard():
     """Main page showing all children and their gift lists"""
     family_id = session['family_id']
-    children = Child.query.filter_by(family_id=family_id).order_by(Child.name).all()
+    children = get_family_snapshot(family_id)
     return render_template('family_dashboard.html', children=children)
 
 @app.route('/child/<int:child_id>')
@@ -427,11 +1464,89 @@ def family_dashboard():
 def child_gifts(child_id):
     """View gifts for a specific child"""
     family_id = session['family_id']
-    child = Child.query.filter_by(id=child_id, family_id=family_id).first_or_404()
-    # Sort gifts: available first, then purchased
-    sorted_gifts = sorted(child.gifts, key=lambda g: (g.is_purchased, g.created_at))
-    child.gifts = sorted_gifts
-    return render_template('child_gifts.html', child=child)
+    # Snapshot gifts are already sorted: available first, then purchased
+    child = next((c for c in get_family_snapshot(family_id) if c.id == child_id), None)
+    if child is None:
+        abort(404)
+    filters = price_filters()
+    if any(filters.values()):
+        # The database picks and orders the gifts, the snapshot still renders them
+        ids = db.session.execute(filtered_gifts(child_id, [Gift.__table__.c.id], **filters)).scalars().all()
+        if filters['sort']:
+            by_id = {gift.id: gift for gift in child.gifts}
+            gifts = [by_id[gift_id] for gift_id in ids if gift_id in by_id]
+        else:
+            ids = set(ids)
+            gifts = [gift for gift in child.gifts if gift.id in ids]
+        child = child._replace(gifts=gifts)
+    shard = shard_of(family_id)
+    for gift in child.gifts:
+        write_behind.increment(Gift.__table__, gift.id, 'view_count', shard=shard)
+    return render_template('child_gifts.html', child=child, filters=filters)
+
+@app.route('/family-wishlist')
+@require_family_auth
+def family_wishlist():
+    """Every child's list on one page, streamed child by child"""
+    family_id = session['family_id']
+    shard = shard_of(family_id)
+    
+    def children():
+        for child in iter_family_children(family_id):
+            for gift in child.gifts:
+                write_behind.increment(Gift.__table__, gift.id, 'view_count', shard=shard)
+            yield child
+    
+    # stream_template keeps the request context, and with it the session, until the last child
+    return Response(buffered_stream(stream_template('family_wishlist.html', children=children()),
+                                    app.config['FAMILY_PAGE_FLUSH_BYTES']), mimetype='text/html')
+
+@app.route('/manifest.webmanifest')
+def web_manifest():
+    """Web app manifest, so the family pages can be installed on a phone's home screen"""
+    response = jsonify({
+        'name': 'Rodinný Zoznam Darčekov',
+        'short_name': 'Darčeky',
+        'lang': 'sk',
+        'start_url': url_for('family_dashboard'),
+        'scope': '/',
+        'display': 'standalone',
+        'background_color': '#ffffff',
+        'theme_color': '#2c3e50',
+        'icons': [{'src': url_for('static', filename='icons/icon.svg'), 'sizes': 'any', 'type': 'image/svg+xml'}],
+    })
+    response.mimetype = 'application/manifest+json'
+    response.cache_control.max_age = 86400
+    return response
+
+@app.route('/service-worker.js')
+def service_worker():
+    """The service worker, served from the root so its scope covers every page"""
+    stylesheet_url = url_for('static', filename='css/style.css')
+    shell_urls = [stylesheet_url, url_for('static', filename='icons/icon.svg')]
+    response = Response(render_template(
+        'service_worker.js', stylesheet_url=stylesheet_url, shell_urls=shell_urls,
+        version=hashlib.sha256(' '.join(shell_urls).encode()).hexdigest()[:10],
+        image_cache_entries=app.config['PWA_IMAGE_CACHE_ENTRIES'],
+    ), mimetype='text/javascript')
+    # Browsers look for a new worker on every visit; the shell URLs change with each asset build
+    response.cache_control.no_cache = True
+    return response
+
+def gift_return_url(child_id):
+    """Where a purchase or unmark returns to: the child's list, or its section of the whole family page"""
+    if request.form.get('return_to') == 'family':
+        return url_for('family_wishlist', _anchor=f'child-{child_id}')
+    return url_for('child_gifts', child_id=child_id)
+
+def gift_action_done(child_id):
+    """
+    Response to a purchase or unmark. Actions replayed by the service worker
+    get 204, so a redirect to the login page cannot pass for success
+    """
+    if request.form.get('replay'):
+        return '', 204
+    return redirect(gift_return_url(child_id))
 
 @app.route('/gift/<int:gift_id>/purchase', methods=['POST'])
 @require_family_auth
@@ -447,12 +1562,22 @@ def purchase_gift(gift_id):
     
     if not buyer_name:
         return jsonify({'error': 'Please enter your name'}), 400
+    # Purchases queued offline must not take over a gift somebody else bought meanwhile
+    if request.form.get('if_available') and gift.is_purchased and gift.purchased_by != buyer_name:
+        return jsonify({'error': 'Gift was already purchased'}), 409
     
+    newly_purchased = not gift.is_purchased
+    record_change(family_id, gift, 'purchased', actor=buyer_name,
+                  data=changed_fields(gift, {'purchased_by': buyer_name}) or None)
     gift.is_purchased = True
     gift.purchased_by = buyer_name
+    if newly_purchased:
+        gift.purchased_at = datetime.utcnow()
+        record_gift_activity(family_id, 'purchased')
+    touch_family(family_id)
     db.session.commit()
     
-    return redirect(url_for('child_gifts', child_id=gift.child_id))
+    return gift_action_done(gift.child_id)
 
 @app.route('/gift/<int:gift_id>/unmark', methods=['POST'])
 @require_family_auth
@@ -464,11 +1589,19 @@ def unmark_gift(gift_id):
         Child.family_id == family_id
     ).first_or_404()
     
+    was_purchased = gift.is_purchased
+    if was_purchased:
+        # The family login is shared, so the removed buyer is what the event can tell
+        record_change(family_id, gift, 'unmarked', data={'purchased_by': gift.purchased_by, 'purchased_at': gift.purchased_at})
     gift.is_purchased = False
     gift.purchased_by = None
+    gift.purchased_at = None
+    if was_purchased:
+        record_gift_activity(family_id, 'unmarked')
+    touch_family(family_id)
     db.session.commit()
     
-    return redirect(url_for('child_gifts', child_id=gift.child_id))
+    return gift_action_done(gift.child_id)
 
 # Admin Routes
 @app.route('/admin-login', methods=['GET', 'POST'])
@@ -487,9 +1620,7 @@ def admin_login():
             session['family_id'] = admin.family_id
             session['family_name'] = admin.family.name
             
-            # Update last login
-            admin.last_login = datetime.utcnow()
-            db.session.commit()
+            write_behind.set(AdminUser.__table__, admin.id, 'last_login', datetime.utcnow())
             
             return redirect(url_for('admin_dashboard'))
         else:
@@ -514,7 +1645,7 @@ def admin_logout():
 def admin_dashboard():
     """Admin dashboard"""
     family_id = session['family_id']
-    children = Child.query.filter_by(family_id=family_id).order_by(Child.name).all()
+    children = Child.query.options(selectinload(Child.gifts)).filter_by(family_id=family_id).order_by(Child.name).all()
     return render_template('admin/dashboard.html', children=children)
 
 @app.route('/admin/child/add', methods=['GET', 'POST'])
@@ -532,6 +1663,9 @@ def admin_add_child():
             family_id=session['family_id']
         )
         db.session.add(child)
+        record_change(session['family_id'], child, 'added', actor=session.get('admin_email'),
+                      data={'name': child.name, 'age': child.age})
+        touch_family(session['family_id'])
         db.session.commit()
         
         flash('Dieťa bolo úspešne pridané', 'success')
@@ -548,10 +1682,14 @@ def admin_edit_child(child_id):
     
     form = ChildForm(obj=child)
     if form.validate_on_submit():
-        child.name = form.name.data.strip()
         age = form.age.data.strip()
-        child.age = int(age) if age else None
+        values = {'name': form.name.data.strip(), 'age': int(age) if age else None}
+        changes = changed_fields(child, values)
+        if changes:
+            record_change(family_id, child, 'edited', actor=session.get('admin_email'), data=changes)
+        child.name, child.age = values['name'], values['age']
         
+        touch_family(family_id)
         db.session.commit()
         flash('Dieťa bolo úspešne upravené', 'success')
         return redirect(url_for('admin_dashboard'))
@@ -564,7 +1702,13 @@ def admin_delete_child(child_id):
     """Delete a child and all their gifts"""
     family_id = session['family_id']
     child = Child.query.filter_by(id=child_id, family_id=family_id).first_or_404()
+    # The delete cascade loads the gifts anyway
+    record_gift_activity(family_id, 'deleted', len(child.gifts))
+    # One event for the child; its gifts go with it
+    record_change(family_id, child, 'deleted', actor=session.get('admin_email'),
+                  data={'name': child.name, 'gift_ids': [gift.id for gift in child.gifts]})
     db.session.delete(child)
+    touch_family(family_id)
     db.session.commit()
     
     flash('Dieťa bolo úspešne odstránené', 'success')
@@ -575,8 +1719,109 @@ def admin_delete_child(child_id):
 def admin_child_gifts(child_id):
     """Manage gifts for a child"""
     family_id = session['family_id']
-    child = Child.query.filter_by(id=child_id, family_id=family_id).first_or_404()
-    return render_template('admin/gifts.html', child=child)
+    child_table = Child.__table__
+    children = db.select(child_table.c.id, child_table.c.name).where(child_table.c.family_id == family_id)
+    child = db.session.execute(children.where(child_table.c.id == child_id)).first()
+    if child is None:
+        abort(404)
+    siblings = db.session.execute(children.where(child_table.c.id != child_id).order_by(child_table.c.name))
+    filters = price_filters()
+    columns = gift_columns(AdminGiftRow._fields, description=db.func.substr(
+        Gift.__table__.c.description, 1, ADMIN_DESCRIPTION_LENGTH))
+    gifts = db.session.execute(filtered_gifts(child_id, columns, **filters))
+    return render_template('admin/gifts.html', child=ChildRow._make(child), filters=filters,
+                           siblings=[ChildRow._make(row) for row in siblings],
+                           gifts=[AdminGiftRow._make(row) for row in gifts])
+
+@app.route('/admin/child/<int:child_id>/gifts/bulk', methods=['POST'])
+@require_admin_auth
+def admin_bulk_gifts(child_id):
+    """Delete, unmark, move or copy selected gifts of a child, or copy the whole list, in one transaction"""
+    family_id = session['family_id']
+    action = request.form.get('action')
+    gift_ids = request.form.getlist('gift_ids', type=int)
+    target_id = request.form.get('target_child_id', type=int)
+    if action not in BULK_ACTIONS:
+        abort(400)
+    
+    # Both children must belong to the admin's family; gifts are only touched through the source child
+    children = {child.id: child for child in Child.query.filter(
+        Child.family_id == family_id, Child.id.in_([child_id, target_id or child_id])
+    )}
+    if child_id not in children:
+        abort(404)
+    back = redirect(url_for('admin_child_gifts', child_id=child_id))
+    if action in ('move', 'copy', 'duplicate') and (target_id not in children or target_id == child_id):
+        flash('Vyberte iné dieťa, ku ktorému sa majú darčeky presunúť alebo skopírovať', 'error')
+        return back
+    if action != 'duplicate' and not gift_ids:
+        flash('Nevybrali ste žiadne darčeky', 'error')
+        return back
+    
+    table = Gift.__table__
+    actor = session.get('admin_email')
+    new_ids = []
+    if action == 'duplicate':
+        new_ids = copy_gifts(child_id, target_id)
+    else:
+        selected = table.c.id.in_(gift_ids) & (table.c.child_id == child_id)
+        if action == 'unmark':
+            selected &= table.c.is_purchased.is_(True)
+        # Read what the events need, then change every row with one statement
+        rows = db.session.execute(
+            db.select(table.c.id, table.c.name, table.c.purchased_by, table.c.purchased_at)
+            .where(selected).order_by(*list_order(table))
+        ).all()
+        ids = [row.id for row in rows]
+    
+    if action == 'delete' and ids:
+        db.session.execute(table.delete().where(table.c.id.in_(ids)))
+        for row in rows:
+            record_change(family_id, ('gift', row.id), 'deleted', actor=actor,
+                          data={'child_id': child_id, 'name': row.name, 'purchased_by': row.purchased_by})
+        record_gift_activity(family_id, 'deleted', len(ids))
+    elif action == 'unmark' and ids:
+        db.session.execute(table.update().where(table.c.id.in_(ids)).values(
+            is_purchased=False, purchased_by=None, purchased_at=None))
+        for row in rows:
+            record_change(family_id, ('gift', row.id), 'unmarked', actor=actor,
+                          data={'purchased_by': row.purchased_by, 'purchased_at': row.purchased_at})
+        record_gift_activity(family_id, 'unmarked', len(ids))
+    elif action == 'move' and ids:
+        db.session.execute(table.update().where(table.c.id.in_(ids)).values(
+            child_id=target_id, rank=appended_rank(target_id, ids)))
+        for row in rows:
+            record_change(family_id, ('gift', row.id), 'edited', actor=actor, data={'child_id': [child_id, target_id]})
+    elif action == 'copy' and ids:
+        new_ids = copy_gifts(child_id, target_id, ids)
+    
+    if action in ('copy', 'duplicate'):
+        ids = new_ids
+        for gift_id in new_ids:
+            record_change(family_id, ('gift', gift_id), 'added', actor=actor, data={'child_id': target_id, 'copied_from': child_id})
+        record_gift_activity(family_id, 'added', len(new_ids))
+    
+    if ids:
+        touch_family(family_id)
+    db.session.commit()
+    
+    messages = {
+        'delete': 'Vymazané darčeky', 'unmark': 'Zrušené označenie kúpy', 'move': 'Presunuté darčeky',
+        'copy': 'Skopírované darčeky', 'duplicate': 'Skopírované darčeky',
+    }
+    flash(f'{messages[action]}: {len(ids)}', 'success')
+    return back
+
+@app.route('/admin/broken-links')
+@require_admin_auth
+def admin_broken_links():
+    """Gifts whose link or image the last sweep found dead"""
+    family_id = session['family_id']
+    gifts = Gift.query.join(Child).options(contains_eager(Gift.child)).filter(
+        Child.family_id == family_id,
+        db.or_(Gift.link_status == DEAD, Gift.link2_status == DEAD, Gift.image_status == DEAD)
+    ).order_by(Child.name, Gift.name).all()
+    return render_template('admin/broken_links.html', gifts=gifts)
 
 @app.route('/admin/child/<int:child_id>/gift/add', methods=['GET', 'POST'])
 @require_admin_auth
@@ -627,9 +1872,16 @@ def admin_add_gift(child_id):
             link2=form.link2.data.strip(),
             image_url=image_url,
             price_range=form.price_range.data.strip(),
-            child_id=child_id
+            child_id=child_id,
+            rank=key_between(last_rank(child_id), None)
         )
+        apply_price(gift)
         db.session.add(gift)
+        record_change(family_id, gift, 'added', actor=session.get('admin_email'), data={
+            'child_id': child_id, 'name': gift.name, 'link': gift.link, 'price_range': gift.price_range})
+        record_gift_activity(family_id, 'added')
+        touch_family(family_id)
+        enqueue_link_enrichment(gift)
         db.session.commit()
         
         flash('Darček bol úspešne pridaný', 'success')
@@ -682,18 +1934,33 @@ def admin_edit_gift(gift_id):
                 # Set image URL to the uploaded file
                 image_url = f"/static/uploads/{unique_filename}"
         
-        gift.name = form.name.data.strip()
-        gift.description = form.description.data.strip()
-        gift.link = form.link.data.strip()
-        gift.link2 = form.link2.data.strip()
-        gift.image_url = image_url
-        gift.price_range = form.price_range.data.strip()
+        links_changed = (gift.link, gift.link2) != (form.link.data.strip(), form.link2.data.strip())
+        if links_changed or gift.image_url != image_url:
+            reset_link_status(gift)
+        values = {
+            'name': form.name.data.strip(),
+            'description': form.description.data.strip(),
+            'link': form.link.data.strip(),
+            'link2': form.link2.data.strip(),
+            'image_url': image_url,
+            'price_range': form.price_range.data.strip(),
+        }
+        changes = changed_fields(gift, values)
+        if changes:
+            record_change(family_id, gift, 'edited', actor=session.get('admin_email'), data=changes)
+        for field, value in values.items():
+            setattr(gift, field, value)
+        apply_price(gift)
         
+        touch_family(family_id)
+        if links_changed:
+            enqueue_link_enrichment(gift)
         db.session.commit()
         flash('Darček bol úspešne upravený', 'success')
         return redirect(url_for('admin_child_gifts', child_id=gift.child_id))
     
-    return render_template('admin/gift_form.html', form=form, child=gift.child, gift=gift)
+    return render_template('admin/gift_form.html', form=form, child=gift.child, gift=gift,
+                         suggestions=link_suggestions(gift), history=gift_history(family_id, gift.id))
 
 @app.route('/admin/gift/<int:gift_id>/delete', methods=['POST'])
 @require_admin_auth
@@ -706,12 +1973,59 @@ def admin_delete_gift(gift_id):
     ).first_or_404()
     
     child_id = gift.child_id
+    record_change(family_id, gift, 'deleted', actor=session.get('admin_email'), data={
+        'child_id': child_id, 'name': gift.name, 'is_purchased': bool(gift.is_purchased), 'purchased_by': gift.purchased_by})
     db.session.delete(gift)
+    record_gift_activity(family_id, 'deleted')
+    touch_family(family_id)
     db.session.commit()
     
     flash('Darček bol úspešne odstránený', 'success')
     return redirect(url_for('admin_child_gifts', child_id=child_id))
 
+@app.route('/admin/gift/<int:gift_id>/reorder', methods=['POST'])
+@require_admin_auth
+def admin_reorder_gift(gift_id):
+    """Move a gift between two neighbours of its list (JSON `after`/`before` gift ids), rewriting only its rank"""
+    family_id = session['family_id']
+    gift = Gift.query.join(Child).filter(
+        Gift.id == gift_id,
+        Child.family_id == family_id
+    ).first_or_404()
+    
+    data = request.get_json(silent=True) or request.form
+    try:
+        after_id, before_id = (int(data[key]) if data.get(key) not in (None, '') else None for key in ('after', 'before'))
+    except (TypeError, ValueError):
+        abort(400)
+    neighbour_ids = [i for i in (after_id, before_id) if i is not None]
+    
+    def neighbour_ranks():
+        if not neighbour_ids:
+            return {}
+        return dict(db.session.query(Gift.id, Gift.rank).filter(
+            Gift.child_id == gift.child_id, Gift.id.in_(neighbour_ids), Gift.id != gift.id
+        ))
+    
+    ranks = neighbour_ranks()
+    if len(ranks) != len(neighbour_ids):
+        return jsonify({'error': 'Neighbours must be other gifts of the same list'}), 400
+    low, high = ranks.get(after_id), ranks.get(before_id)
+    if None in ranks.values() or (low is not None and high is not None and low >= high):
+        # Unranked gifts, or a gap taken by a concurrent move: respace the list and retry once
+        rebalance_child_ranks(gift.child_id)
+        ranks = neighbour_ranks()
+        low, high = ranks.get(after_id), ranks.get(before_id)
+        if low is not None and high is not None and low >= high:
+            return jsonify({'error': 'Neighbours are not adjacent'}), 409
+    
+    old_rank, new_rank = gift.rank, key_between(low, high)
+    gift.rank = new_rank
+    record_change(family_id, gift, 'edited', actor=session.get('admin_email'), data={'rank': [old_rank, new_rank]})
+    touch_family(family_id)
+    db.session.commit()
+    return jsonify({'id': gift_id, 'rank': new_rank})
+
 @app.route('/admin/family-settings', methods=['GET', 'POST'])
 @require_admin_auth
 def admin_family_settings():
@@ -749,6 +2063,16 @@ def reset_password_request():
         # Check if email exists as admin
         admin = AdminUser.query.filter_by(email=email, is_active=True).first()
         if admin:
+            # Limit how many valid links can exist for one email at a time
+            outstanding = PasswordResetToken.query.filter(
+                PasswordResetToken.email == email,
+                PasswordResetToken.used == False,
+                PasswordResetToken.expires_at > datetime.utcnow()
+            ).count()
+            if outstanding >= app.config['RESET_TOKEN_MAX_OUTSTANDING']:
+                flash('Link na reset hesla už bol odoslaný, skontrolujte svoj email', 'error')
+                return render_template('reset_password_request.html', form=form)
+            
             # Generate reset token
             token = generate_reset_token()
             expires_at = datetime.utcnow() + timedelta(hours=1)
@@ -756,14 +2080,17 @@ def reset_password_request():
             # Store token
             reset_token = PasswordResetToken(
                 email=email,
-                token=token,
+                token_hash=hash_reset_token(token),
                 expires_at=expires_at
             )
             db.session.add(reset_token)
             db.session.commit()
             
             # Send email
-            if send_reset_email(email, token, 'admin'):
+            sent = send_reset_email(email, token, 'admin')
+            if sent == EMAIL_QUEUED:
+                flash('Link na reset hesla sa odosiela na váš email. Ak do pár minút nepríde, požiadajte o nový.', 'success')
+            elif sent:
                 flash('Link na reset hesla bol odoslaný na váš email', 'success')
             else:
                 flash('Chyba pri odosielaní emailu', 'error')
@@ -776,7 +2103,7 @@ def reset_password_request():
 def reset_password(token):
     """Reset password with token"""
     reset_token = PasswordResetToken.query.filter_by(
-        token=token,
+        token_hash=hash_reset_token(token),
         used=False
     ).first()
     
@@ -792,7 +2119,10 @@ def reset_password(token):
         admin = AdminUser.query.filter_by(email=reset_token.email).first()
         if admin:
             admin.password_hash = hash_password(password)
-            reset_token.used = True
+            # Invalidate every other outstanding link for this email as well
+            PasswordResetToken.query.filter_by(email=reset_token.email, used=False).update(
+                {'used': True}, synchronize_session=False
+            )
             db.session.commit()
             
             flash('Heslo bolo úspešne zmenené', 'success')
@@ -817,9 +2147,7 @@ def superadmin_login():
             session['superadmin_id'] = superadmin.id
             session['superadmin_email'] = superadmin.email
             
-            # Update last login
-            superadmin.last_login = datetime.utcnow()
-            db.session.commit()
+            write_behind.set(SuperAdmin.__table__, superadmin.id, 'last_login', datetime.utcnow())
             
             return redirect(url_for('superadmin_dashboard'))
         else:
@@ -839,15 +2167,27 @@ def superadmin_logout():
 def superadmin_dashboard():
     """SuperAdmin dashboard with stats"""
     families = Family.query.filter_by(is_active=True).all()
-    total_children = Child.query.count()
-    total_gifts = Gift.query.count()
     total_admins = AdminUser.query.filter_by(is_active=True).count()
     
+    # Per-family counts in one grouped query each instead of loading every relationship,
+    # gathered from every shard when sharding is enabled
+    total_children = total_gifts = 0
+    child_counts, gift_counts = {}, {}
+    for _ in for_each_shard(db):
+        total_children += Child.query.count()
+        total_gifts += Gift.query.count()
+        child_counts.update(db.session.query(Child.family_id, db.func.count(Child.id)).group_by(Child.family_id).all())
+        gift_counts.update(db.session.query(Child.family_id, db.func.count(Gift.id)).join(Gift).group_by(Child.family_id).all())
+    admin_counts = dict(db.session.query(AdminUser.family_id, db.func.count(AdminUser.id)).group_by(AdminUser.family_id).all())
+    
     return render_template('superadmin/dashboard.html', 
                          families=families,
                          total_children=total_children,
                          total_gifts=total_gifts,
-                         total_admins=total_admins)
+                         total_admins=total_admins,
+                         child_counts=child_counts,
+                         gift_counts=gift_counts,
+                         admin_counts=admin_counts)
 
 @app.route('/superadmin/family/add', methods=['GET', 'POST'])
 @require_superadmin_auth
@@ -888,6 +2228,8 @@ def superadmin_add_family():
         )
         db.session.add(admin)
         db.session.commit()
+        if get_router():
+            get_router().assign(family.id)
         
         flash('Rodina bola úspešne vytvorená', 'success')
         return redirect(url_for('superadmin_dashboard'))
@@ -914,6 +2256,7 @@ def superadmin_delete_family(family_id):
     """Delete family"""
     family = Family.query.get_or_404(family_id)
     family.is_active = False
+    family.deactivated_at = datetime.utcnow()
     db.session.commit()
     
     flash('Rodina bola deaktivovaná', 'success')
@@ -1008,5 +2351,302 @@ def superadmin_delete_family_admin(admin_id):
     
     return redirect(url_for('superadmin_family_admins', family_id=family_id))
 
+@app.route('/superadmin/cache-stats')
+@require_superadmin_auth
+def superadmin_cache_stats():
+    """Hit/miss counters of this worker's family snapshot cache"""
+    return jsonify(family_cache.stats())
+
+@app.route('/superadmin/outbound-stats')
+@require_superadmin_auth
+def superadmin_outbound_stats():
+    """Per-host latency and circuit breaker state of this worker's outbound calls"""
+    return jsonify(outbound_client.stats())
+
+def analytics_params():
+    days = min(max(request.args.get('days', 30, type=int), 1), 366)
+    family_id = request.args.get('family', 0, type=int)
+    return days, family_id
+
+@app.route('/superadmin/analytics')
+@require_superadmin_auth
+def superadmin_analytics():
+    """Gifts added, purchased, unmarked and deleted per day, from the daily rollups"""
+    days, family_id = analytics_params()
+    activity = gift_activity(family_id, days)
+    families = Family.query.order_by(Family.name).all()
+    peak = max([max(row[c] for c in ACTIVITY_COLUMNS) for row in activity] + [1])
+    totals = {c: sum(row[c] for row in activity) for c in ACTIVITY_COLUMNS}
+    return render_template('superadmin/analytics.html', activity=activity, families=families,
+                         family_id=family_id, days=days, peak=peak, totals=totals)
+
+@app.route('/superadmin/analytics.csv')
+@require_superadmin_auth
+def superadmin_analytics_csv():
+    """Daily rollups as CSV"""
+    days, family_id = analytics_params()
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(('day',) + ACTIVITY_COLUMNS)
+    for row in gift_activity(family_id, days):
+        writer.writerow([row['day'].isoformat()] + [row[c] for c in ACTIVITY_COLUMNS])
+    return Response(output.getvalue(), mimetype='text/csv', headers={
+        'Content-Disposition': f'attachment; filename=gift-activity-{family_id or "all"}-{days}d.csv'
+    })
+
+@app.route('/superadmin/changes')
+@require_superadmin_auth
+def superadmin_changes():
+    """
+    Change events with an id above `after`, oldest first, as JSON lines.
+    Consumers pass the last id they received as the next `after`; at most
+    `limit` events (CHANGE_FEED_MAX) are sent per request, `family` filters.
+    With `wait`, a consumer that is up to date is held for up to that many
+    seconds until an event arrives (long polling; cheap under asgi.py).
+    """
+    after, family_id, limit, wait = change_feed_args(request.args)
+    
+    def generate(after, remaining):
+        deadline = time.monotonic() + wait
+        while wait and not change_batch(after, family_id, 1) and time.monotonic() < deadline:
+            db.session.remove()  # no connection is held while waiting
+            time.sleep(app.config['CHANGE_FEED_POLL_INTERVAL'])
+        # Keyset batches: the response streams while later events are still being read
+        while remaining > 0:
+            events = change_batch(after, family_id, min(app.config['CHANGE_FEED_BATCH'], remaining))
+            for event in events:
+                yield json.dumps(event, ensure_ascii=False) + '\n'
+            if len(events) < min(app.config['CHANGE_FEED_BATCH'], remaining):
+                return
+            after = events[-1]['id']
+            remaining -= len(events)
+    
+    return Response(stream_with_context(generate(after, limit)), mimetype='application/x-ndjson')
+
+@app.route('/superadmin/profiles', methods=['GET', 'POST'])
+@require_superadmin_auth
+def superadmin_profiles():
+    """Recent request profiles and rate based sampling switch"""
+    form = ProfilerSettingsForm()
+    if form.validate_on_submit():
+        endpoint = (form.endpoint.data or '').strip() or None
+        if endpoint and endpoint not in app.view_functions:
+            flash('Neznámy endpoint', 'error')
+        else:
+            profiler.configure(form.sample_rate.data, endpoint=endpoint, minutes=form.minutes.data)
+            flash('Nastavenia profilovania boli uložené', 'success')
+            return redirect(url_for('superadmin_profiles'))
+    
+    return render_template('superadmin/profiles.html',
+                         form=form,
+                         profiles=profiler.recent_profiles(),
+                         settings=profiler.settings(),
+                         profile_header=profiler.header,
+                         profile_token=profiler.make_token())
+
+@app.route('/superadmin/profiles/<name>')
+@require_superadmin_auth
+def superadmin_profile_download(name):
+    """Download a collapsed-stack profile"""
+    path = profiler.profile_path(name)
+    if not path:
+        abort(404)
+    return send_file(path, mimetype='text/plain', as_attachment=True, download_name=os.path.basename(path))
+
+@app.errorhandler(ShardMovingError)
+def shard_moving(error):
+    """Writes during a shard move are refused briefly instead of being lost"""
+    db.session.rollback()
+    return Response('Zoznam sa práve presúva, skúste to o chvíľu znova.', status=503,
+                    headers={'Retry-After': str(int(get_router().cache_ttl * 2) + 1)}, mimetype='text/plain')
+
+# Scheduled jobs
+@scheduler.job('prune_reset_tokens', interval=app.config['RESET_TOKEN_PRUNE_INTERVAL'])
+def prune_reset_tokens_job():
+    removed = prune_reset_tokens()
+    if removed:
+        print(f"Pruned {removed} password reset tokens")
+
+@scheduler.job('prune_change_events', interval=24 * 3600, exclusive=True)
+def prune_change_events_job():
+    removed = prune_change_events()
+    if removed:
+        print(f"Pruned {removed} change events")
+
+@scheduler.job('rebalance_ranks', interval=app.config['RANK_REBALANCE_INTERVAL'], exclusive=True)
+def rebalance_ranks_job():
+    rebalanced = rebalance_ranks()
+    if rebalanced:
+        print(f"Rebalanced gift ranks of {rebalanced} children")
+
+@app.cli.command('rebalance-ranks')
+def rebalance_ranks_command():
+    """Rank gifts that have no rank yet and shorten long ranks"""
+    print(f"Rebalanced gift ranks of {rebalance_ranks()} children")
+
+@app.cli.command('backfill-prices')
+def backfill_prices_command():
+    """Parse price texts of gifts that have no price columns yet"""
+    print(f"Parsed prices of {backfill_prices()} gifts")
+
+@app.cli.command('rebuild-gift-activity')
+def rebuild_gift_activity_command():
+    """Rebuild the daily gift rollups from existing gifts (deleted and unmarked history is lost)"""
+    rebuild_gift_activity()
+    print(f"Rebuilt {GiftActivityDaily.query.count()} daily rollup rows")
+
+@app.cli.command('prune-reset-tokens')
+def prune_reset_tokens_command():
+    """Delete used and expired password reset tokens"""
+    print(f"Pruned {prune_reset_tokens()} password reset tokens")
+
+@scheduler.job('flush_write_behind', interval=app.config['WRITE_BEHIND_INTERVAL'])
+def flush_write_behind_job():
+    write_behind.flush()
+
+@scheduler.job('sweep_links', interval=app.config['LINK_SWEEP_INTERVAL'], exclusive=True)
+def sweep_links_job():
+    checked = sweep_links()
+    if checked:
+        print(f"Link sweep checked {checked} gifts")
+
+@scheduler.job('archive_families', interval=app.config['ARCHIVE_INTERVAL'], exclusive=True)
+def archive_families_job():
+    for path in archive_deactivated_families():
+        print(f"Archived family to {path}")
+
+@app.cli.command('archive-families')
+def archive_families_command():
+    """Archive and purge families deactivated longer than ARCHIVE_GRACE_DAYS"""
+    paths = archive_deactivated_families()
+    for path in paths:
+        print(f"Archived family to {path}")
+    print(f"Archived {len(paths)} families")
+
+@app.cli.command('restore-family')
+@click.argument('path')
+def restore_family_command(path):
+    """Restore a family from an archive written by archive-families"""
+    try:
+        family_id = restore_family(path)
+    except (OSError, ValueError, KeyError) as e:
+        raise click.ClickException(str(e))
+    print(f"Restored family as id {family_id}")
+
+@scheduler.job('backup_database', interval=600, exclusive=True)
+def backup_database_job():
+    if app.config['BACKUP_ENABLED'] and database_path() and backup_due():
+        print(f"Database backed up to {backup_database()}")
+
+@app.cli.command('backup-db')
+def backup_db_command():
+    """Snapshot the database now"""
+    try:
+        print(f"Database backed up to {backup_database()}")
+    except (OSError, ValueError) as e:
+        raise click.ClickException(str(e))
+
+@app.cli.command('verify-backup')
+@click.argument('path')
+def verify_backup_command(path):
+    """Check a snapshot's checksum and integrity"""
+    try:
+        verify_backup(path)
+    except (OSError, ValueError) as e:
+        raise click.ClickException(str(e))
+    print(f"{path} is intact")
+
+@app.cli.command('restore-db')
+@click.argument('path')
+@click.confirmation_option(prompt='This replaces the current database. Stop the app first. Continue?')
+def restore_db_command(path):
+    """Verify a snapshot and restore it over the current database"""
+    target = database_path()
+    if target is None:
+        raise click.ClickException('Restore is only supported for SQLite databases')
+    try:
+        # Keep the state being replaced, in case the wrong snapshot was picked
+        restore_backup(path, target, pages=app.config['BACKUP_PAGES_PER_STEP'], sleep=0,
+                       before_copy=lambda: print(f"Current database saved to {backup_database()}"))
+    except (OSError, ValueError) as e:
+        raise click.ClickException(str(e))
+    family_cache.clear()
+    print(f"Restored {path}")
+
+@app.cli.command('sweep-links')
+def sweep_links_command():
+    """Re-check gift links and images that are due"""
+    print(f"Link sweep checked {sweep_links()} gifts")
+
+@app.cli.command('list-shards')
+def list_shards_command():
+    """Show each shard with the number of families placed on it"""
+    router = get_router()
+    if router is None:
+        raise click.ClickException('Sharding is not enabled (SHARDING_ENABLED)')
+    family_ids = [family_id for (family_id,) in db.session.query(Family.id)]
+    placed = {}
+    for family_id in family_ids:
+        placed.setdefault(router.lookup(family_id)[0], []).append(family_id)
+    for name in router.shard_names():
+        print(f"{name}: {len(placed.get(name, []))} families")
+
+@app.cli.command('move-family')
+@click.argument('family_id', type=int)
+@click.argument('shard')
+def move_family_command(family_id, shard):
+    """Move a family's children and gifts to another shard while the app keeps running"""
+    router = get_router()
+    if router is None:
+        raise click.ClickException('Sharding is not enabled (SHARDING_ENABLED)')
+    if shard not in router.shard_names():
+        raise click.ClickException(f"Unknown shard {shard}, expected one of {', '.join(router.shard_names())}")
+    if db.session.get(Family, family_id) is None:
+        raise click.ClickException(f'No family with id {family_id}')
+    
+    def flush_counters():
+        # Workers flush their buffers on their own schedule; wait out one interval
+        write_behind.flush()
+        time.sleep(app.config['WRITE_BEHIND_INTERVAL'])
+    
+    def switch_ids(new_ids):
+        remap_change_events(family_id, new_ids)
+        # Cached snapshots hold the old ids
+        touch_family(family_id)
+        db.session.commit()
+    
+    try:
+        moved = move_family(router, family_id, shard, chunk_size=app.config['ARCHIVE_DELETE_CHUNK'],
+                            on_paused=flush_counters, on_switched=switch_ids)
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    print(f"Moved family {family_id} with {moved} gifts to shard {shard}")
+
+# Process lifecycle
+def init_worker():
+    """Per-process setup after a preforking server forked a worker from a preloaded app"""
+    with app.app_context():
+        # Pooled connections opened in the parent must not be shared; close=False
+        # leaves the parent's sockets alone and only drops the references
+        db.engine.dispose(close=False)
+        if get_router():
+            get_router().dispose()
+    if family_cache.backend:
+        family_cache.backend.reopen()
+    if app.config['SCHEDULER_ENABLED']:
+        scheduler.start()
+
+def drain_background_work(timeout=None):
+    """Finish the running scheduled job and queued background jobs before the process exits"""
+    scheduler.stop(timeout)
+    link_pool.shutdown(wait=True)
+    write_behind.flush()
+
+# Also covers the development server and plain `python app.py`
+atexit.register(write_behind.flush)
+
+if app.config['SCHEDULER_ENABLED'] and app.config['SCHEDULER_AUTOSTART']:
+    scheduler.start()
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5001)
@@ -0,0 +1,115 @@
+"""
+Compressed per-family archives.
+
+An archive is a ``.tar.gz`` holding ``manifest.json``, one JSON-lines file
+per table under ``rows/`` and the family's uploaded images under
+``uploads/``. Rows are stored column by column as plain JSON values, so an
+archive can be restored into a newer schema as long as the columns it knows
+about still exist. Archives are written to a temporary file and renamed
+into place, so a crash never leaves a partial archive behind.
+"""
+import io
+import json
+import os
+import tarfile
+import tempfile
+from datetime import date, datetime
+
+from sqlalchemy import Date, DateTime
+
+FORMAT_VERSION = 1
+
+
+def serialize_row(table, row):
+    """Row mapping -> JSON-compatible dict"""
+    data = {}
+    for column in table.columns:
+        value = row[column.name]
+        if isinstance(value, (datetime, date)):
+            value = value.isoformat()
+        data[column.name] = value
+    return data
+
+
+def deserialize_row(table, data):
+    """Inverse of serialize_row; unknown columns are dropped"""
+    row = {}
+    for column in table.columns:
+        if column.name not in data:
+            continue
+        value = data[column.name]
+        if value is not None and isinstance(column.type, DateTime):
+            value = datetime.fromisoformat(value)
+        elif value is not None and isinstance(column.type, Date):
+            value = date.fromisoformat(value)
+        row[column.name] = value
+    return row
+
+
+def _add_bytes(tar, name, payload):
+    info = tarfile.TarInfo(name)
+    info.size = len(payload)
+    info.mtime = int(datetime.utcnow().timestamp())
+    tar.addfile(info, io.BytesIO(payload))
+
+
+def write_archive(path, manifest, tables, files=()):
+    """
+    Write an archive atomically.
+    `tables` maps table names to lists of serialized rows, `files` holds
+    (archive name, filesystem path) pairs; missing files are skipped.
+    """
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    manifest = dict(manifest, format=FORMAT_VERSION, created_at=datetime.utcnow().isoformat(),
+                    tables={name: len(rows) for name, rows in tables.items()}, files=[])
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as raw, tarfile.open(fileobj=raw, mode='w:gz') as tar:
+            for name, rows in tables.items():
+                payload = ''.join(json.dumps(row, ensure_ascii=False) + '\n' for row in rows)
+                _add_bytes(tar, f'rows/{name}.jsonl', payload.encode('utf-8'))
+            for arcname, file_path in files:
+                if os.path.isfile(file_path):
+                    tar.add(file_path, arcname=f'uploads/{arcname}')
+                    manifest['files'].append(arcname)
+            # Last, so a readable manifest means the rest was written
+            _add_bytes(tar, 'manifest.json', json.dumps(manifest, indent=2).encode('utf-8'))
+        with open(tmp_path, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return manifest
+
+
+def read_archive(path):
+    """(manifest, {table name: [rows]}) of an archive"""
+    tables = {}
+    with tarfile.open(path, mode='r:gz') as tar:
+        manifest = json.load(tar.extractfile('manifest.json'))
+        if manifest.get('format') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported archive format {manifest.get('format')}")
+        for name in manifest['tables']:
+            payload = tar.extractfile(f'rows/{name}.jsonl').read().decode('utf-8')
+            tables[name] = [json.loads(line) for line in payload.splitlines() if line]
+    return manifest, tables
+
+
+def extract_files(path, target_dir):
+    """Copy the archived uploads into `target_dir`, never overwriting existing files"""
+    restored = []
+    with tarfile.open(path, mode='r:gz') as tar:
+        manifest = json.load(tar.extractfile('manifest.json'))
+        for arcname in manifest['files']:
+            target = os.path.join(target_dir, os.path.basename(arcname))
+            if os.path.exists(target):
+                continue
+            source = tar.extractfile(f'uploads/{arcname}')
+            with open(target, 'wb') as f:
+                f.write(source.read())
+            restored.append(arcname)
+    return restored
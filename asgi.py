@@ -0,0 +1,201 @@
+"""
+Optional ASGI entry point, for deployments with many long-lived connections::
+
+    pip install asgiref httpx uvicorn
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+Pages still run as the WSGI app, on asgiref's thread pool. Long polls of the
+change feed (``/superadmin/changes?wait=...``) are served by a coroutine
+instead. A consumer waiting for events then costs a small task rather than a
+worker thread, and each database read it needs is a short query run in a
+thread. With ``httpx`` installed, the reset e-mail is posted from the event
+loop as well, so no worker thread waits for the mail API; the user is told
+the link is on its way, and a failed send is logged and revokes the link.
+"""
+import asyncio
+import json
+import os
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qsl, urlparse
+
+from werkzeug.datastructures import MultiDict
+
+try:
+    from asgiref.wsgi import WsgiToAsgi
+except ImportError:  # optional dependency
+    WsgiToAsgi = None
+
+try:
+    import httpx
+except ImportError:  # optional dependency
+    httpx = None
+
+from app import app as flask_app, db, change_batch, change_feed_args, drain_background_work, outbound_client
+
+
+class AsyncOutbound:
+    """
+    httpx client on the server's event loop; worker threads hand it requests
+    without waiting for them. Requests go through the app's OutboundClient,
+    so its circuit breakers and host stats cover them too
+    """
+
+    def __init__(self, loop, outbound, timeout=(3.05, 10), max_connections=100):
+        self.loop = loop
+        self.outbound = outbound
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(timeout[1], connect=timeout[0]),
+            limits=httpx.Limits(max_connections=max_connections),
+        )
+        self.pending = set()
+
+    def post_in_background(self, url, expected_status=None, on_failure=None, **kwargs):
+        """
+        Schedule a POST from any thread. Failures are logged and `on_failure`
+        is then called in a worker thread
+        """
+        future = asyncio.run_coroutine_threadsafe(self._post(url, expected_status, on_failure, **kwargs), self.loop)
+        self.pending.add(future)
+        future.add_done_callback(self.pending.discard)
+        return future
+
+    async def _post(self, url, expected_status, on_failure, **kwargs):
+        host = urlparse(url).hostname
+        try:
+            response = await self.outbound.arequest(self.client, 'POST', url, **kwargs)
+        except Exception as e:
+            flask_app.logger.error("POST to %s failed: %s", host, e)
+            response = None
+        else:
+            if expected_status is None or response.status_code == expected_status:
+                return response
+            flask_app.logger.error("POST to %s answered %s - %s", host, response.status_code, response.text)
+        if on_failure is not None:
+            try:
+                await asyncio.to_thread(on_failure)
+            except Exception:
+                flask_app.logger.exception("Handling the failed POST to %s failed", host)
+        return response
+
+    async def aclose(self, timeout=10):
+        """Let scheduled requests finish, then close the connections"""
+        if self.pending:
+            await asyncio.wait([asyncio.wrap_future(future) for future in self.pending], timeout=timeout)
+        await self.client.aclose()
+
+
+def read_session(scope):
+    """The Flask session carried by a request's cookie, empty when missing or invalid"""
+    cookies = SimpleCookie()
+    for name, value in scope.get('headers', ()):
+        if name == b'cookie':
+            cookies.load(value.decode('latin-1'))
+    morsel = cookies.get(flask_app.config['SESSION_COOKIE_NAME'])
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    if morsel is None or serializer is None:
+        return {}
+    try:
+        return serializer.loads(morsel.value, max_age=int(flask_app.permanent_session_lifetime.total_seconds()))
+    except Exception:
+        return {}
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+class ChangeFeed:
+    """The change feed's long polls as a coroutine; other feed requests go to the WSGI view"""
+
+    def __init__(self, wsgi):
+        self.wsgi = wsgi
+
+    @staticmethod
+    def read(after, family_id, limit):
+        with flask_app.app_context():
+            try:
+                return change_batch(after, family_id, limit)
+            finally:
+                db.session.remove()
+
+    async def __call__(self, scope, receive, send):
+        args = MultiDict(parse_qsl(scope.get('query_string', b'').decode('latin-1')))
+        if not args.get('wait') or not read_session(scope).get('superadmin_id'):
+            # Plain reads and the login redirect are the regular view's business
+            return await self.wsgi(scope, receive, send)
+
+        after, family_id, limit, wait = change_feed_args(args)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + wait
+        disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+        try:
+            events = await asyncio.to_thread(self.read, after, family_id, 1)
+            while not events and loop.time() < deadline:
+                done, _ = await asyncio.wait({disconnected}, timeout=flask_app.config['CHANGE_FEED_POLL_INTERVAL'])
+                if done:
+                    return
+                events = await asyncio.to_thread(self.read, after, family_id, 1)
+
+            await send({'type': 'http.response.start', 'status': 200,
+                        'headers': [(b'content-type', b'application/x-ndjson')]})
+            batch_size, remaining = flask_app.config['CHANGE_FEED_BATCH'], limit
+            while remaining > 0 and not disconnected.done():
+                events = await asyncio.to_thread(self.read, after, family_id, min(batch_size, remaining))
+                if events:
+                    body = ''.join(json.dumps(event, ensure_ascii=False) + '\n' for event in events)
+                    await send({'type': 'http.response.body', 'body': body.encode('utf-8'), 'more_body': True})
+                if len(events) < min(batch_size, remaining):
+                    break
+                after = events[-1]['id']
+                remaining -= len(events)
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            disconnected.cancel()
+
+
+class Application:
+    """Sends long-lived endpoints to coroutines and everything else to the Flask app"""
+
+    def __init__(self, wsgi_app):
+        if WsgiToAsgi is None:
+            raise RuntimeError("ASGI mode needs asgiref: pip install asgiref")
+        self.wsgi = WsgiToAsgi(wsgi_app)
+        self.routes = {'/superadmin/changes': ChangeFeed(self.wsgi)}
+        self.outbound = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        handler = self.routes.get(scope.get('path')) if scope['type'] == 'http' else None
+        await (handler or self.wsgi)(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                if httpx is not None:
+                    self.outbound = AsyncOutbound(
+                        asyncio.get_running_loop(), outbound_client,
+                        timeout=(flask_app.config['OUTBOUND_CONNECT_TIMEOUT'], flask_app.config['OUTBOUND_READ_TIMEOUT']),
+                    )
+                    flask_app.extensions['async_outbound'] = self.outbound
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                flask_app.extensions.pop('async_outbound', None)
+                if self.outbound is not None:
+                    await self.outbound.aclose()
+                await asyncio.to_thread(drain_background_work, 30)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+app = Application(flask_app)
+
+
+if __name__ == '__main__':
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit("Install uvicorn to serve asgi:app: pip install uvicorn")
+    uvicorn.run('asgi:app', host=os.environ.get('HOST', '0.0.0.0'), port=int(os.environ.get('PORT', 5000)))
@@ -0,0 +1,230 @@
+"""
+Static asset pipeline.
+
+``python assets.py build`` (or ``flask build-assets``) minifies every
+stylesheet in static/css, writes it to static/dist under a content hash
+(``css/style.3f2a9c1b0d.css``) together with ``.gz`` and, when the optional
+``brotli`` package is installed, ``.br`` siblings, and records the mapping in
+static/dist/manifest.json.
+
+At runtime ``StaticAssets`` makes ``url_for('static', filename='css/style.css')``
+return the fingerprinted name from the manifest and serves fingerprinted files
+precompressed with ``Cache-Control: immutable``. Without a manifest the
+original files are served as before.
+
+Uploaded images (static/uploads) can be handed to the front web server with
+``STATIC_OFFLOAD = 'x-accel'`` (nginx ``X-Accel-Redirect``) or ``'x-sendfile'``
+(Apache/lighttpd ``X-Sendfile``), so no worker is held while the bytes are
+sent. The worker still answers conditional requests with 304 itself; the
+front server takes care of ranges. Otherwise they go through ``send_file``,
+which supports conditional and range requests and uses the server's
+``wsgi.file_wrapper`` (sendfile) when there is one.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import sys
+import zlib
+
+from flask import abort, request, send_from_directory
+from werkzeug.security import safe_join
+from werkzeug.wrappers import Response
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+SOURCE_DIRS = ['css']
+IMMUTABLE_MAX_AGE = 31536000
+UPLOADS_DIR = 'uploads'
+OFFLOAD_HEADERS = {'x-accel': 'X-Accel-Redirect', 'x-sendfile': 'X-Sendfile'}
+
+_COMMENT_RE = re.compile(r'/\*.*?\*/', re.S)
+_WHITESPACE_RE = re.compile(r'\s+')
+_PUNCTUATION_RE = re.compile(r'\s*([{};,>])\s*')
+_STYLE_TAG_RE = re.compile(r'<style[\s>]', re.I)
+
+
+def adler32(path):
+    """Checksum of a path as werkzeug's send_file puts it into ETags"""
+    return zlib.adler32(path.encode()) & 0xFFFFFFFF
+
+
+def minify_css(css):
+    """Strip comments and redundant whitespace from a stylesheet"""
+    css = _COMMENT_RE.sub('', css)
+    css = _WHITESPACE_RE.sub(' ', css)
+    css = _PUNCTUATION_RE.sub(r'\1', css)
+    css = re.sub(r':\s+', ':', css)
+    css = css.replace(';}', '}')
+    return css.strip()
+
+
+def find_inline_styles(template_folder):
+    """Templates that still carry their own <style> blocks"""
+    found = []
+    for root, _, files in os.walk(template_folder):
+        for filename in files:
+            if not filename.endswith('.html'):
+                continue
+            path = os.path.join(root, filename)
+            with open(path, encoding='utf-8') as f:
+                if _STYLE_TAG_RE.search(f.read()):
+                    found.append(os.path.relpath(path, template_folder))
+    return sorted(found)
+
+
+def _write(path, data):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def build(static_folder, template_folder=None):
+    """Minify, fingerprint and precompress stylesheets, returns the manifest"""
+    if template_folder:
+        inline = find_inline_styles(template_folder)
+        if inline:
+            print("Inline <style> blocks found, move them to static/css: " + ', '.join(inline))
+
+    dist_folder = os.path.join(static_folder, DIST_DIR)
+    manifest = {}
+    for source_dir in SOURCE_DIRS:
+        source_folder = os.path.join(static_folder, source_dir)
+        if not os.path.isdir(source_folder):
+            continue
+        os.makedirs(os.path.join(dist_folder, source_dir), exist_ok=True)
+        for filename in sorted(os.listdir(source_folder)):
+            if not filename.endswith('.css'):
+                continue
+            with open(os.path.join(source_folder, filename), encoding='utf-8') as f:
+                data = minify_css(f.read()).encode('utf-8')
+            digest = hashlib.sha256(data).hexdigest()[:10]
+            name, ext = os.path.splitext(filename)
+            built_name = f'{source_dir}/{name}.{digest}{ext}'
+            built_path = os.path.join(dist_folder, built_name)
+            _write(built_path, data)
+            _write(built_path + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+            if brotli is not None:
+                _write(built_path + '.br', brotli.compress(data, quality=11))
+            manifest[f'{source_dir}/{filename}'] = f'{DIST_DIR}/{built_name}'
+
+    _write(os.path.join(dist_folder, MANIFEST_NAME), json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    return manifest
+
+
+class StaticAssets:
+    """Manifest-aware url_for('static') and immutable, precompressed serving"""
+
+    def __init__(self, app=None):
+        self.manifest = {}
+        self.fingerprinted = set()
+        self.static_folder = None
+        self.offload = None
+        self.accel_prefix = '/protected-uploads/'
+        self.uploads_max_age = 86400
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.static_folder = app.static_folder
+        self.offload = (app.config.get('STATIC_OFFLOAD') or '').lower() or None
+        if self.offload and self.offload not in OFFLOAD_HEADERS:
+            raise ValueError(f"STATIC_OFFLOAD must be one of {', '.join(OFFLOAD_HEADERS)}")
+        self.accel_prefix = app.config.get('STATIC_ACCEL_PREFIX', self.accel_prefix)
+        self.uploads_max_age = app.config.get('UPLOADS_MAX_AGE', self.uploads_max_age)
+        self.load_manifest()
+        app.url_defaults(self._rewrite_static_url)
+        app.view_functions['static'] = self.serve_static
+        app.extensions['static_assets'] = self
+
+        @app.cli.command('build-assets')
+        def build_assets_command():
+            """Minify, fingerprint and precompress static assets"""
+            manifest = build(app.static_folder, app.template_folder and os.path.join(app.root_path, app.template_folder))
+            self.load_manifest()
+            print(f"Built {len(manifest)} assets")
+
+    def load_manifest(self):
+        path = os.path.join(self.static_folder, DIST_DIR, MANIFEST_NAME)
+        try:
+            with open(path) as f:
+                self.manifest = json.load(f)
+        except (OSError, ValueError):
+            self.manifest = {}
+        self.fingerprinted = set(self.manifest.values())
+
+    def _rewrite_static_url(self, endpoint, values):
+        if endpoint == 'static' and self.manifest:
+            filename = values.get('filename')
+            if filename in self.manifest:
+                values['filename'] = self.manifest[filename]
+
+    def serve_static(self, filename):
+        if filename.startswith(UPLOADS_DIR + '/'):
+            return self.serve_upload(filename)
+        if filename not in self.fingerprinted:
+            return send_from_directory(self.static_folder, filename)
+
+        accepted = request.accept_encodings
+        encoding = None
+        served = filename
+        for candidate, ext in (('br', '.br'), ('gzip', '.gz')):
+            if accepted[candidate] and os.path.isfile(os.path.join(self.static_folder, filename + ext)):
+                encoding, served = candidate, filename + ext
+                break
+
+        response = send_from_directory(self.static_folder, served, mimetype=mimetypes.guess_type(filename)[0],
+                                       max_age=IMMUTABLE_MAX_AGE)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+            response.headers.pop('Content-Disposition', None)
+        response.vary.add('Accept-Encoding')
+        response.cache_control.immutable = True
+        response.cache_control.public = True
+        return response
+
+    def serve_upload(self, filename):
+        if not self.offload:
+            return send_from_directory(self.static_folder, filename, max_age=self.uploads_max_age)
+
+        path = safe_join(self.static_folder, filename)
+        try:
+            stat = os.stat(path) if path else None
+        except OSError:
+            stat = None
+        if stat is None or not os.path.isfile(path):
+            abort(404)
+
+        # Same validator format as send_file, so switching modes keeps client caches valid
+        response = Response(mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+        response.last_modified = int(stat.st_mtime)
+        response.set_etag(f"{stat.st_mtime}-{stat.st_size}-{adler32(path)}")
+        response.cache_control.public = True
+        response.cache_control.max_age = self.uploads_max_age
+        response.headers['Accept-Ranges'] = 'bytes'
+        response.make_conditional(request)
+        if response.status_code == 304:
+            return response
+
+        if self.offload == 'x-accel':
+            response.headers['X-Accel-Redirect'] = self.accel_prefix.rstrip('/') + '/' + filename[len(UPLOADS_DIR) + 1:]
+        else:
+            response.headers['X-Sendfile'] = os.path.abspath(path)
+        return response
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2 or sys.argv[1] != 'build':
+        print("Usage: python assets.py build")
+        sys.exit(1)
+    root = os.path.dirname(os.path.abspath(__file__))
+    manifest = build(os.path.join(root, 'static'), os.path.join(root, 'templates'))
+    print(f"Built {len(manifest)} assets")
@@ -0,0 +1,132 @@
+"""
+Online backups of the SQLite database.
+
+``create_backup`` copies the live database with SQLite's online backup API a
+few pages at a time, sleeping between steps, so writers only ever wait for
+one small step. The copy is integrity-checked, gzipped and written next to a
+``.sha256`` file in ``sha256sum`` format. Old snapshots are rotated out.
+``restore_backup`` checks the checksum and the integrity of a snapshot before
+copying it back over the live database, again through the backup API.
+"""
+import gzip
+import hashlib
+import os
+import shutil
+import sqlite3
+import tempfile
+from datetime import datetime
+
+PREFIX = 'wishlist-'
+SUFFIX = '.db.gz'
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _integrity_check(path):
+    conn = sqlite3.connect(path)
+    try:
+        result = conn.execute('PRAGMA integrity_check').fetchone()[0]
+    finally:
+        conn.close()
+    if result != 'ok':
+        raise ValueError(f'Integrity check failed: {result}')
+
+
+def _copy(source_path, target_path, pages, sleep):
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(target_path)
+    try:
+        source.backup(target, pages=pages, sleep=sleep)
+    finally:
+        target.close()
+        source.close()
+
+
+def list_backups(backup_dir):
+    """Snapshot paths, newest first"""
+    try:
+        names = os.listdir(backup_dir)
+    except FileNotFoundError:
+        return []
+    return sorted((os.path.join(backup_dir, name) for name in names
+                   if name.startswith(PREFIX) and name.endswith(SUFFIX)), reverse=True)
+
+
+def create_backup(db_path, backup_dir, pages=256, sleep=0.05, keep=14):
+    """Snapshot the database into backup_dir and rotate old snapshots; returns the snapshot path"""
+    os.makedirs(backup_dir, exist_ok=True)
+    name = f"{PREFIX}{datetime.utcnow().strftime('%Y%m%dT%H%M%S_%f')}{SUFFIX}"
+    path = os.path.join(backup_dir, name)
+
+    fd, raw_path = tempfile.mkstemp(dir=backup_dir, suffix='.db.part')
+    os.close(fd)
+    gz_part = path + '.part'
+    try:
+        _copy(db_path, raw_path, pages, sleep)
+        _integrity_check(raw_path)
+        with open(raw_path, 'rb') as src, gzip.open(gz_part, 'wb', compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        checksum = _sha256(gz_part)
+        os.replace(gz_part, path)
+        with open(path + '.sha256', 'w') as f:
+            f.write(f'{checksum}  {name}\n')
+    finally:
+        for leftover in (raw_path, gz_part):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+
+    for old in list_backups(backup_dir)[keep:]:
+        for stale in (old, old + '.sha256'):
+            if os.path.exists(stale):
+                os.remove(stale)
+    return path
+
+
+def verify_backup(path, target_path=None):
+    """
+    Check a snapshot's checksum and decompress it, then run an integrity check.
+    The database is decompressed to `target_path`, or to a temporary file that
+    is removed again. Raises ValueError when the snapshot is damaged.
+    """
+    with open(path + '.sha256') as f:
+        expected = f.read().split()[0]
+    if _sha256(path) != expected:
+        raise ValueError(f'Checksum mismatch for {os.path.basename(path)}')
+
+    keep = target_path is not None
+    if not keep:
+        fd, target_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+    try:
+        with gzip.open(path, 'rb') as src, open(target_path, 'wb') as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        _integrity_check(target_path)
+    except (OSError, EOFError, sqlite3.DatabaseError) as e:
+        os.remove(target_path)
+        raise ValueError(f'Snapshot {os.path.basename(path)} is unreadable: {e}')
+    except ValueError:
+        os.remove(target_path)
+        raise
+    if not keep:
+        os.remove(target_path)
+    return target_path if keep else None
+
+
+def restore_backup(path, db_path, pages=256, sleep=0.05, before_copy=None):
+    """Verify a snapshot and copy it over the live database, calling `before_copy()` in between"""
+    fd, restored_path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    try:
+        verify_backup(path, restored_path)
+        if before_copy is not None:
+            before_copy()
+        _copy(restored_path, db_path, pages, sleep)
+    finally:
+        if os.path.exists(restored_path):
+            os.remove(restored_path)
@@ -0,0 +1,124 @@
+"""
+Micro-benchmark of the list pages' read path: ORM objects versus the Core
+selects of app.py, on a scratch database with large lists.
+
+    python bench_read_path.py [gifts per child] [rounds]
+
+For each page it prints the median time per view and the memory allocated
+while building it (tracemalloc peak), for both ways of loading the rows.
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+_tmpdir = tempfile.mkdtemp(prefix='wishlist-bench-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_tmpdir, 'bench.db')
+os.environ['SCHEDULER_ENABLED'] = 'false'
+os.environ['PROFILER_DIR'] = os.path.join(_tmpdir, 'profiles')
+os.environ['JINJA_CACHE_DIR'] = os.path.join(_tmpdir, 'jinja_cache')
+
+from flask import render_template, session  # noqa: E402
+
+import app as wishlist  # noqa: E402
+from app import app, db, Family, Child, Gift  # noqa: E402
+from cache import ChildSnapshot, GiftSnapshot  # noqa: E402
+from ranking import spread  # noqa: E402
+
+CHILDREN = 4
+
+
+def seed(gifts_per_child):
+    family = Family(name='Bench', password_hash='x')
+    db.session.add(family)
+    db.session.flush()
+    children = [Child(name=f'Dieťa {n}', family_id=family.id) for n in range(CHILDREN)]
+    db.session.add_all(children)
+    db.session.flush()
+    ranks = spread(gifts_per_child)
+    for child in children:
+        db.session.add_all([Gift(
+            name=f'Darček {n}', description='Popis darčeka, ktorý je dlhší ako päťdesiat znakov. ' * 4,
+            link=f'https://example.com/{n}', image_url=f'https://example.com/{n}.jpg', price_range='20-30 €',
+            is_purchased=n % 3 == 0, purchased_by='Babka' if n % 3 == 0 else None, child_id=child.id, rank=ranks[n],
+        ) for n in range(gifts_per_child)])
+    db.session.commit()
+    return family.id, children[0].id
+
+
+def orm_admin_gifts(family_id, child_id):
+    """admin_child_gifts as it loaded rows before the Core read path"""
+    child = Child.query.filter_by(id=child_id, family_id=family_id).first_or_404()
+    siblings = Child.query.filter(Child.family_id == family_id, Child.id != child_id).order_by(Child.name).all()
+    gifts = Gift.query.filter(Gift.child_id == child_id).order_by(Gift.rank).all()
+    filters = {'max_price': None, 'available': False, 'sort': ''}
+    return render_template('admin/gifts.html', child=child, siblings=siblings, filters=filters, gifts=gifts)
+
+
+def core_admin_gifts(family_id, child_id):
+    return app.view_functions['admin_child_gifts'](child_id=child_id)
+
+
+def orm_snapshot(family_id, child_id):
+    """build_family_snapshot as it loaded rows before the Core read path"""
+    children = Child.query.filter_by(family_id=family_id).order_by(Child.name).all()
+    gifts = Gift.query.join(Child).filter(Child.family_id == family_id).order_by(
+        Gift.is_purchased, Gift.rank, Gift.created_at
+    ).all()
+    gifts_by_child = {}
+    for gift in gifts:
+        gifts_by_child.setdefault(gift.child_id, []).append(GiftSnapshot(
+            gift.id, gift.name, gift.description, gift.link, gift.link2, gift.image_url,
+            gift.price_range, bool(gift.is_purchased), gift.purchased_by, gift.child_id, gift.created_at,
+            gift.image_status
+        ))
+    return tuple(
+        ChildSnapshot(child.id, child.name, child.age, tuple(gifts_by_child.get(child.id, ())))
+        for child in children
+    )
+
+
+def core_snapshot(family_id, child_id):
+    return wishlist.build_family_snapshot(family_id)
+
+
+def measure(view, family_id, child_id, rounds):
+    times, peaks = [], []
+    for _ in range(rounds):
+        db.session.remove()
+        start = time.perf_counter()
+        view(family_id, child_id)
+        times.append(time.perf_counter() - start)
+    for _ in range(3):
+        db.session.remove()
+        tracemalloc.start()
+        view(family_id, child_id)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return statistics.median(times), statistics.median(peaks)
+
+
+def main():
+    gifts_per_child = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    app.config.update(SERVER_NAME='localhost', WTF_CSRF_ENABLED=False)
+    with app.test_request_context():
+        db.drop_all()
+        db.create_all()
+        family_id, child_id = seed(gifts_per_child)
+        session.update(family_id=family_id, admin_id=1)
+
+        print(f"{CHILDREN} children x {gifts_per_child} gifts, median of {rounds} rounds")
+        for page, orm_view, core_view in (('admin_child_gifts', orm_admin_gifts, core_admin_gifts),
+                                          ('family snapshot', orm_snapshot, core_snapshot)):
+            orm_time, orm_peak = measure(orm_view, family_id, child_id, rounds)
+            core_time, core_peak = measure(core_view, family_id, child_id, rounds)
+            print(f"{page:18} ORM  {orm_time * 1000:8.1f} ms {orm_peak / 1024:9.0f} KiB")
+            print(f"{'':18} Core {core_time * 1000:8.1f} ms {core_peak / 1024:9.0f} KiB"
+                  f"  ({core_time / orm_time:.0%} time, {core_peak / orm_peak:.0%} memory)")
+
+
+if __name__ == '__main__':
+    main()
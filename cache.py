@@ -0,0 +1,162 @@
+"""
+Per-worker cache of immutable family snapshots.
+
+A snapshot is a tuple of ``ChildSnapshot`` rows, each carrying its gifts as
+``GiftSnapshot`` tuples, so templates can render them without touching the
+ORM. Entries are keyed by ``(family_id, version)``; the version is bumped in
+the same transaction as every change to the family's lists, which makes a
+stale entry unreachable rather than something that has to be found and
+deleted. Local eviction on change only frees memory early.
+
+An optional backend shares snapshots between worker processes. The bundled
+``SQLiteCacheBackend`` keeps them in a local SQLite file, so nothing external
+is required.
+"""
+import pickle
+import sqlite3
+import threading
+from collections import OrderedDict, namedtuple
+
+ChildSnapshot = namedtuple('ChildSnapshot', ['id', 'name', 'age', 'gifts'])
+GiftSnapshot = namedtuple('GiftSnapshot', [
+    'id', 'name', 'description', 'link', 'link2', 'image_url', 'price_range',
+    'is_purchased', 'purchased_by', 'child_id', 'created_at', 'image_status',
+])
+
+
+class SQLiteCacheBackend:
+    """Snapshots pickled into a SQLite file shared by all workers on a host"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connection()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS snapshot ('
+            'family_id INTEGER NOT NULL, version INTEGER NOT NULL, value BLOB NOT NULL, '
+            'PRIMARY KEY (family_id, version))'
+        )
+        conn.commit()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1.0)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def reopen(self):
+        """Forget connections inherited from a parent process; new ones open on first use"""
+        self._local = threading.local()
+
+    def get(self, family_id, version):
+        try:
+            row = self._connection().execute(
+                'SELECT value FROM snapshot WHERE family_id = ? AND version = ?', (family_id, version)
+            ).fetchone()
+        except sqlite3.Error:
+            return None
+        if row is None:
+            return None
+        try:
+            return pickle.loads(row[0])
+        except Exception:
+            return None  # written by an older snapshot layout, rebuild it
+
+    def set(self, family_id, version, value):
+        conn = self._connection()
+        try:
+            with conn:
+                conn.execute('DELETE FROM snapshot WHERE family_id = ? AND version < ?', (family_id, version))
+                conn.execute(
+                    'INSERT OR REPLACE INTO snapshot (family_id, version, value) VALUES (?, ?, ?)',
+                    (family_id, version, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+                )
+        except sqlite3.Error as e:
+            print(f"Snapshot cache backend write failed: {e}")
+
+    def delete(self, family_id):
+        try:
+            with self._connection() as conn:
+                conn.execute('DELETE FROM snapshot WHERE family_id = ?', (family_id,))
+        except sqlite3.Error as e:
+            print(f"Snapshot cache backend delete failed: {e}")
+
+    def clear(self):
+        with self._connection() as conn:
+            conn.execute('DELETE FROM snapshot')
+
+
+class FamilySnapshotCache:
+    """LRU of family snapshots with an optional shared backend"""
+
+    def __init__(self, maxsize=256, backend=None):
+        self.maxsize = maxsize
+        self.backend = backend
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.backend_hits = 0
+        self.misses = 0
+
+    def get(self, family_id, version, loader):
+        """Snapshot for `family_id` at `version`, calling `loader()` to build it on a miss"""
+        key = (family_id, version)
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+
+        value = self.backend.get(family_id, version) if self.backend else None
+        if value is not None:
+            with self._lock:
+                self.backend_hits += 1
+        else:
+            value = loader()
+            with self._lock:
+                self.misses += 1
+            if self.backend:
+                self.backend.set(family_id, version, value)
+
+        with self._lock:
+            for stale in [k for k in self._entries if k[0] == family_id and k[1] < version]:
+                del self._entries[stale]
+            self._entries[key] = value
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, family_id):
+        """Drop local entries of a family; the version bump makes them unreachable anyway"""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == family_id]:
+                del self._entries[key]
+
+    def forget(self, family_id):
+        """Drop a family's entries here and in the shared backend, for families that are deleted"""
+        self.invalidate(family_id)
+        if self.backend:
+            self.backend.delete(family_id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.backend:
+            self.backend.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.backend_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'backend_hits': self.backend_hits,
+                'misses': self.misses,
+                'hit_ratio': round((self.hits + self.backend_hits) / lookups, 3) if lookups else None,
+                'backend': type(self.backend).__name__ if self.backend else None,
+            }
@@ -0,0 +1,102 @@
+"""
+Negotiated gzip/brotli compression of dynamic responses.
+
+HTML and JSON responses above COMPRESS_MIN_SIZE are compressed with the best
+encoding the client accepts. Streamed responses are compressed chunk by chunk
+and flushed after every chunk, so progressive rendering still reaches the
+browser early. Brotli is used only when the optional ``brotli`` package is
+installed.
+"""
+import gzip
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+
+def _gzip_stream(chunks, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _brotli_stream(chunks, quality):
+    compressor = brotli.Compressor(quality=quality)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        data = compressor.process(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class ResponseCompression:
+    """Flask extension compressing text responses in an after_request hook"""
+
+    def __init__(self, app=None):
+        self.min_size = 500
+        self.mimetypes = {'text/html', 'application/json'}
+        self.gzip_level = 6
+        self.brotli_quality = 4
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.min_size = int(app.config.get('COMPRESS_MIN_SIZE', self.min_size))
+        self.mimetypes = set(app.config.get('COMPRESS_MIMETYPES', self.mimetypes))
+        self.gzip_level = int(app.config.get('COMPRESS_LEVEL', self.gzip_level))
+        self.brotli_quality = int(app.config.get('COMPRESS_BR_QUALITY', self.brotli_quality))
+        if app.config.get('COMPRESS_ENABLED', True):
+            app.after_request(self.compress)
+        app.extensions['compression'] = self
+
+    def _choose_encoding(self):
+        accepted = request.accept_encodings
+        if brotli is not None and accepted['br']:
+            return 'br'
+        if accepted['gzip']:
+            return 'gzip'
+        return None
+
+    def compress(self, response):
+        if response.mimetype not in self.mimetypes:
+            return response
+        if response.status_code < 200 or response.status_code in (204, 304) or request.method == 'HEAD':
+            return response
+        if response.direct_passthrough or 'Content-Encoding' in response.headers:
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = self._choose_encoding()
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            if encoding == 'br':
+                response.response = _brotli_stream(response.response, self.brotli_quality)
+            else:
+                response.response = _gzip_stream(response.response, self.gzip_level)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < self.min_size:
+                return response
+            if encoding == 'br':
+                response.set_data(brotli.compress(data, quality=self.brotli_quality))
+            else:
+                response.set_data(gzip.compress(data, compresslevel=self.gzip_level))
+
+        response.headers['Content-Encoding'] = encoding
+        if response.headers.get('ETag', '').startswith('"'):
+            response.headers['ETag'] = 'W/' + response.headers['ETag']
+        return response
@@ -0,0 +1,214 @@
+"""
+Background enrichment of gift links.
+
+``MetadataFetcher`` downloads a shop page (with a per-host rate limit, a
+timeout and a size cap) and ``parse_metadata`` pulls title, image and price
+out of its OpenGraph tags and JSON-LD blocks. ``BackgroundPool`` runs the
+enrichment jobs on a small bounded thread pool inside an application context,
+so none of this happens on the request path. Requests go through the shared
+``outbound`` client.
+"""
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+from urllib.parse import parse_qsl, urlencode, urljoin, urlparse, urlunparse
+
+from outbound import OutboundClient, is_public_host
+
+TRACKING_PARAMS = {'fbclid', 'gclid', 'dclid', 'msclkid', 'mc_cid', 'mc_eid', 'ref', 'ref_'}
+
+
+def canonical_url(url):
+    """Normalize a URL so the same product page maps to one cache key"""
+    parsed = urlparse(url.strip())
+    scheme = parsed.scheme.lower()
+    host = (parsed.hostname or '').lower()
+    port = parsed.port
+    netloc = host if port is None or (scheme, port) in (('http', 80), ('https', 443)) else f'{host}:{port}'
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parsed.query, keep_blank_values=True)
+        if not key.lower().startswith('utm_') and key.lower() not in TRACKING_PARAMS
+    )
+    return urlunparse((scheme, netloc, parsed.path or '/', '', urlencode(query), ''))
+
+
+class _MetadataParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.meta = {}
+        self.json_ld = []
+        self.title = None
+        self._in_json_ld = False
+        self._in_title = False
+        self._buffer = []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'meta':
+            key = (attrs.get('property') or attrs.get('name') or attrs.get('itemprop') or '').lower()
+            if key and attrs.get('content') and key not in self.meta:
+                self.meta[key] = attrs['content'].strip()
+        elif tag == 'script' and (attrs.get('type') or '').lower() == 'application/ld+json':
+            self._in_json_ld = True
+            self._buffer = []
+        elif tag == 'title' and self.title is None:
+            self._in_title = True
+            self._buffer = []
+
+    def handle_data(self, data):
+        if self._in_json_ld or self._in_title:
+            self._buffer.append(data)
+
+    def handle_endtag(self, tag):
+        if tag == 'script' and self._in_json_ld:
+            self._in_json_ld = False
+            self.json_ld.append(''.join(self._buffer))
+        elif tag == 'title' and self._in_title:
+            self._in_title = False
+            self.title = ' '.join(''.join(self._buffer).split())
+
+
+def _json_ld_products(blocks):
+    for block in blocks:
+        try:
+            data = json.loads(block)
+        except ValueError:
+            continue
+        stack = [data]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, list):
+                stack.extend(item)
+            elif isinstance(item, dict):
+                types = item.get('@type')
+                types = types if isinstance(types, list) else [types]
+                if 'Product' in types:
+                    yield item
+                if '@graph' in item:
+                    stack.append(item['@graph'])
+
+
+def parse_metadata(html, base_url):
+    """Title, image, price and currency from OpenGraph tags and JSON-LD"""
+    parser = _MetadataParser()
+    try:
+        parser.feed(html)
+    except Exception:
+        pass
+    meta = parser.meta
+    result = {
+        'title': meta.get('og:title') or meta.get('twitter:title'),
+        'image': meta.get('og:image') or meta.get('og:image:url') or meta.get('twitter:image'),
+        'price': meta.get('product:price:amount') or meta.get('og:price:amount') or meta.get('price'),
+        'currency': meta.get('product:price:currency') or meta.get('og:price:currency') or meta.get('pricecurrency'),
+    }
+
+    for product in _json_ld_products(parser.json_ld):
+        result['title'] = result['title'] or product.get('name')
+        image = product.get('image')
+        if isinstance(image, list):
+            image = image[0] if image else None
+        if isinstance(image, dict):
+            image = image.get('url')
+        result['image'] = result['image'] or image
+        offers = product.get('offers')
+        if isinstance(offers, list):
+            offers = offers[0] if offers else None
+        if isinstance(offers, dict):
+            result['price'] = result['price'] or offers.get('price') or offers.get('lowPrice')
+            result['currency'] = result['currency'] or offers.get('priceCurrency')
+        break
+
+    result['title'] = result['title'] or parser.title
+    if result['image']:
+        result['image'] = urljoin(base_url, str(result['image']))
+    if result['price'] is not None:
+        result['price'] = str(result['price']).strip()
+    return result
+
+
+class HostRateLimiter:
+    """Spaces out requests to the same host by at least `min_interval` seconds"""
+
+    def __init__(self, min_interval=1.0):
+        self.min_interval = min_interval
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+    def wait(self, host):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.min_interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class MetadataFetcher:
+    """Fetches a page politely and returns its parsed metadata"""
+
+    def __init__(self, client=None, max_bytes=512 * 1024, min_host_interval=1.0, allow_private=False):
+        self.client = client or OutboundClient()
+        self.max_bytes = max_bytes
+        self.allow_private = allow_private
+        self.rate_limiter = HostRateLimiter(min_host_interval)
+
+    def fetch(self, url):
+        parsed = urlparse(url)
+        if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+            raise ValueError('Unsupported URL')
+        if not self.allow_private and not is_public_host(parsed.hostname):
+            raise ValueError('Host is not publicly routable')
+
+        self.rate_limiter.wait(parsed.hostname)
+        # The head of a page carries the metadata, so a cut off body is still useful
+        # Every redirect hop is checked like the first host, so a public page cannot lead to an internal one
+        response = self.client.follow('GET', url, allow_host=None if self.allow_private else is_public_host,
+                                      max_bytes=self.max_bytes, truncate=True)
+        response.raise_for_status()
+        if 'html' not in response.headers.get('content-type', '').lower():
+            raise ValueError('Not an HTML page')
+        encoding = response.encoding or 'utf-8'
+        return parse_metadata(response.content.decode(encoding, errors='replace'), response.url)
+
+
+class BackgroundPool:
+    """Bounded thread pool running jobs inside an application context"""
+
+    def __init__(self, app=None, max_workers=2, max_pending=100):
+        self.app = app
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = None
+        self._slots = None
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args):
+        """Queue a job; returns False when the pool is full and the job was dropped"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='background')
+                self._slots = threading.BoundedSemaphore(self.max_workers + self.max_pending)
+        if not self._slots.acquire(blocking=False):
+            print(f"Background pool full, dropping {func.__name__}{args}")
+            return False
+        self._executor.submit(self._run, func, args)
+        return True
+
+    def _run(self, func, args):
+        try:
+            with self.app.app_context():
+                func(*args)
+        except Exception as e:
+            print(f"Background job {func.__name__}{args} failed: {e}")
+        finally:
+            self._slots.release()
+
+    def shutdown(self, wait=True):
+        """Stop accepting jobs and optionally wait for queued ones to finish"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
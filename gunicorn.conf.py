@@ -0,0 +1,45 @@
+"""
+Gunicorn settings for the wishlist app: ``gunicorn -c gunicorn.conf.py wsgi:app``
+(or just ``python wsgi.py``).
+
+The app is preloaded once in the master, so schema migration and template
+compilation happen a single time and workers share that memory. Each worker
+then drops the inherited database connections and starts its own scheduler.
+On a graceful reload (``kill -HUP``) or stop (``kill -TERM``) workers finish
+in-flight requests within ``graceful_timeout`` and drain queued background
+jobs before exiting.
+"""
+import multiprocessing
+import os
+
+# The master must not run the scheduler thread, it would not survive the fork
+os.environ.setdefault('SCHEDULER_AUTOSTART', 'false')
+
+bind = os.environ.get('BIND', f"0.0.0.0:{os.environ.get('PORT', 5000)}")
+
+# SQLite allows one writer at a time, so a few processes with threads beat many processes
+workers = int(os.environ.get('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, 4)))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+preload_app = True
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+
+# Recycle workers now and then so slow leaks can't accumulate
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = max_requests // 10
+
+accesslog = '-'
+errorlog = '-'
+
+
+def post_fork(server, worker):
+    from app import init_worker
+    init_worker()
+
+
+def worker_exit(server, worker):
+    from app import drain_background_work
+    drain_background_work(timeout=graceful_timeout)
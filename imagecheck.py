@@ -0,0 +1,140 @@
+"""
+Validation of image URLs typed by admins or found by link enrichment.
+
+Checks run from cheapest to most expensive and stop at the first failure:
+dangerous content (every pattern compiled into one alternation), the URL's
+shape and scheme, then the host's addresses, resolved through the shared TTL
+DNS cache of ``outbound`` and classified by ``is_public_address``. Only URLs
+without an image extension cost a HEAD request, sent after all of that
+through ``OutboundClient.follow``, which checks each redirect hop the same
+way before it is followed.
+``validate_many`` runs the offline checks for a whole batch first and the
+remaining lookups and requests concurrently, each distinct URL once.
+"""
+import re
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+
+from outbound import OutboundClient, RedirectRefused, dns_cache, is_public_address
+
+DANGEROUS_PATTERNS = (
+    r'javascript:', r'data:', r'vbscript:',
+    r'onload\s*=', r'onerror\s*=', r'onclick\s*=',
+    r'<script', r'</script>', r'<iframe', r'<object', r'<embed', r'<link', r'<meta', r'<style',
+    r'expression\s*\(', r'url\s*\(', r'@import',
+)
+_DANGEROUS = re.compile('|'.join(DANGEROUS_PATTERNS), re.IGNORECASE)
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.svg', '.bmp', '.ico')
+
+VALID = (True, None)
+
+
+class ImageURLValidator:
+    """Image URL checks returning (is_valid, error_message); empty URLs are valid"""
+
+    def __init__(self, client=None, dns=None, allow_private=False, local_prefixes=('/static/uploads/',),
+                 max_workers=8):
+        self.client = client or OutboundClient()
+        self.dns = dns or dns_cache
+        self.allow_private = allow_private
+        # Paths of images this app serves itself, such as uploads
+        self.local_prefixes = tuple(local_prefixes)
+        self.max_workers = max_workers
+
+    def check_offline(self, url):
+        """
+        Checks that need no network: (result, host, needs_probe). `result` is
+        final when it is a failure or `host` is None
+        """
+        # Local paths end up in the same attributes, so they get the dangerous-content check too
+        if _DANGEROUS.search(url):
+            return (False, "URL contains potentially dangerous content"), None, False
+        if url.startswith(self.local_prefixes) and '..' not in url:
+            return VALID, None, False
+        try:
+            parsed = urlparse(url)
+        except ValueError:
+            return (False, "Invalid URL format"), None, False
+        if parsed.scheme not in ('http', 'https'):
+            return (False, "Only HTTP and HTTPS URLs are allowed"), None, False
+        if not parsed.hostname:
+            return (False, "Invalid URL format"), None, False
+        # Catch literal addresses before any lookup
+        try:
+            if not self.allow_private and not is_public_address(parsed.hostname):
+                return (False, "Private network URLs are not allowed"), None, False
+        except ValueError:
+            pass
+        return VALID, parsed.hostname, not parsed.path.lower().endswith(IMAGE_EXTENSIONS)
+
+    def check_host(self, host, required=True):
+        """Refuses hosts resolving to non-public addresses; unresolvable ones only when `required`"""
+        if self.allow_private:
+            return VALID
+        addresses = self.dns.addresses(host)
+        if not addresses:
+            return (False, "Could not resolve image host") if required else VALID
+        if not all(is_public_address(address) for address in addresses):
+            return False, "Private network URLs are not allowed"
+        return VALID
+
+    def probe(self, url):
+        """HEAD request confirming an image content type, following redirects to public hosts only"""
+        refused = []
+
+        def allow_host(host):
+            result = self.check_host(host)
+            if not result[0]:
+                refused.append(result)
+            return result[0]
+
+        try:
+            response = self.client.follow('HEAD', url, allow_host=allow_host)
+        except RedirectRefused as e:
+            # The host check's own reason says more than the refusal
+            return refused[0] if refused else (False, f"Could not verify image URL: {str(e)}")
+        except requests.exceptions.RequestException as e:
+            return False, f"Could not verify image URL: {str(e)}"
+        if response.status_code != 200:
+            return False, f"Could not verify image (HTTP {response.status_code})"
+        if not response.headers.get('content-type', '').lower().startswith('image/'):
+            return False, "URL does not point to an image file"
+        return VALID
+
+    def _check_online(self, url, host, needs_probe, probe):
+        # A name that does not resolve cannot be probed, but a plain image link may still load for users
+        result = self.check_host(host, required=needs_probe and probe)
+        if result[0] and needs_probe and probe:
+            result = self.probe(url)
+        return result
+
+    def validate(self, url, probe=True):
+        """Validate one URL; `probe=False` skips the HEAD request"""
+        url = (url or '').strip()
+        if not url:
+            return VALID
+        result, host, needs_probe = self.check_offline(url)
+        if not result[0] or host is None:
+            return result
+        return self._check_online(url, host, needs_probe, probe)
+
+    def validate_many(self, urls, probe=True):
+        """Validate a batch of URLs, returns {url: (is_valid, error_message)} keyed by the given URLs"""
+        results, pending = {}, {}
+        for url in set(urls):
+            stripped = (url or '').strip()
+            if not stripped:
+                results[url] = VALID
+                continue
+            result, host, needs_probe = self.check_offline(stripped)
+            if not result[0] or host is None:
+                results[url] = result
+            else:
+                pending[url] = (stripped, host, needs_probe)
+        if pending:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(pending))) as executor:
+                futures = {url: executor.submit(self._check_online, *args, probe) for url, args in pending.items()}
+                results.update((url, future.result()) for url, future in futures.items())
+        return results
@@ -0,0 +1,95 @@
+"""
+Periodic re-check of stored shop links and image URLs.
+
+``LinkChecker.check_all`` runs an asyncio loop that bounds concurrency
+globally and per host. Every check is a conditional request (``If-None-Match``
+/ ``If-Modified-Since`` from the previous run), so unchanged pages answer with
+a cheap 304. The HTTP calls themselves go through the shared blocking
+``outbound`` client on a thread pool sized to the global limit; asyncio only
+does the scheduling.
+"""
+import asyncio
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+
+from outbound import OutboundClient, is_public_host
+
+OK = 'ok'
+DEAD = 'dead'
+ERROR = 'error'
+
+CheckResult = namedtuple('CheckResult', ['url', 'status', 'http_status', 'etag', 'last_modified'])
+
+
+def classify(status_code):
+    """Only answers that mean "gone" count as dead; anything else may be transient"""
+    if status_code < 400 or status_code == 304:
+        return OK
+    if status_code in (404, 410):
+        return DEAD
+    return ERROR
+
+
+class LinkChecker:
+    """Checks many URLs concurrently with global and per-host limits"""
+
+    def __init__(self, client=None, concurrency=10, per_host=2, allow_private=False):
+        self.client = client or OutboundClient()
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.allow_private = allow_private
+
+    def check_one(self, url, etag=None, last_modified=None):
+        """Blocking check of one URL, HEAD first and GET when HEAD isn't supported"""
+        host = urlparse(url).hostname
+        if not host:
+            return CheckResult(url, DEAD, None, None, None)
+        if not self.allow_private and not is_public_host(host):
+            # Private addresses are never probed, unresolvable names may be transient
+            return CheckResult(url, ERROR, None, etag, last_modified)
+
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        # Redirects are followed hop by hop, each host checked like the first
+        allow_host = None if self.allow_private else is_public_host
+        try:
+            response = self.client.follow('HEAD', url, allow_host=allow_host, headers=headers)
+            if response.status_code in (403, 405, 501):
+                # Only the status matters, the body is cut off right away
+                response = self.client.follow('GET', url, allow_host=allow_host, headers=headers,
+                                              max_bytes=0, truncate=True)
+        except requests.exceptions.RequestException:
+            return CheckResult(url, ERROR, None, etag, last_modified)
+
+        if response.status_code == 304:
+            return CheckResult(url, OK, 304, etag, last_modified)
+        return CheckResult(
+            url, classify(response.status_code), response.status_code,
+            response.headers.get('ETag'), response.headers.get('Last-Modified')
+        )
+
+    async def _check_all(self, items):
+        loop = asyncio.get_running_loop()
+        global_limit = asyncio.Semaphore(self.concurrency)
+        host_limits = {}
+
+        async def check(url, etag, last_modified):
+            host = urlparse(url).hostname or ''
+            host_limit = host_limits.setdefault(host, asyncio.Semaphore(self.per_host))
+            async with host_limit, global_limit:
+                return await loop.run_in_executor(executor, self.check_one, url, etag, last_modified)
+
+        with ThreadPoolExecutor(self.concurrency, thread_name_prefix='linkcheck') as executor:
+            return await asyncio.gather(*(check(*item) for item in items))
+
+    def check_all(self, items):
+        """Check (url, etag, last_modified) tuples, returns CheckResults in order"""
+        if not items:
+            return []
+        return asyncio.run(self._check_all(items))
@@ -0,0 +1,281 @@
+"""
+Shared client for every outbound HTTP call.
+
+One ``requests.Session`` with keep-alive pools per host is reused by all
+threads. Every request gets connect and read timeouts, bodies are read up to
+a size cap, and a per-host circuit breaker fails fast while a remote keeps
+failing instead of tying up workers on it. Host name lookups for the public
+address check are cached for a short time, and latency is recorded per host.
+``follow`` handles redirects itself so callers can vet every hop's host.
+"""
+import ipaddress
+import socket
+import threading
+import time
+from collections import deque
+from urllib.parse import urljoin, urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """The host failed too often recently and is not being called"""
+
+
+class ResponseTooLarge(requests.exceptions.RequestException):
+    """The response body is larger than allowed"""
+
+
+class RedirectRefused(requests.exceptions.RequestException):
+    """A redirect led to a host that may not be called, or there were too many"""
+
+
+MAX_REDIRECTS = 5
+
+
+class DNSCache:
+    """getaddrinfo results kept for `ttl` seconds"""
+
+    def __init__(self, ttl=300, maxsize=1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def addresses(self, host):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(host)
+            if entry and entry[0] > now:
+                return entry[1]
+        try:
+            infos = socket.getaddrinfo(host, None)
+            addresses = tuple({info[4][0].split('%')[0] for info in infos})
+        except (socket.gaierror, UnicodeError):
+            addresses = ()
+        with self._lock:
+            if len(self._entries) >= self.maxsize:
+                self._entries.clear()
+            self._entries[host] = (now + self.ttl, addresses)
+        return addresses
+
+
+dns_cache = DNSCache()
+
+
+NAT64_PREFIX = ipaddress.ip_network('64:ff9b::/96')
+LOCAL_NAT64_PREFIX = ipaddress.ip_network('64:ff9b:1::/48')
+
+
+def is_public_address(address):
+    """
+    True for a globally routable address. IPv6 addresses that carry an IPv4
+    one (mapped, 6to4, NAT64) are judged by that address, which ``is_global``
+    does not do for 6to4 and NAT64
+    """
+    ip = ipaddress.ip_address(address)
+    if ip.version == 6:
+        if ip in LOCAL_NAT64_PREFIX:
+            return False
+        if ip in NAT64_PREFIX:
+            ip = ipaddress.IPv4Address(int(ip) & 0xFFFFFFFF)
+        else:
+            ip = ip.ipv4_mapped or ip.sixtofour or ip
+    return ip.is_global
+
+
+def is_public_host(host):
+    """True when every address the host resolves to is publicly routable"""
+    addresses = dns_cache.addresses(host)
+    return bool(addresses) and all(is_public_address(address) for address in addresses)
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures, retries one call after `cooldown` seconds"""
+
+    def __init__(self, threshold=5, cooldown=30.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'half-open' if time.monotonic() - self.opened_at >= self.cooldown else 'open'
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.cooldown or self._trial:
+                return False
+            self._trial = True  # let one request through to probe the host
+            return True
+
+    def record(self, success):
+        with self._lock:
+            self._trial = False
+            if success:
+                self.failures = 0
+                self.opened_at = None
+            else:
+                self.failures += 1
+                if self.failures >= self.threshold:
+                    self.opened_at = time.monotonic()
+
+
+class HostStats:
+    """Request counters and recent latencies of one host"""
+
+    def __init__(self, window=200):
+        self.requests = 0
+        self.errors = 0
+        self.rejected = 0
+        self.latencies = deque(maxlen=window)
+
+    def summary(self):
+        latencies = sorted(self.latencies)
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'rejected': self.rejected,
+            'p50_ms': round(latencies[len(latencies) // 2] * 1000, 1) if latencies else None,
+            'p95_ms': round(latencies[int(len(latencies) * 0.95)] * 1000, 1) if latencies else None,
+            'max_ms': round(latencies[-1] * 1000, 1) if latencies else None,
+        }
+
+
+class OutboundClient:
+    """Pooled HTTP client with timeouts, size caps, circuit breaking and latency stats"""
+
+    def __init__(self, timeout=(3.05, 10), max_bytes=1024 * 1024, pool_size=10,
+                 breaker_threshold=5, breaker_cooldown=30.0, user_agent='Wishlist/1.0'):
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = user_agent
+        adapter = HTTPAdapter(pool_connections=32, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._breakers = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _host_state(self, host):
+        with self._lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker(self.breaker_threshold, self.breaker_cooldown)
+                self._stats[host] = HostStats()
+            return self._breakers[host], self._stats[host]
+
+    def request(self, method, url, max_bytes=None, truncate=False, **kwargs):
+        """
+        Send a request and read at most `max_bytes` of the body.
+        A larger body raises ResponseTooLarge, or is cut off when `truncate` is set
+        (``response.truncated`` tells which). Raises CircuitOpenError while the
+        host's breaker is open.
+        """
+        breaker, stats = self._admit(url)
+        kwargs.setdefault('timeout', self.timeout)
+        kwargs['stream'] = True
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        started = time.monotonic()
+        try:
+            response = self.session.request(method, url, **kwargs)
+            try:
+                body = b''
+                response.truncated = False
+                if method.upper() != 'HEAD':
+                    for chunk in response.iter_content(16384):
+                        body += chunk
+                        if len(body) > max_bytes:
+                            if not truncate:
+                                host = urlparse(url).hostname
+                                raise ResponseTooLarge(f'Response from {host} is larger than {max_bytes} bytes')
+                            body = body[:max_bytes]
+                            response.truncated = True
+                            break
+                response._content = body
+            finally:
+                response.close()
+        except requests.exceptions.RequestException as e:
+            # An oversized body is the remote's content, not an outage
+            self._record(breaker, stats, started, failed=not isinstance(e, ResponseTooLarge))
+            raise
+
+        self._record(breaker, stats, started, failed=response.status_code >= 500)
+        return response
+
+    async def arequest(self, client, method, url, **kwargs):
+        """
+        Send a request with an ``httpx.AsyncClient`` under the same circuit
+        breaker and stats as request(). Timeouts and limits are the client's.
+        """
+        breaker, stats = self._admit(url)
+        started = time.monotonic()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except Exception:
+            self._record(breaker, stats, started, failed=True)
+            raise
+        self._record(breaker, stats, started, failed=response.status_code >= 500)
+        return response
+
+    def _admit(self, url):
+        """The host's breaker and stats; raises CircuitOpenError while the breaker is open"""
+        host = urlparse(url).hostname or ''
+        breaker, stats = self._host_state(host)
+        if not breaker.allow():
+            with self._lock:
+                stats.rejected += 1
+            raise CircuitOpenError(f'{host} is failing, not calling it for now')
+        return breaker, stats
+
+    def _record(self, breaker, stats, started, failed):
+        breaker.record(not failed)
+        with self._lock:
+            stats.requests += 1
+            stats.errors += failed
+            stats.latencies.append(time.monotonic() - started)
+
+    def follow(self, method, url, allow_host=None, max_redirects=MAX_REDIRECTS, **kwargs):
+        """
+        request() with redirects followed here rather than by requests, so
+        that every hop's host is passed to `allow_host` before it is called.
+        Raises RedirectRefused for a refused hop or more than `max_redirects`
+        """
+        for _ in range(max_redirects + 1):
+            response = self.request(method, url, allow_redirects=False, **kwargs)
+            if not response.is_redirect:
+                return response
+            url = urljoin(url, response.headers['Location'])
+            parsed = urlparse(url)
+            if parsed.scheme not in ('http', 'https') or not parsed.hostname or (
+                    allow_host is not None and not allow_host(parsed.hostname)):
+                raise RedirectRefused(f'Redirect to {parsed.hostname or url} refused')
+        raise RedirectRefused(f'More than {max_redirects} redirects')
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.request('HEAD', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def stats(self):
+        """Per-host counters, latency percentiles and breaker state"""
+        with self._lock:
+            hosts = list(self._stats)
+            return {
+                host: dict(self._stats[host].summary(), breaker=self._breakers[host].state)
+                for host in hosts
+            }
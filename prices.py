@@ -0,0 +1,55 @@
+"""
+Parsing of free-text gift prices.
+
+``parse_price`` turns what admins type into the price field ("50 €",
+"20-30", "približne 1 299 Kč", "do 40 EUR", "$10–$20") into
+``(price_min, price_max, currency)``. A single amount gives equal bounds,
+"do"/"max" gives an upper bound from 0 and "od"/"from" only a lower one.
+Anything without a number parses to ``(None, None, None)``; the text itself
+stays what is shown to users.
+"""
+import re
+
+CURRENCIES = {
+    '€': 'EUR', 'eur': 'EUR', 'eura': 'EUR', 'euro': 'EUR',
+    '$': 'USD', 'usd': 'USD',
+    '£': 'GBP', 'gbp': 'GBP',
+    'kč': 'CZK', 'czk': 'CZK', 'kc': 'CZK',
+}
+
+_NUMBER = re.compile(r'\d{1,3}(?:[ \u00a0.]\d{3})+(?:,\d{1,2})?(?!\d)|\d+(?:[.,]\d+)?')
+_CURRENCY = re.compile(r'€|\$|£|\b(?:eura?|euro|usd|gbp|czk|kč|kc)\b', re.IGNORECASE)
+_UP_TO = re.compile(r'\b(?:do|max|maximálne|up to|under|pod)\b', re.IGNORECASE)
+_FROM = re.compile(r'\b(?:od|min|minimálne|from|over|nad)\b', re.IGNORECASE)
+
+
+def _amount(text):
+    text = text.replace(' ', '').replace('\u00a0', '')
+    if ',' in text and '.' in text:
+        # The later separator is the decimal one
+        decimal, thousands = (',', '.') if text.rfind(',') > text.rfind('.') else ('.', ',')
+        text = text.replace(thousands, '').replace(decimal, '.')
+    elif ',' in text:
+        text = text.replace(',', '.')
+    elif re.fullmatch(r'\d{1,3}(?:\.\d{3})+', text):
+        text = text.replace('.', '')
+    return float(text)
+
+
+def parse_price(text):
+    """(price_min, price_max, currency code) of a price text; parts that cannot be told are None"""
+    if not text:
+        return None, None, None
+    amounts = [_amount(match) for match in _NUMBER.findall(text)]
+    if not amounts:
+        return None, None, None
+    currency = _CURRENCY.search(text)
+    currency = CURRENCIES.get(currency.group(0).lower()) if currency else None
+
+    low, high = min(amounts[:2]), max(amounts[:2])
+    if len(amounts) == 1:
+        if _UP_TO.search(text):
+            low = 0.0
+        elif _FROM.search(text):
+            high = None
+    return low, high, currency
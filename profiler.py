@@ -0,0 +1,247 @@
+"""
+On-demand sampling profiler for live requests.
+
+A request is profiled when it carries a valid signed ``X-Profile`` header or
+when it is picked by the sample rate a superadmin switched on. While a request
+is profiled a helper thread samples the stack of the worker thread that serves
+it and the result is written as collapsed stacks (``frame;frame;frame count``),
+which flamegraph.pl and speedscope read directly.
+
+When nothing is switched on the only cost per request is a header lookup and a
+float comparison.
+"""
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from flask import g, request
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from werkzeug.utils import secure_filename
+
+CONTROL_FILE = '_control.json'
+CONTROL_REFRESH_SECONDS = 2.0
+
+
+def collapse_stack(frame):
+    """Turn a frame into a collapsed stack line, outermost frame first"""
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+        frame = frame.f_back
+    frames.reverse()
+    return ';'.join(frames)
+
+
+class RequestSampler:
+    """Samples the stack of a single thread from a helper thread"""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profiler-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[collapse_stack(frame)] += 1
+
+
+class SamplingProfiler:
+    """Flask extension that profiles selected requests into PROFILER_DIR"""
+
+    def __init__(self, app=None):
+        self.directory = None
+        self.interval = 0.005
+        self.max_profiles = 50
+        self.header = 'X-Profile'
+        self.token_max_age = 3600
+        self.sample_rate = 0.0
+        self.endpoint = None
+        self.expires_at = 0.0
+        self._serializer = None
+        self._control_checked = 0.0
+        self._control_mtime = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.directory = app.config.get('PROFILER_DIR') or os.path.join(app.instance_path, 'profiles')
+        self.interval = float(app.config.get('PROFILER_INTERVAL', self.interval))
+        self.max_profiles = int(app.config.get('PROFILER_MAX_PROFILES', self.max_profiles))
+        self.header = app.config.get('PROFILER_HEADER', self.header)
+        self.token_max_age = int(app.config.get('PROFILER_TOKEN_MAX_AGE', self.token_max_age))
+        self._serializer = URLSafeTimedSerializer(app.config['SECRET_KEY'], salt='request-profiler')
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+        app.extensions['profiler'] = self
+
+    # Triggering
+
+    def make_token(self):
+        """Signed value for the profiling header, valid for PROFILER_TOKEN_MAX_AGE"""
+        return self._serializer.dumps('profile')
+
+    def _valid_token(self, token):
+        try:
+            return self._serializer.loads(token, max_age=self.token_max_age) == 'profile'
+        except BadSignature:
+            return False
+
+    def configure(self, sample_rate, endpoint=None, minutes=10):
+        """Switch rate based sampling on for all workers sharing PROFILER_DIR"""
+        os.makedirs(self.directory, exist_ok=True)
+        control = {
+            'sample_rate': max(0.0, min(float(sample_rate), 1.0)),
+            'endpoint': endpoint or None,
+            'expires_at': time.time() + minutes * 60,
+        }
+        path = os.path.join(self.directory, CONTROL_FILE)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(control, f)
+        os.replace(tmp_path, path)
+        self._control_checked = 0.0
+
+    def settings(self):
+        self._refresh_control()
+        active = self.sample_rate > 0 and self.expires_at > time.time()
+        return {
+            'sample_rate': self.sample_rate if active else 0.0,
+            'endpoint': self.endpoint,
+            'expires_at': datetime.fromtimestamp(self.expires_at) if active else None,
+        }
+
+    def _refresh_control(self):
+        """Re-read the control file at most every CONTROL_REFRESH_SECONDS"""
+        now = time.monotonic()
+        if now - self._control_checked < CONTROL_REFRESH_SECONDS:
+            return
+        with self._lock:
+            self._control_checked = now
+            path = os.path.join(self.directory, CONTROL_FILE)
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                self.sample_rate = 0.0
+                self._control_mtime = None
+                return
+            if mtime == self._control_mtime:
+                return
+            try:
+                with open(path) as f:
+                    control = json.load(f)
+            except (OSError, ValueError):
+                return
+            self._control_mtime = mtime
+            self.endpoint = control.get('endpoint')
+            self.expires_at = float(control.get('expires_at', 0))
+            self.sample_rate = float(control.get('sample_rate', 0))
+
+    def _should_profile(self):
+        token = request.headers.get(self.header)
+        if token is not None:
+            return self._valid_token(token)
+        self._refresh_control()
+        if not self.sample_rate or self.expires_at < time.time():
+            return False
+        if self.endpoint and request.endpoint != self.endpoint:
+            return False
+        return random.random() < self.sample_rate
+
+    # Request hooks
+
+    def _before_request(self):
+        if self.header not in request.headers and not self.sample_rate and \
+                time.monotonic() - self._control_checked < CONTROL_REFRESH_SECONDS:
+            return
+        if not self._should_profile():
+            return
+        sampler = RequestSampler(threading.get_ident(), self.interval)
+        g._profiler = (sampler, time.perf_counter())
+        sampler.start()
+
+    def _teardown_request(self, exc):
+        state = g.pop('_profiler', None)
+        if state is None:
+            return
+        sampler, started = state
+        stacks = sampler.stop()
+        try:
+            self._write_profile(stacks, time.perf_counter() - started)
+        except OSError as e:
+            print(f"Profiler could not write profile: {e}")
+
+    # Storage
+
+    def _write_profile(self, stacks, duration):
+        os.makedirs(self.directory, exist_ok=True)
+        now = datetime.utcnow()
+        name = secure_filename(
+            f"{now.strftime('%Y%m%dT%H%M%S%f')}-{request.endpoint or 'unknown'}-{os.getpid()}-{threading.get_ident()}"
+        )
+        meta = {
+            'name': name,
+            'created_at': now.isoformat(),
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'duration_ms': round(duration * 1000, 1),
+            'samples': sum(stacks.values()),
+            'pid': os.getpid(),
+        }
+        folded_path = os.path.join(self.directory, f'{name}.folded')
+        with open(folded_path, 'w') as f:
+            for stack, count in stacks.most_common():
+                f.write(f'{stack} {count}\n')
+        with open(os.path.join(self.directory, f'{name}.json'), 'w') as f:
+            json.dump(meta, f)
+        self._rotate()
+
+    def _rotate(self):
+        profiles = self.recent_profiles(limit=None)
+        for meta in profiles[self.max_profiles:]:
+            for ext in ('.folded', '.json'):
+                try:
+                    os.remove(os.path.join(self.directory, meta['name'] + ext))
+                except OSError:
+                    pass
+
+    def recent_profiles(self, limit=50):
+        """Metadata of stored profiles, newest first"""
+        if not self.directory or not os.path.isdir(self.directory):
+            return []
+        profiles = []
+        for filename in os.listdir(self.directory):
+            if not filename.endswith('.json') or filename == CONTROL_FILE:
+                continue
+            try:
+                with open(os.path.join(self.directory, filename)) as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        profiles.sort(key=lambda meta: meta.get('created_at', ''), reverse=True)
+        return profiles if limit is None else profiles[:limit]
+
+    def profile_path(self, name):
+        """Path of a stored collapsed-stack file, or None for unknown names"""
+        name = secure_filename(name)
+        path = os.path.join(self.directory, f'{name}.folded')
+        return path if name and os.path.isfile(path) else None
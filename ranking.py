@@ -0,0 +1,63 @@
+"""
+Fractional ranking keys.
+
+A rank is a string of base-62 digits that sorts with plain byte-wise string
+comparison, so a list ordered by an index on ``(child_id, rank)`` needs no
+sorting. Between any two keys there is always another one, so moving an item
+only rewrites that item's key. Keys never end in the lowest digit, which
+keeps room before every key. Appending steps one digit at a time, so about
+sixty appends add one character; repeated moves into the same gap make keys
+longer faster. ``spread`` hands out short, evenly spaced keys to rebalance a
+list.
+"""
+DIGITS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+BASE = len(DIGITS)
+_VALUE = {digit: value for value, digit in enumerate(DIGITS)}
+
+
+def _midpoint(low, high):
+    """Key strictly between low ('' for the start) and high (None for the end)"""
+    if high is not None:
+        # Skip the common prefix, low being padded with zeros
+        n = 0
+        while n < len(high) and (low[n] if n < len(low) else DIGITS[0]) == high[n]:
+            n += 1
+        if n:
+            return high[:n] + _midpoint(low[n:], high[n:])
+    digit_low = _VALUE[low[0]] if low else 0
+    if high is None and low and digit_low < BASE - 1:
+        # Appending is the common case: step by one so keys grow slowly
+        return DIGITS[digit_low + 1]
+    digit_high = _VALUE[high[0]] if high is not None else BASE
+    if digit_high - digit_low > 1:
+        return DIGITS[(digit_low + digit_high + 1) // 2]
+    # Adjacent digits: continue after low's first digit
+    if high is not None and len(high) > 1:
+        return high[:1]
+    return DIGITS[digit_low] + _midpoint(low[1:], None)
+
+
+def key_between(before=None, after=None):
+    """A key sorting after `before` and before `after`; None stands for the start or the end"""
+    if before is not None and after is not None and before >= after:
+        raise ValueError(f'{before!r} does not sort before {after!r}')
+    for key in (before, after):
+        if key is not None and (not key or key[-1] == DIGITS[0] or any(c not in _VALUE for c in key)):
+            raise ValueError(f'Invalid rank {key!r}')
+    return _midpoint(before or '', after)
+
+
+def spread(count):
+    """`count` evenly spaced keys in ascending order, as short as possible"""
+    length = 1
+    while BASE ** length <= count:
+        length += 1
+    step = BASE ** length // (count + 1)
+    keys = []
+    for n in range(1, count + 1):
+        value, digits = n * step, []
+        for _ in range(length):
+            value, digit = divmod(value, BASE)
+            digits.append(DIGITS[digit])
+        keys.append(''.join(reversed(digits)).rstrip(DIGITS[0]))
+    return keys
@@ -0,0 +1,99 @@
+"""
+Minimal periodic job runner.
+
+Jobs are plain functions registered with an interval in seconds. They run one
+after another on a single daemon thread inside an application context, so a
+slow job delays the next one instead of piling up threads. Every job must be
+safe to run from several worker processes at once because each process runs
+its own scheduler, unless it is registered as ``exclusive``: those take a
+non-blocking file lock first and are skipped by every process that doesn't
+get it.
+"""
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: exclusive jobs run without a lock
+    fcntl = None
+
+
+class Scheduler:
+    """Runs registered jobs periodically on one background thread"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.lock_dir = None
+        self.jobs = {}
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.lock_dir = app.config.get('SCHEDULER_LOCK_DIR') or app.instance_path
+        app.extensions['scheduler'] = self
+
+    def job(self, name, interval, exclusive=False):
+        """Decorator registering a function to run every `interval` seconds"""
+        def decorator(func):
+            with self._lock:
+                self.jobs[name] = {
+                    'func': func,
+                    'interval': interval,
+                    'exclusive': exclusive,
+                    'next_run': time.monotonic() + interval,
+                }
+            return func
+        return decorator
+
+    def run_job(self, name):
+        """Run one job now inside an application context"""
+        job = self.jobs[name]
+        lock_file = None
+        try:
+            if job['exclusive'] and fcntl is not None:
+                os.makedirs(self.lock_dir, exist_ok=True)
+                lock_file = open(os.path.join(self.lock_dir, f'{name}.lock'), 'w')
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    return None  # another process is running it
+            with self.app.app_context():
+                return job['func']()
+        except Exception as e:
+            print(f"Scheduled job {name} failed: {e}")
+        finally:
+            if lock_file is not None:
+                lock_file.close()
+            job['next_run'] = time.monotonic() + job['interval']
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stop the loop, waiting for a running job to finish"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            now = time.monotonic()
+            with self._lock:
+                due = [name for name, job in self.jobs.items() if job['next_run'] <= now]
+                upcoming = min((job['next_run'] for job in self.jobs.values()), default=now + 60)
+            for name in due:
+                if self._stop.is_set():
+                    return
+                self.run_job(name)
+            if not due:
+                self._stop.wait(max(0.5, min(upcoming - now, 60)))
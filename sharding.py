@@ -0,0 +1,295 @@
+"""
+Optional per-family sharding of children and gifts.
+
+A small directory database maps ``Family.id`` to a shard name; shard names map
+to database URLs through configuration. Families without a directory entry
+live in the main database (the ``default`` shard), so turning sharding on
+needs no migration and families can be moved out one at a time.
+
+Only the family-scoped, write-heavy tables are sharded (``child`` and
+``gift``). Families, admins, tokens and other global tables stay in the main
+database. ``RoutingSession`` sends every statement touching a sharded table
+to the shard of the current family. That family comes from ``use_family()``
+or ``use_shard()`` when set, otherwise from ``session['family_id']`` of the
+current request. Queries across families go through ``for_each_shard()``.
+
+Ids of sharded rows are only unique within a shard; every lookup is already
+scoped to a family, so that is safe. ``move_family`` re-numbers rows as it
+copies them.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+import sqlalchemy as sa
+from flask import current_app, has_request_context, session as flask_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy.sql.util import find_tables
+
+DEFAULT_SHARD = 'default'
+
+_family = contextvars.ContextVar('shard_family', default=None)
+_shard = contextvars.ContextVar('shard_name', default=None)
+
+
+class ShardMovingError(Exception):
+    """Writes to a family are paused while it moves to another shard"""
+
+
+def parse_shards(value):
+    """'a=sqlite:///a.db,b=sqlite:///b.db' -> {'a': 'sqlite:///a.db', 'b': ...}"""
+    shards = {}
+    for item in filter(None, (part.strip() for part in (value or '').split(','))):
+        name, _, url = item.partition('=')
+        if not url or name == DEFAULT_SHARD:
+            raise ValueError(f'Invalid shard definition: {item}')
+        shards[name.strip()] = url.strip()
+    return shards
+
+
+def get_router():
+    """The app's ShardRouter, None when sharding is off"""
+    return current_app.extensions.get('shard_router')
+
+
+@contextmanager
+def use_family(family_id):
+    """Route sharded queries to a family's shard outside of its requests"""
+    token = _family.set(family_id)
+    try:
+        yield
+    finally:
+        _family.reset(token)
+
+
+@contextmanager
+def use_shard(name):
+    """Route sharded queries to one shard, for work across families"""
+    token = _shard.set(name)
+    try:
+        yield
+    finally:
+        _shard.reset(token)
+
+
+def shard_of(family_id):
+    """Shard name of a family, None when sharding is off"""
+    router = get_router()
+    return router.lookup(family_id)[0] if router is not None else None
+
+
+def for_each_shard(db):
+    """Yield once per shard with queries routed to it; once without routing when sharding is off"""
+    router = get_router()
+    if router is None:
+        yield None
+        return
+    for name in router.shard_names():
+        with use_shard(name):
+            yield name
+            db.session.flush()
+        # Ids repeat between shards, objects from one must not be found in the next
+        for obj in list(db.session.identity_map.values()):
+            if sa.inspect(obj).mapper.local_table.name in router.sharded_tables:
+                db.session.expunge(obj)
+
+
+class ShardRouter:
+    """Directory of family -> shard assignments and the shard engines"""
+
+    def __init__(self, db, directory_url, shards, sharded_tables, cache_ttl=2.0):
+        self.db = db
+        self.shard_urls = shards
+        self.sharded_tables = set(sharded_tables)
+        self.cache_ttl = cache_ttl
+        self._engines = {}
+        self._cache = {}
+        self._lock = threading.Lock()
+
+        self.directory = sa.create_engine(directory_url)
+        metadata = sa.MetaData()
+        self.assignments = sa.Table(
+            'family_shard', metadata,
+            sa.Column('family_id', sa.Integer, primary_key=True),
+            sa.Column('shard', sa.String(50), nullable=False, index=True),
+            sa.Column('moving', sa.Boolean, nullable=False, default=False),
+        )
+        metadata.create_all(self.directory)
+
+    def init_app(self, app):
+        app.extensions['shard_router'] = self
+
+    def shard_names(self):
+        return [DEFAULT_SHARD] + list(self.shard_urls)
+
+    def engine(self, name):
+        if name == DEFAULT_SHARD:
+            return self.db.engine
+        with self._lock:
+            if name not in self._engines:
+                if name not in self.shard_urls:
+                    raise KeyError(f'Unknown shard {name}')
+                self._engines[name] = sa.create_engine(self.shard_urls[name])
+            return self._engines[name]
+
+    def lookup(self, family_id, fresh=False):
+        """(shard name, moving) of a family, cached for cache_ttl seconds"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._cache.get(family_id)
+        if entry and not fresh and entry[0] > now:
+            return entry[1]
+        with self.directory.connect() as conn:
+            row = conn.execute(
+                sa.select(self.assignments.c.shard, self.assignments.c.moving)
+                .where(self.assignments.c.family_id == family_id)
+            ).first()
+        value = (row.shard, row.moving) if row else (DEFAULT_SHARD, False)
+        with self._lock:
+            self._cache[family_id] = (now + self.cache_ttl, value)
+        return value
+
+    def assign(self, family_id, shard=None):
+        """Place a new family, on the shard with the fewest families unless one is given"""
+        if shard is None:
+            if not self.shard_urls:
+                return DEFAULT_SHARD
+            with self.directory.connect() as conn:
+                counts = dict(conn.execute(
+                    sa.select(self.assignments.c.shard, sa.func.count())
+                    .group_by(self.assignments.c.shard)
+                ).all())
+            shard = min(self.shard_urls, key=lambda name: counts.get(name, 0))
+        self.set(family_id, shard)
+        return shard
+
+    def set(self, family_id, shard, moving=False):
+        with self.directory.begin() as conn:
+            conn.execute(self.assignments.delete().where(self.assignments.c.family_id == family_id))
+            if shard != DEFAULT_SHARD or moving:
+                conn.execute(self.assignments.insert().values(family_id=family_id, shard=shard, moving=moving))
+        with self._lock:
+            self._cache.pop(family_id, None)
+
+    def current(self):
+        """(shard name, moving) that sharded statements go to right now"""
+        shard = _shard.get()
+        if shard is not None:
+            return shard, False
+        family_id = _family.get()
+        if family_id is None and has_request_context():
+            family_id = flask_session.get('family_id')
+        if family_id is None:
+            raise RuntimeError('Query on a sharded table without a family; use use_family() or for_each_shard()')
+        return self.lookup(family_id)
+
+    def touches_sharded_table(self, mapper, clause):
+        if mapper is not None and sa.inspect(mapper).local_table.name in self.sharded_tables:
+            return True
+        if clause is not None:
+            return any(getattr(table, 'name', None) in self.sharded_tables
+                       for table in find_tables(clause, include_joins=True, include_crud=True))
+        return False
+
+    def create_all(self):
+        """Create the sharded tables in every configured shard, without keys to unsharded tables"""
+        metadata = sa.MetaData()
+        for name in self.sharded_tables:
+            table = self.db.metadata.tables[name].to_metadata(metadata)
+            for constraint in list(table.foreign_key_constraints):
+                if constraint.elements[0].target_fullname.split('.')[0] not in self.sharded_tables:
+                    table.constraints.discard(constraint)
+                    table.foreign_keys.difference_update(constraint.elements)
+                    for column in constraint.columns:
+                        column.foreign_keys.difference_update(constraint.elements)
+        for name in self.shard_urls:
+            metadata.create_all(self.engine(name))
+
+    def dispose(self):
+        """Drop connections inherited from a parent process"""
+        self.directory.dispose(close=False)
+        with self._lock:
+            for engine in self._engines.values():
+                engine.dispose(close=False)
+
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session sending sharded tables to the current family's shard"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            router = current_app.extensions.get('shard_router')
+            if router is not None and router.touches_sharded_table(mapper, clause):
+                shard, moving = router.current()
+                if moving and (self._flushing or getattr(clause, 'is_dml', False)):
+                    raise ShardMovingError('This family is being moved, try again in a moment')
+                return router.engine(shard)
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def move_family(router, family_id, target, chunk_size=500, on_paused=None, on_switched=None):
+    """
+    Move a family's children and gifts to another shard while the app runs.
+    Writes to the family are refused until the move is done; reads keep
+    working, from the source until the directory is switched. `on_paused()`
+    runs once writes are paused, before the rows are read, so updates buffered
+    outside the session (write-behind) can reach them first. The rows get new
+    ids on the target; once every worker reads from it, `on_switched(new_ids)`
+    runs with ``{'child': {old: new}, 'gift': {old: new}}``, still with writes
+    paused, so caches and records holding the old ids can be updated. The
+    source rows are deleted last, in chunks. Returns the number of gifts moved.
+    """
+    db = router.db
+    source, _ = router.lookup(family_id, fresh=True)
+    if source == target:
+        return 0
+    target_engine = router.engine(target)
+    child_table, gift_table = db.metadata.tables['child'], db.metadata.tables['gift']
+    settle = router.cache_ttl + 0.5
+
+    router.set(family_id, source, moving=True)
+    time.sleep(settle)  # until every worker's directory cache has seen the pause
+    try:
+        if on_paused is not None:
+            on_paused()
+        with router.engine(source).connect() as conn:
+            children = conn.execute(sa.select(child_table).where(child_table.c.family_id == family_id)).mappings().all()
+            gifts = conn.execute(sa.select(gift_table).where(
+                gift_table.c.child_id.in_([child['id'] for child in children])
+            )).mappings().all()
+
+        with target_engine.begin() as conn:
+            child_ids = {}
+            for child in children:
+                row = {key: value for key, value in child.items() if key != 'id'}
+                child_ids[child['id']] = conn.execute(child_table.insert().values(row)).inserted_primary_key[0]
+            gift_ids = {}
+            for gift in gifts:
+                row = dict({key: value for key, value in gift.items() if key != 'id'}, child_id=child_ids[gift['child_id']])
+                gift_ids[gift['id']] = conn.execute(gift_table.insert().values(row)).inserted_primary_key[0]
+            copied = conn.execute(sa.select(sa.func.count()).select_from(gift_table).where(
+                gift_table.c.child_id.in_(list(child_ids.values()))
+            )).scalar() if child_ids else 0
+            if copied != len(gifts):
+                raise RuntimeError(f'Copied {copied} of {len(gifts)} gifts, move aborted')
+    except BaseException:
+        router.set(family_id, source, moving=False)
+        raise
+
+    router.set(family_id, target, moving=True)
+    time.sleep(settle)  # no worker reads the source any more
+    try:
+        if on_switched is not None:
+            on_switched({'child': child_ids, 'gift': gift_ids})
+    finally:
+        router.set(family_id, target)
+
+    source_engine = router.engine(source)
+    old_ids = list(gift_ids)
+    for start in range(0, len(old_ids), chunk_size):
+        with source_engine.begin() as conn:
+            conn.execute(gift_table.delete().where(gift_table.c.id.in_(old_ids[start:start + chunk_size])))
+    with source_engine.begin() as conn:
+        conn.execute(child_table.delete().where(child_table.c.family_id == family_id))
+    return len(gifts)
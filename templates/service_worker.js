@@ -0,0 +1,243 @@
+// Service worker for the family pages, rendered by the service_worker route.
+// The shell (stylesheet, icon) is precached, family pages and gift images are
+// served stale-while-revalidate, and purchases made offline are queued in
+// IndexedDB and replayed once the phone is back online.
+const VERSION = {{ version | tojson }};
+const SHELL_CACHE = 'shell-' + VERSION;
+const PAGES_CACHE = 'pages';
+const IMAGES_CACHE = 'images';
+const SHELL_URLS = {{ shell_urls | tojson }};
+const STYLESHEET_URL = {{ stylesheet_url | tojson }};
+const PAGE_PATHS = /^\/(family-dashboard|family-wishlist|child\/\d+)$/;
+const GIFT_ACTION_PATHS = /^\/gift\/\d+\/(purchase|unmark)$/;
+// Both logouts end the family session; both logins may start another family's
+const LOGOUT_PATHS = /^\/(family-logout|admin-logout)$/;
+const LOGIN_PATHS = /^\/(family-login|admin-login)$/;
+// CSRF tokens are signed afresh on every render, so they differ even when nothing else does
+const CSRF_TOKENS = /(name="csrf-token" content="|name="csrf_token" value=")[^"]*/g;
+const IMAGE_CACHE_ENTRIES = {{ image_cache_entries | tojson }};
+const QUEUE_DB = 'wishlist-queue';
+const QUEUE_STORE = 'gift-actions';
+
+self.addEventListener('install', event => {
+    event.waitUntil(caches.open(SHELL_CACHE).then(cache => cache.addAll(SHELL_URLS)).then(() => self.skipWaiting()));
+});
+
+self.addEventListener('activate', event => {
+    event.waitUntil(
+        caches.keys()
+            .then(keys => Promise.all(keys.filter(key => key.startsWith('shell-') && key !== SHELL_CACHE).map(key => caches.delete(key))))
+            .then(() => self.clients.claim())
+            .then(replayQueue)
+    );
+});
+
+self.addEventListener('fetch', event => {
+    const request = event.request;
+    const url = new URL(request.url);
+    const sameOrigin = url.origin === self.location.origin;
+
+    if (sameOrigin && request.method === 'POST' && GIFT_ACTION_PATHS.test(url.pathname)) {
+        event.respondWith(giftAction(request));
+    } else if (sameOrigin && request.method === 'POST' && LOGIN_PATHS.test(url.pathname)) {
+        // Queued actions stay: they are waiting for exactly this login
+        event.respondWith(clearFamilyCaches().then(() => fetch(request)));
+    } else if (request.method !== 'GET') {
+        return;
+    } else if (sameOrigin && LOGOUT_PATHS.test(url.pathname)) {
+        // A shared phone must not keep showing the family's lists
+        event.respondWith(clearFamilyData().then(() => fetch(request)));
+    } else if (sameOrigin && SHELL_URLS.includes(url.pathname)) {
+        event.respondWith(caches.match(request).then(cached => cached || fetch(request)));
+    } else if (sameOrigin && request.mode === 'navigate' && PAGE_PATHS.test(url.pathname)) {
+        event.respondWith(stalePage(event));
+    } else if (request.destination === 'image') {
+        event.respondWith(staleImage(event));
+    }
+});
+
+self.addEventListener('sync', event => {
+    if (event.tag === 'gift-actions') {
+        event.waitUntil(replayQueue());
+    }
+});
+
+self.addEventListener('message', event => {
+    if (event.data === 'replay') {
+        event.waitUntil(replayQueue());
+    }
+});
+
+// Pages: answer from the cache at once, refresh it from the network, and tell
+// the page when the fresh copy differs so it can offer a reload
+async function stalePage(event) {
+    const cache = await caches.open(PAGES_CACHE);
+    const cached = await cache.match(event.request);
+    const refresh = fetch(event.request).then(async response => {
+        if (response.ok && response.type === 'basic' && !response.redirected) {
+            const fresh = withoutTokens(await response.clone().text());
+            const stale = cached ? withoutTokens(await cached.clone().text()) : null;
+            await cache.put(event.request, response.clone());
+            if (stale !== null && stale !== fresh) {
+                notify({type: 'page-updated', url: event.request.url}, event.resultingClientId);
+            }
+        }
+        return response;
+    });
+    if (cached) {
+        event.waitUntil(refresh.catch(() => null));
+        return cached;
+    }
+    return refresh.catch(() => offlinePage('Táto stránka ešte nie je uložená na čítanie offline.'));
+}
+
+function withoutTokens(page) {
+    return page.replace(CSRF_TOKENS, '$1');
+}
+
+async function staleImage(event) {
+    const cache = await caches.open(IMAGES_CACHE);
+    const cached = await cache.match(event.request);
+    const refresh = fetch(event.request).then(async response => {
+        // Shop images are cross-origin, so they come back opaque
+        if (response.ok || response.type === 'opaque') {
+            await cache.put(event.request, response.clone());
+            await trimCache(cache, IMAGE_CACHE_ENTRIES);
+        }
+        return response;
+    });
+    if (cached) {
+        event.waitUntil(refresh.catch(() => null));
+        return cached;
+    }
+    return refresh;
+}
+
+async function trimCache(cache, entries) {
+    const keys = await cache.keys();
+    await Promise.all(keys.slice(0, Math.max(keys.length - entries, 0)).map(key => cache.delete(key)));
+}
+
+// Purchases and unmarks: pages change, so cached copies are dropped; offline
+// the action is queued instead
+async function giftAction(request) {
+    const body = await request.clone().text();
+    try {
+        const response = await fetch(request);
+        await caches.delete(PAGES_CACHE);
+        return response;
+    } catch (error) {
+        await enqueue({url: request.url, body: body, queuedAt: Date.now()});
+        if (self.registration.sync) {
+            await self.registration.sync.register('gift-actions').catch(() => null);
+        }
+        return offlinePage('Ste offline. Darček bude označený, keď budete znova pripojení.', request.referrer);
+    }
+}
+
+async function replayQueue() {
+    const actions = await queued();
+    if (!actions.length) {
+        return;
+    }
+    // Queued forms may carry an expired CSRF token, so take a fresh one from a page
+    let token;
+    try {
+        const page = await fetch('/family-dashboard', {credentials: 'same-origin'});
+        if (page.redirected || !page.ok) {
+            // Signed out meanwhile: the actions wait until the family signs in again
+            notify({type: 'action-login-required'});
+            return;
+        }
+        const match = (await page.text()).match(/<meta name="csrf-token" content="([^"]+)"/);
+        token = match && match[1];
+    } catch (error) {
+        return;
+    }
+    for (const action of actions) {
+        const body = new URLSearchParams(action.body);
+        if (token) {
+            body.set('csrf_token', token);
+        }
+        // Somebody may have bought the gift meanwhile; the server then refuses with 409
+        body.set('if_available', '1');
+        // A replayed action succeeds with 204, so any redirect is the login page
+        body.set('replay', '1');
+        let response;
+        try {
+            response = await fetch(action.url, {method: 'POST', body: body, credentials: 'same-origin', redirect: 'manual'});
+        } catch (error) {
+            return;  // Offline again, the rest waits for the next attempt
+        }
+        if (response.type === 'opaqueredirect' || response.status === 401 || response.status === 403) {
+            notify({type: 'action-login-required', url: action.url});
+            return;
+        }
+        if (response.status >= 500) {
+            return;  // The server is struggling, try again later
+        }
+        // Anything else is final: done, taken by somebody else, or refused (the gift is gone)
+        await dequeue(action.id);
+        const type = response.ok ? 'action-replayed' : response.status === 409 ? 'action-conflict' : 'action-failed';
+        notify({type: type, url: action.url});
+    }
+    await caches.delete(PAGES_CACHE);
+}
+
+async function clearFamilyCaches() {
+    await Promise.all([caches.delete(PAGES_CACHE), caches.delete(IMAGES_CACHE)]);
+}
+
+async function clearFamilyData() {
+    await clearFamilyCaches();
+    const db = await openQueue();
+    await transaction(db, 'readwrite', store => store.clear());
+}
+
+async function notify(message, clientId) {
+    const clients = clientId ? [await self.clients.get(clientId)] : await self.clients.matchAll({type: 'window'});
+    clients.filter(Boolean).forEach(client => client.postMessage(message));
+}
+
+function offlinePage(message, back) {
+    const link = back ? `<p><a href="${new URL(back).pathname}" class="btn btn-primary">Späť</a></p>` : '';
+    return new Response(
+        `<!DOCTYPE html><html lang="sk"><head><meta charset="UTF-8">` +
+        `<meta name="viewport" content="width=device-width, initial-scale=1.0">` +
+        `<title>Offline - Rodinný Zoznam Darčekov</title><link rel="stylesheet" href="${STYLESHEET_URL}"></head>` +
+        `<body><main class="container"><div class="empty-state"><div class="empty-icon">📶</div>` +
+        `<h2>Offline</h2><p>${message}</p>${link}</div></main></body></html>`,
+        {status: 503, headers: {'Content-Type': 'text/html; charset=utf-8'}}
+    );
+}
+
+// A tiny IndexedDB queue, oldest action first
+function openQueue() {
+    return new Promise((resolve, reject) => {
+        const open = indexedDB.open(QUEUE_DB, 1);
+        open.onupgradeneeded = () => open.result.createObjectStore(QUEUE_STORE, {keyPath: 'id', autoIncrement: true});
+        open.onsuccess = () => resolve(open.result);
+        open.onerror = () => reject(open.error);
+    });
+}
+
+function transaction(db, mode, work) {
+    return new Promise((resolve, reject) => {
+        const tx = db.transaction(QUEUE_STORE, mode);
+        const request = work(tx.objectStore(QUEUE_STORE));
+        tx.oncomplete = () => resolve(request.result);
+        tx.onerror = () => reject(tx.error);
+    });
+}
+
+async function enqueue(action) {
+    await transaction(await openQueue(), 'readwrite', store => store.add(action));
+}
+
+async function dequeue(id) {
+    await transaction(await openQueue(), 'readwrite', store => store.delete(id));
+}
+
+async function queued() {
+    return transaction(await openQueue(), 'readonly', store => store.getAll());
+}
@@ -0,0 +1,33 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The app binds its database at import time, so point it at a scratch file first
+_tmpdir = tempfile.mkdtemp(prefix='wishlist-tests-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_tmpdir, 'test.db')
+os.environ.setdefault('PROFILER_DIR', os.path.join(_tmpdir, 'profiles'))
+os.environ['SCHEDULER_ENABLED'] = 'false'
+os.environ['JINJA_CACHE_DIR'] = os.path.join(_tmpdir, 'jinja_cache')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as wishlist  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    wishlist.app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    with wishlist.app.app_context():
+        wishlist.write_behind.flush()
+        wishlist.db.drop_all()
+        wishlist.db.create_all()
+        # A recreated database starts every family at version 0 again
+        wishlist.family_cache.clear()
+        yield wishlist.app
+        wishlist.db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
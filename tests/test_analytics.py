@@ -0,0 +1,68 @@
+from datetime import datetime
+
+import app as wishlist
+from app import db, Family, Child, Gift, GiftActivityDaily
+
+
+def activity(family_id):
+    row = GiftActivityDaily.query.filter_by(family_id=family_id, day=datetime.utcnow().date()).one()
+    return row.added, row.purchased, row.unmarked, row.deleted
+
+
+def test_gift_changes_update_family_and_global_rollups(app, client):
+    family = Family(name='Rodina', password_hash='x')
+    db.session.add(family)
+    db.session.flush()
+    child = Child(name='Ema', family_id=family.id)
+    db.session.add(child)
+    db.session.commit()
+    family_id, child_id = family.id, child.id
+
+    with client.session_transaction() as sess:
+        sess['family_id'] = family_id
+        sess['admin_id'] = 1
+    form = {'name': 'Lopta', 'description': '', 'link': '', 'link2': '', 'image_url': '', 'price_range': ''}
+    client.post(f'/admin/child/{child_id}/gift/add', data=form)
+    client.post(f'/admin/child/{child_id}/gift/add', data=dict(form, name='Bicykel'))
+    first, second = [gift.id for gift in Gift.query.order_by(Gift.id)]
+    client.post(f'/gift/{first}/purchase', data={'buyer_name': 'Babka'})
+    client.post(f'/gift/{first}/purchase', data={'buyer_name': 'Babka'})
+    client.post(f'/gift/{first}/unmark')
+    client.post(f'/admin/gift/{second}/delete')
+
+    assert activity(family_id) == (2, 1, 1, 1)
+    assert activity(0) == (2, 1, 1, 1)
+    assert db.session.get(Gift, first).purchased_at is None
+
+    with client.session_transaction() as sess:
+        sess['superadmin_id'] = 1
+    csv = client.get(f'/superadmin/analytics.csv?family={family_id}&days=2').get_data(as_text=True)
+    lines = csv.splitlines()
+    assert len(lines) == 3
+    assert lines[0] == 'day,added,purchased,unmarked,deleted'
+    assert lines[1].endswith(',0,0,0,0')
+    assert lines[2] == f'{datetime.utcnow().date().isoformat()},2,1,1,1'
+    assert client.get('/superadmin/analytics').status_code == 200
+
+
+def test_rebuild_counts_existing_gifts(app):
+    family = Family(name='Rodina', password_hash='x')
+    db.session.add(family)
+    db.session.flush()
+    child = Child(name='Ema', family_id=family.id)
+    db.session.add(child)
+    db.session.flush()
+    db.session.add_all([
+        Gift(name='Lopta', child_id=child.id, created_at=datetime(2026, 3, 1, 10)),
+        Gift(name='Kniha', child_id=child.id, created_at=datetime(2026, 3, 1, 12),
+             is_purchased=True, purchased_at=datetime(2026, 3, 2, 9)),
+    ])
+    db.session.commit()
+
+    wishlist.rebuild_gift_activity()
+    rows = {(row.day.isoformat(), row.family_id): (row.added, row.purchased)
+            for row in GiftActivityDaily.query}
+    assert rows == {
+        ('2026-03-01', family.id): (2, 0), ('2026-03-01', 0): (2, 0),
+        ('2026-03-02', family.id): (0, 1), ('2026-03-02', 0): (0, 1),
+    }
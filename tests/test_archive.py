@@ -0,0 +1,160 @@
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, text
+
+import app as wishlist
+from app import db, Family, AdminUser, Child, Gift, GiftActivityDaily
+from cache import FamilySnapshotCache, SQLiteCacheBackend
+
+
+def test_deactivated_family_is_archived_purged_and_restored(app, client, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'ARCHIVE_DIR', str(tmp_path))
+    upload_dir = os.path.join(app.static_folder, 'uploads')
+    os.makedirs(upload_dir, exist_ok=True)
+    upload = os.path.join(upload_dir, 'archive_test.jpg')
+    with open(upload, 'wb') as f:
+        f.write(b'jpeg')
+
+    family = Family(name='Rodina', password_hash='x')
+    other = Family(name='Iná', password_hash='x')
+    db.session.add_all([family, other])
+    db.session.flush()
+    child = Child(name='Ema', family_id=family.id)
+    db.session.add_all([child, Child(name='Jano', family_id=other.id),
+                        AdminUser(email='a@example.com', password_hash='x', family_id=family.id)])
+    db.session.flush()
+    db.session.add_all([Gift(name=f'Darček {n}', child_id=child.id) for n in range(3)])
+    db.session.add(Gift(name='Lopta', child_id=child.id, image_url='/static/uploads/archive_test.jpg',
+                        is_purchased=True, purchased_at=datetime(2026, 5, 1, 12)))
+    db.session.commit()
+    family_id = family.id
+    wishlist.record_gift_activity(family_id, 'added', 4)
+    db.session.commit()
+
+    with client.session_transaction() as sess:
+        sess['superadmin_id'] = 1
+    client.post(f'/superadmin/family/{family_id}/delete')
+    assert wishlist.archive_deactivated_families() == []
+
+    Family.query.filter_by(id=family_id).update({'deactivated_at': datetime.utcnow() - timedelta(days=31)})
+    db.session.commit()
+    monkeypatch.setitem(app.config, 'ARCHIVE_DELETE_CHUNK', 2)
+    [path] = wishlist.archive_deactivated_families()
+
+    assert os.path.isfile(path)
+    assert not os.path.exists(upload)
+    assert db.session.get(Family, family_id) is None
+    assert Gift.query.count() == 0
+    assert Child.query.count() == 1
+    assert AdminUser.query.count() == 0
+    assert GiftActivityDaily.query.filter_by(family_id=family_id).count() == 0
+
+    restored_id = wishlist.restore_family(path)
+    try:
+        restored = db.session.get(Family, restored_id)
+        assert restored.name == 'Rodina' and restored.is_active
+        assert [c.name for c in restored.children] == ['Ema']
+        gifts = sorted(restored.children[0].gifts, key=lambda gift: gift.name)
+        assert [gift.name for gift in gifts] == ['Darček 0', 'Darček 1', 'Darček 2', 'Lopta']
+        assert gifts[-1].purchased_at == datetime(2026, 5, 1, 12)
+        assert restored.admin_users[0].email == 'a@example.com'
+        assert GiftActivityDaily.query.filter_by(family_id=restored_id).one().added == 4
+        assert os.path.isfile(upload)
+    finally:
+        if os.path.exists(upload):
+            os.remove(upload)
+
+
+def test_reused_family_id_gets_its_own_archive(app, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'ARCHIVE_DIR', str(tmp_path))
+    first = Family(name='Prvá', password_hash='x')
+    db.session.add(first)
+    db.session.commit()
+    family_id = first.id
+    old_path = wishlist.archive_family(family_id)
+
+    # Databases created before ids were autoincremented hand the freed id to the next family
+    second = Family(id=family_id, name='Druhá', password_hash='x', created_at=datetime(2026, 6, 1))
+    db.session.add(second)
+    db.session.flush()
+    db.session.add(Child(name='Ema', family_id=family_id))
+    db.session.commit()
+    new_path = wishlist.archive_family(family_id)
+
+    assert new_path != old_path and os.path.isfile(old_path)
+    manifest, tables = wishlist.read_archive(new_path)
+    assert manifest['family_name'] == 'Druhá' and [c['name'] for c in tables['child']] == ['Ema']
+    assert db.session.get(Family, family_id) is None
+
+
+def test_interrupted_purge_resumes_from_its_archive(app, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'ARCHIVE_DIR', str(tmp_path))
+    family = Family(name='Rodina', password_hash='x')
+    db.session.add(family)
+    db.session.flush()
+    db.session.add(Child(name='Ema', family_id=family.id))
+    db.session.commit()
+    family_id = family.id
+
+    def crash(family_id):
+        raise RuntimeError('killed')
+
+    monkeypatch.setattr(wishlist, 'purge_family', crash)
+    with pytest.raises(RuntimeError):
+        wishlist.archive_family(family_id)
+    [path] = os.listdir(tmp_path)
+    monkeypatch.undo()
+    monkeypatch.setitem(app.config, 'ARCHIVE_DIR', str(tmp_path))
+
+    assert wishlist.archive_family(family_id) == os.path.join(tmp_path, path)
+    assert os.listdir(tmp_path) == [path]
+    assert db.session.get(Family, family_id) is None
+
+
+def test_recreated_family_never_sees_an_archived_familys_snapshot(app, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'ARCHIVE_DIR', str(tmp_path))
+    backend = SQLiteCacheBackend(str(tmp_path / 'family_cache.db'))
+    monkeypatch.setattr(wishlist, 'family_cache', FamilySnapshotCache(16, backend))
+    # Another worker sharing the backend, which the purge can't reach directly
+    other_worker = FamilySnapshotCache(16, backend)
+
+    family = Family(name='Stará', password_hash='x')
+    db.session.add(family)
+    db.session.flush()
+    db.session.add(Child(name='SecretOldKid', family_id=family.id))
+    db.session.commit()
+    old_id = family.id
+    assert [child.name for child in wishlist.get_family_snapshot(old_id)] == ['SecretOldKid']
+    wishlist.archive_family(old_id)
+    assert backend.get(old_id, 0) is None
+
+    new = Family(name='Nová', password_hash='x')
+    db.session.add(new)
+    db.session.flush()
+    db.session.add(Child(name='Ema', family_id=new.id))
+    db.session.commit()
+    assert new.id != old_id
+    assert [child.name for child in wishlist.get_family_snapshot(new.id)] == ['Ema']
+    assert other_worker.get(old_id, 0, lambda: 'rebuilt') == 'rebuilt'
+
+
+def test_tables_without_autoincrement_are_rebuilt(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE family (id INTEGER NOT NULL PRIMARY KEY, name VARCHAR(100) NOT NULL, '
+                          'password_hash VARCHAR(200) NOT NULL)'))
+        conn.execute(text("INSERT INTO family (id, name, password_hash) VALUES (1, 'Rodina', 'x'), (2, 'Iná', 'x')"))
+
+    wishlist.migrate_schema(engine)
+    with engine.begin() as conn:
+        sql = conn.execute(text("SELECT sql FROM sqlite_master WHERE name = 'family'")).scalar()
+        assert 'AUTOINCREMENT' in sql
+        assert conn.execute(text('SELECT id, name FROM family ORDER BY id')).all() == [(1, 'Rodina'), (2, 'Iná')]
+        conn.execute(text('DELETE FROM family WHERE id = 2'))
+        conn.execute(text("INSERT INTO family (name, password_hash) VALUES ('Nová', 'x')"))
+        assert conn.execute(text("SELECT id FROM family WHERE name = 'Nová'")).scalar() == 3
+    # A second run leaves the table alone
+    wishlist.migrate_schema(engine)
+    engine.dispose()
@@ -0,0 +1,101 @@
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip('asgiref')
+
+import app as wishlist  # noqa: E402
+from app import db, AdminUser, Child, Family, PasswordResetToken  # noqa: E402
+
+
+def call(asgi_app, path, query='', cookie=None):
+    """Run one GET through the ASGI app, returns (status, body)"""
+    scope = {'type': 'http', 'http_version': '1.1', 'method': 'GET', 'scheme': 'http', 'path': path,
+             'raw_path': path.encode(), 'root_path': '', 'query_string': query.encode(),
+             'headers': [(b'host', b'localhost')] + ([(b'cookie', cookie.encode())] if cookie else []),
+             'server': ('localhost', 80), 'client': ('127.0.0.1', 1234)}
+    sent, requested = [], []
+
+    async def receive():
+        if not requested:
+            requested.append(True)
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(asgi_app(scope, receive, send))
+    status = next(message['status'] for message in sent if message['type'] == 'http.response.start')
+    return status, b''.join(message.get('body', b'') for message in sent if message['type'] == 'http.response.body')
+
+
+def test_long_poll_runs_as_a_coroutine(app, client, monkeypatch):
+    from asgi import Application
+
+    monkeypatch.setitem(app.config, 'CHANGE_FEED_POLL_INTERVAL', 0.05)
+    asgi_app = Application(app)
+    with client.session_transaction() as sess:
+        sess['superadmin_id'] = 1
+    cookie = f"session={client.get_cookie('session').value}"
+
+    # Nothing new: held until `wait` runs out, then an empty answer
+    assert call(asgi_app, '/superadmin/changes', 'wait=0.2', cookie) == (200, b'')
+
+    wishlist.record_change(1, Child(id=5, name='x', family_id=1), 'added')
+    db.session.commit()
+    status, body = call(asgi_app, '/superadmin/changes', 'wait=5', cookie)
+    assert status == 200 and [json.loads(line)['entity_id'] for line in body.splitlines()] == [5]
+
+    # Without a superadmin session the regular view redirects to the login
+    assert call(asgi_app, '/superadmin/changes', 'wait=5')[0] == 302
+    # Everything else is the WSGI app
+    assert call(asgi_app, '/manifest.webmanifest')[0] == 200
+
+
+def test_background_posts_go_through_the_outbound_client(app):
+    httpx = pytest.importorskip('httpx')
+    from asgi import AsyncOutbound
+    from outbound import OutboundClient
+
+    outbound = OutboundClient(breaker_threshold=2)
+    background = AsyncOutbound(None, outbound)
+    background.client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(503)))
+    failures = []
+
+    async def post_twice():
+        for _ in range(2):
+            await background._post('https://api.example.com/mail', 201, lambda: failures.append(True), json={})
+        await background._post('https://api.example.com/mail', 201, lambda: failures.append(True), json={})
+        await background.client.aclose()
+
+    asyncio.run(post_twice())
+    # Both answers count against the host, then its breaker stops the third call
+    stats = outbound.stats()['api.example.com']
+    assert (stats['requests'], stats['errors'], stats['rejected'], stats['breaker']) == (2, 2, 1, 'open')
+    assert failures == [True, True, True]
+
+
+def test_queued_reset_email_is_not_reported_as_sent(app, client, monkeypatch):
+    family = Family(name='Rodina', password_hash='x')
+    db.session.add(family)
+    db.session.flush()
+    db.session.add(AdminUser(email='a@example.com', password_hash='x', family_id=family.id))
+    db.session.commit()
+    monkeypatch.setenv('BREVO_API_KEY', 'key')
+    monkeypatch.setenv('BREVO_SENDER_EMAIL', 'app@example.com')
+
+    class Background:
+        def post_in_background(self, url, expected_status=None, on_failure=None, **kwargs):
+            self.on_failure = on_failure
+
+    background = Background()
+    monkeypatch.setitem(app.extensions, 'async_outbound', background)
+    page = client.post('/reset-password-request', data={'email': 'a@example.com'}, follow_redirects=True)
+    page = page.get_data(as_text=True)
+    assert 'sa odosiela' in page and 'bol odoslaný' not in page
+
+    # The mail API refused it: the link is revoked and does not count against the throttle
+    background.on_failure()
+    assert PasswordResetToken.query.one().used
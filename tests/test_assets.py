@@ -0,0 +1,100 @@
+import gzip
+import os
+import re
+
+from flask import Flask, url_for
+
+import app as wishlist
+from assets import StaticAssets, build, find_inline_styles, minify_css
+
+
+def make_static(tmp_path):
+    static = tmp_path / 'static'
+    (static / 'css').mkdir(parents=True)
+    (static / 'css' / 'style.css').write_text('/* base */\nbody {\n    color: red;\n}\n\na > b , i { margin: 0 ; }\n')
+    (static / 'uploads').mkdir()
+    (static / 'uploads' / 'lopta.jpg').write_bytes(b'jpeg')
+    (static / 'robots.txt').write_text('User-agent: *\n')
+    return static
+
+
+def make_app(static, **config):
+    app = Flask(__name__, static_folder=str(static))
+    app.config.update(config)
+    assets = StaticAssets(app)
+    return app, assets
+
+
+def test_minify_css():
+    assert minify_css('/* x */\nbody {\n  color: red;\n}\na > b , i { margin: 0 ; }') == \
+        'body{color:red}a>b,i{margin:0}'
+
+
+def test_build_fingerprints_and_precompresses(tmp_path):
+    static = make_static(tmp_path)
+    manifest = build(str(static))
+    built = manifest['css/style.css']
+    assert re.fullmatch(r'dist/css/style\.[0-9a-f]{10}\.css', built)
+    data = (static / built).read_bytes()
+    assert data == b'body{color:red}a>b,i{margin:0}'
+    assert gzip.decompress((static / (built + '.gz')).read_bytes()) == data
+    # Same content, same name: builds are reproducible
+    assert build(str(static)) == manifest
+
+
+def test_fingerprinted_assets_are_immutable_and_negotiated(tmp_path):
+    static = make_static(tmp_path)
+    build(str(static))
+    app, assets = make_app(static)
+    with app.test_request_context():
+        href = url_for('static', filename='css/style.css')
+    assert re.fullmatch(r'/static/dist/css/style\.[0-9a-f]{10}\.css', href)
+    client = app.test_client()
+
+    response = client.get(href, headers={'Accept-Encoding': 'gzip, deflate'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.mimetype == 'text/css'
+    assert gzip.decompress(response.get_data()) == b'body{color:red}a>b,i{margin:0}'
+    cache_control = response.cache_control
+    assert cache_control.immutable and cache_control.public and cache_control.max_age == 31536000
+    assert 'Accept-Encoding' in response.vary
+
+    plain = client.get(href)
+    assert 'Content-Encoding' not in plain.headers and plain.get_data() == b'body{color:red}a>b,i{margin:0}'
+
+    # Files outside the manifest are served as before
+    other = client.get('/static/robots.txt')
+    assert other.status_code == 200 and not other.cache_control.immutable
+
+
+def test_without_a_manifest_originals_are_served(tmp_path):
+    app, assets = make_app(make_static(tmp_path))
+    with app.test_request_context():
+        assert url_for('static', filename='css/style.css') == '/static/css/style.css'
+    assert b'color: red' in app.test_client().get('/static/css/style.css').get_data()
+
+
+def test_uploads_can_be_offloaded_to_the_front_server(tmp_path):
+    static = make_static(tmp_path)
+    app, assets = make_app(static, STATIC_OFFLOAD='x-accel', UPLOADS_MAX_AGE=600)
+    client = app.test_client()
+
+    response = client.get('/static/uploads/lopta.jpg')
+    assert response.headers['X-Accel-Redirect'] == '/protected-uploads/lopta.jpg'
+    assert response.get_data() == b'' and response.cache_control.max_age == 600
+    # Conditional requests are answered by the worker itself
+    assert client.get('/static/uploads/lopta.jpg', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+    assert client.get('/static/uploads/missing.jpg').status_code == 404
+
+    app, assets = make_app(static)
+    assert app.test_client().get('/static/uploads/lopta.jpg').get_data() == b'jpeg'
+
+
+def test_templates_carry_no_inline_styles():
+    templates = os.path.join(wishlist.app.root_path, 'templates')
+    assert find_inline_styles(templates) == []
+    for root, _, files in os.walk(templates):
+        for filename in files:
+            if filename.endswith('.html'):
+                with open(os.path.join(root, filename), encoding='utf-8') as f:
+                    assert ' style="' not in f.read(), filename
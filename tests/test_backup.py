@@ -0,0 +1,37 @@
+import pytest
+
+import app as wishlist
+from app import db, Family
+from backup import create_backup, list_backups, restore_backup, verify_backup
+
+
+def test_backup_is_checksummed_rotated_and_restorable(app, tmp_path):
+    db.session.add(Family(name='Rodina', password_hash='x'))
+    db.session.commit()
+    db_path = wishlist.database_path()
+
+    paths = [create_backup(db_path, str(tmp_path), pages=4, sleep=0, keep=2) for _ in range(3)]
+    assert list_backups(str(tmp_path)) == [paths[2], paths[1]]
+    path = paths[2]
+    verify_backup(path)
+
+    db.session.add(Family(name='Neskôr', password_hash='x'))
+    db.session.commit()
+    db.session.remove()
+    restore_backup(path, db_path, pages=4, sleep=0)
+    assert [family.name for family in Family.query.all()] == ['Rodina']
+
+
+def test_damaged_backup_is_rejected(app, tmp_path):
+    path = create_backup(wishlist.database_path(), str(tmp_path), sleep=0)
+    with open(path, 'r+b') as f:
+        f.seek(20)
+        f.write(b'garbage')
+    with pytest.raises(ValueError, match='Checksum'):
+        verify_backup(path)
+
+
+def test_backup_window(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'BACKUP_HOURS', '22-3')
+    assert wishlist.in_backup_window(23) and wishlist.in_backup_window(2)
+    assert not wishlist.in_backup_window(12)
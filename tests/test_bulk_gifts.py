@@ -0,0 +1,87 @@
+from app import db, Family, Child, Gift, ChangeEvent, GiftActivityDaily
+
+
+def setup_children(client):
+    family, other = Family(name='Rodina', password_hash='x'), Family(name='Iná', password_hash='x')
+    db.session.add_all([family, other])
+    db.session.flush()
+    ema, jano, cudzie = (Child(name='Ema', family_id=family.id), Child(name='Jano', family_id=family.id),
+                         Child(name='Cudzie', family_id=other.id))
+    db.session.add_all([ema, jano, cudzie])
+    db.session.flush()
+    db.session.add_all([Gift(name=f'Darček {n}', child_id=ema.id, is_purchased=n < 2,
+                             purchased_by='Babka' if n < 2 else None) for n in range(4)])
+    db.session.add(Gift(name='Cudzí darček', child_id=cudzie.id))
+    db.session.commit()
+    with client.session_transaction() as sess:
+        sess.update(admin_id=1, admin_email='a@example.com', family_id=family.id)
+    return ema.id, jano.id, cudzie.id
+
+
+def gift_ids(child_id):
+    return [gift.id for gift in Gift.query.filter_by(child_id=child_id).order_by(Gift.id)]
+
+
+def bulk(client, child_id, action, ids=(), target=None):
+    data = {'action': action, 'gift_ids': [str(i) for i in ids]}
+    if target is not None:
+        data['target_child_id'] = str(target)
+    return client.post(f'/admin/child/{child_id}/gifts/bulk', data=data)
+
+
+def test_bulk_actions_stay_within_the_family(app, client):
+    ema, jano, cudzie = setup_children(client)
+    first, second, third, fourth = gift_ids(ema)
+    foreign = gift_ids(cudzie)[0]
+
+    # Gifts of another child or family are never touched, nor are foreign children targets
+    bulk(client, ema, 'delete', [first, foreign])
+    assert gift_ids(cudzie) == [foreign]
+    assert bulk(client, cudzie, 'delete', [foreign]).status_code == 404
+    bulk(client, ema, 'move', [second], target=cudzie)
+    assert gift_ids(ema) == [second, third, fourth]
+
+    bulk(client, ema, 'unmark', [second, third])
+    gift = db.session.get(Gift, second)
+    assert not gift.is_purchased and gift.purchased_by is None
+    assert ChangeEvent.query.filter_by(entity_id=second, action='unmarked').one().data == '{"purchased_by": "Babka", "purchased_at": null}'
+
+    bulk(client, ema, 'move', [third], target=jano)
+    assert gift_ids(jano) == [third]
+
+    bulk(client, ema, 'duplicate', target=jano)
+    copies = Gift.query.filter(Gift.child_id == jano, Gift.id != third).order_by(Gift.id).all()
+    assert [gift.name for gift in copies] == ['Darček 1', 'Darček 3']
+    assert not any(gift.is_purchased for gift in copies)
+    assert ChangeEvent.query.filter(ChangeEvent.entity_id.in_([gift.id for gift in copies]),
+                                    ChangeEvent.action == 'added').count() == 2
+
+    totals = GiftActivityDaily.query.filter_by(family_id=0).one()
+    assert (totals.deleted, totals.unmarked, totals.added) == (1, 1, 2)
+
+
+def test_copy_of_gifts_from_another_child_copies_nothing(app, client):
+    ema, jano, cudzie = setup_children(client)
+    # A stale form: the selected gifts no longer belong to the child
+    response = bulk(client, ema, 'copy', gift_ids(cudzie), target=jano)
+    assert response.status_code == 302
+    assert gift_ids(jano) == []
+    with client.session_transaction() as sess:
+        assert sess['_flashes'][-1] == ('success', 'Skopírované darčeky: 0')
+
+
+def test_copied_and_moved_gifts_get_ranks_of_their_own(app, client):
+    ema, jano, cudzie = setup_children(client)
+    unranked = gift_ids(ema)
+    assert all(db.session.get(Gift, gift_id).rank is None for gift_id in unranked)
+
+    bulk(client, ema, 'copy', unranked[:3], target=jano)
+    copies = Gift.query.filter_by(child_id=jano).order_by(Gift.rank).all()
+    assert [gift.name for gift in copies] == ['Darček 0', 'Darček 1', 'Darček 2']
+    assert len({gift.rank for gift in copies}) == 3
+
+    # Appended after the copies, still in the list's order
+    bulk(client, ema, 'move', [unranked[3], unranked[0]], target=jano)
+    moved = Gift.query.filter_by(child_id=jano).order_by(Gift.rank).all()
+    assert [gift.name for gift in moved] == ['Darček 0', 'Darček 1', 'Darček 2', 'Darček 0', 'Darček 3']
+    assert moved[3].id == unranked[0] and len({gift.rank for gift in moved}) == 5
@@ -0,0 +1,90 @@
+import sqlite3
+
+from cache import ChildSnapshot, FamilySnapshotCache, SQLiteCacheBackend
+
+
+def loader(value, calls):
+    def load():
+        calls.append(value)
+        return value
+    return load
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = FamilySnapshotCache(maxsize=2)
+    calls = []
+    cache.get(1, 0, loader('one', calls))
+    cache.get(2, 0, loader('two', calls))
+    assert cache.get(1, 0, loader('one again', calls)) == 'one'  # 1 is now the most recent
+    cache.get(3, 0, loader('three', calls))
+
+    assert cache.get(1, 0, loader('one again', calls)) == 'one'
+    assert cache.get(2, 0, loader('two again', calls)) == 'two again'
+    assert calls == ['one', 'two', 'three', 'two again']
+    assert cache.stats()['entries'] == 2
+
+
+def test_new_version_replaces_old_and_invalidate_drops_a_family():
+    cache = FamilySnapshotCache()
+    calls = []
+    cache.get(1, 0, loader('v0', calls))
+    cache.get(2, 0, loader('other', calls))
+    assert cache.get(1, 1, loader('v1', calls)) == 'v1'
+    assert (1, 0) not in cache._entries and cache.stats()['entries'] == 2
+
+    cache.invalidate(1)
+    assert list(cache._entries) == [(2, 0)]
+    assert cache.get(1, 1, loader('v1 rebuilt', calls)) == 'v1 rebuilt'
+
+
+def test_backend_keeps_only_the_latest_version(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    backend = SQLiteCacheBackend(path)
+    snapshot = (ChildSnapshot(5, 'Ema', 7, ()),)
+    backend.set(1, 0, 'old')
+    backend.set(1, 2, snapshot)
+    backend.set(2, 0, 'other')
+
+    assert backend.get(1, 0) is None and backend.get(1, 2) == snapshot
+    with sqlite3.connect(path) as conn:
+        assert conn.execute('SELECT family_id, version FROM snapshot ORDER BY family_id').fetchall() == [(1, 2), (2, 0)]
+
+    backend.delete(1)
+    assert backend.get(1, 2) is None and backend.get(2, 0) == 'other'
+
+
+def test_workers_share_snapshots_through_the_backend(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    first = FamilySnapshotCache(backend=SQLiteCacheBackend(path))
+    second = FamilySnapshotCache(backend=SQLiteCacheBackend(path))
+    calls = []
+
+    first.get(1, 0, loader('built once', calls))
+    assert second.get(1, 0, loader('built twice', calls)) == 'built once'
+    assert calls == ['built once']
+    assert second.stats()['backend_hits'] == 1
+
+    # Invalidation is local; forget reaches the other worker through the backend
+    first.invalidate(1)
+    assert first.get(1, 0, loader('built twice', calls)) == 'built once'
+    first.forget(1)
+    assert FamilySnapshotCache(backend=SQLiteCacheBackend(path)).get(1, 0, loader('rebuilt', calls)) == 'rebuilt'
+
+    second.clear()
+    assert first.get(1, 0, loader('after clear', calls)) == 'after clear'
+
+
+def test_stats_count_every_kind_of_lookup(tmp_path):
+    cache = FamilySnapshotCache(maxsize=8)
+    assert cache.stats()['hit_ratio'] is None
+    calls = []
+    cache.get(1, 0, loader('a', calls))
+    cache.get(1, 0, loader('a', calls))
+    cache.get(1, 0, loader('a', calls))
+    cache.get(2, 0, loader('b', calls))
+
+    assert cache.stats() == {
+        'entries': 2, 'maxsize': 8, 'hits': 2, 'backend_hits': 0, 'misses': 2,
+        'hit_ratio': 0.5, 'backend': None,
+    }
+    assert FamilySnapshotCache(backend=SQLiteCacheBackend(str(tmp_path / 'c.db'))).stats()['backend'] == 'SQLiteCacheBackend'
@@ -0,0 +1,113 @@
+import json
+import time
+from datetime import datetime, timedelta
+
+import app as wishlist
+from app import db, Family, AdminUser, Child, Gift, ChangeEvent
+
+
+def test_gift_changes_are_logged_and_streamed_after_a_cursor(app, client):
+    family = Family(name='Rodina', password_hash='x')
+    db.session.add(family)
+    db.session.flush()
+    child = Child(name='Ema', family_id=family.id)
+    db.session.add_all([child, AdminUser(email='a@example.com', password_hash='x', family_id=family.id)])
+    db.session.commit()
+    family_id, child_id = family.id, child.id
+
+    with client.session_transaction() as sess:
+        sess.update(admin_id=1, admin_email='a@example.com', family_id=family_id)
+    form = {'name': 'Bicykel', 'description': '', 'link': '', 'link2': '', 'image_url': '', 'price_range': '50 €'}
+    client.post(f'/admin/child/{child_id}/gift/add', data=form)
+    gift_id = Gift.query.one().id
+    client.post(f'/admin/gift/{gift_id}/edit', data=dict(form, price_range='60 €'))
+    client.post(f'/gift/{gift_id}/purchase', data={'buyer_name': 'Babka'})
+    client.post(f'/gift/{gift_id}/unmark')
+    client.post(f'/gift/{gift_id}/unmark')  # nothing to unmark, nothing logged
+
+    history = wishlist.gift_history(family_id, gift_id)
+    assert [change.action for change in history] == ['unmarked', 'purchased', 'edited', 'added']
+    assert json.loads(history[0].data)['purchased_by'] == 'Babka'
+    assert json.loads(history[2].data) == {'price_range': ['50 €', '60 €']}
+    assert history[2].actor == 'a@example.com'
+
+    with client.session_transaction() as sess:
+        sess['superadmin_id'] = 1
+    first = ChangeEvent.query.order_by(ChangeEvent.id).first().id
+    response = client.get(f'/superadmin/changes?after={first}')
+    assert response.mimetype == 'application/x-ndjson'
+    events = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [event['action'] for event in events] == ['edited', 'purchased', 'unmarked']
+    assert all(event['id'] > first and event['entity_id'] == gift_id for event in events)
+
+    response = client.get(f"/superadmin/changes?after={events[-1]['id']}")
+    assert response.get_data(as_text=True) == ''
+
+
+def test_change_feed_pages_through_batches(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, 'CHANGE_FEED_BATCH', 2)
+    for n in range(5):
+        wishlist.record_change(1, Child(id=n + 1, name='x', family_id=1), 'added')
+    wishlist.record_change(2, Child(id=9, name='y', family_id=2), 'added')
+    db.session.commit()
+
+    with client.session_transaction() as sess:
+        sess['superadmin_id'] = 1
+    lines = client.get('/superadmin/changes?family=1&limit=4').get_data(as_text=True).splitlines()
+    assert [json.loads(line)['entity_id'] for line in lines] == [1, 2, 3, 4]
+
+
+def test_change_feed_long_poll_waits_for_events(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, 'CHANGE_FEED_POLL_INTERVAL', 0.05)
+    with client.session_transaction() as sess:
+        sess['superadmin_id'] = 1
+    started = time.monotonic()
+    assert client.get('/superadmin/changes?wait=0.2').get_data(as_text=True) == ''
+    assert time.monotonic() - started >= 0.2
+
+    wishlist.record_change(1, Child(id=1, name='x', family_id=1), 'added')
+    db.session.commit()
+    started = time.monotonic()
+    assert len(client.get('/superadmin/changes?wait=30').get_data(as_text=True).splitlines()) == 1
+    assert time.monotonic() - started < 5
+
+
+def test_gift_history_is_scoped_to_the_family(app, client):
+    family, other = Family(name='Rodina', password_hash='x'), Family(name='Iná', password_hash='x')
+    db.session.add_all([family, other])
+    db.session.flush()
+    child = Child(name='Ema', family_id=family.id)
+    db.session.add(child)
+    db.session.flush()
+    gift = Gift(name='Lopta', child_id=child.id)
+    db.session.add(gift)
+    db.session.flush()
+    # Another shard's gift with the same id, or a purged one whose id was reused
+    wishlist.record_change(other.id, ('gift', gift.id), 'edited', actor='cudzi@example.com', data={'name': ['Tajné', 'x']})
+    wishlist.record_change(family.id, gift, 'added')
+    db.session.commit()
+
+    assert [change.action for change in wishlist.gift_history(family.id, gift.id)] == ['added']
+    with client.session_transaction() as sess:
+        sess.update(admin_id=1, family_id=family.id)
+    assert 'cudzi@example.com' not in client.get(f'/admin/gift/{gift.id}/edit').get_data(as_text=True)
+    with client.session_transaction() as sess:
+        sess['family_id'] = other.id
+    assert client.get(f'/admin/gift/{gift.id}/edit').status_code == 404
+
+
+def test_old_events_are_pruned_in_batches_of_their_own_size(app, monkeypatch):
+    old = datetime.utcnow() - timedelta(days=400)
+    db.session.add_all([ChangeEvent(created_at=old, family_id=1, entity='gift', entity_id=n, action='added')
+                        for n in range(5)])
+    db.session.add(ChangeEvent(family_id=1, entity='gift', entity_id=9, action='added'))
+    db.session.commit()
+    monkeypatch.setitem(app.config, 'CHANGE_EVENT_PRUNE_BATCH', 2)
+    monkeypatch.setitem(app.config, 'RESET_TOKEN_PRUNE_BATCH', 1)
+    commits = []
+    commit = db.session.commit
+    monkeypatch.setattr(db.session, 'commit', lambda: commits.append(1) or commit())
+
+    assert wishlist.prune_change_events() == 5
+    assert len(commits) == 3
+    assert [event.entity_id for event in ChangeEvent.query] == [9]
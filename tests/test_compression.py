@@ -0,0 +1,102 @@
+import gzip
+import os
+import zlib
+
+from flask import Flask, Response, jsonify, stream_with_context
+
+from compression import ResponseCompression
+
+PAGE = '<p>' + 'Darček pre Emu. ' * 100 + '</p>'
+
+
+def make_app(**config):
+    app = Flask(__name__)
+    app.config.update(config)
+    ResponseCompression(app)
+    produced = []
+
+    @app.route('/page')
+    def page():
+        return PAGE
+
+    @app.route('/small')
+    def small():
+        return '<p>ok</p>'
+
+    @app.route('/json')
+    def json():
+        return jsonify(items=[PAGE])
+
+    @app.route('/text')
+    def text():
+        return Response(PAGE, mimetype='text/plain')
+
+    @app.route('/encoded')
+    def encoded():
+        return Response(gzip.compress(PAGE.encode()), mimetype='text/html', headers={'Content-Encoding': 'gzip'})
+
+    @app.route('/stream')
+    def stream():
+        def generate():
+            for n in range(3):
+                produced.append(n)
+                yield f'<section>{n}</section>'
+        return Response(stream_with_context(generate()), mimetype='text/html')
+
+    return app, produced
+
+
+def test_gzip_is_negotiated_by_accept_encoding():
+    client = make_app()[0].test_client()
+
+    response = client.get('/page', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.get_data()).decode() == PAGE
+    assert 'Accept-Encoding' in response.vary
+    assert client.get('/json', headers={'Accept-Encoding': 'gzip'}).headers['Content-Encoding'] == 'gzip'
+
+    plain = client.get('/page')
+    assert 'Content-Encoding' not in plain.headers and plain.get_data(as_text=True) == PAGE
+    assert 'Accept-Encoding' in plain.vary
+    assert 'Content-Encoding' not in client.get('/page', headers={'Accept-Encoding': 'gzip;q=0'}).headers
+
+
+def test_small_other_and_encoded_responses_are_left_alone():
+    client = make_app()[0].test_client()
+    headers = {'Accept-Encoding': 'gzip'}
+
+    assert client.get('/small', headers=headers).get_data(as_text=True) == '<p>ok</p>'
+    assert 'Content-Encoding' not in client.get('/text', headers=headers).headers
+    encoded = client.get('/encoded', headers=headers)
+    assert gzip.decompress(encoded.get_data()).decode() == PAGE
+    assert client.head('/page', headers=headers).headers.get('Content-Encoding') is None
+
+    disabled = make_app(COMPRESS_ENABLED=False)[0].test_client()
+    assert 'Content-Encoding' not in disabled.get('/page', headers=headers).headers
+
+
+def test_streamed_responses_are_compressed_chunk_by_chunk():
+    app, produced = make_app()
+    response = app.test_client().get('/stream', headers={'Accept-Encoding': 'gzip'}, buffered=False)
+    assert response.headers['Content-Encoding'] == 'gzip' and 'Content-Length' not in response.headers
+
+    decompressor = zlib.decompressobj(31)
+    chunks = iter(response.response)
+    # Each chunk is flushed, so it can be read before the next one is even rendered
+    assert decompressor.decompress(next(chunks)) == b'<section>0</section>'
+    assert produced == [0]
+    rest = b''.join(decompressor.decompress(chunk) for chunk in chunks) + decompressor.flush()
+    assert rest == b'<section>1</section><section>2</section>'
+    response.close()
+
+
+def test_templates_are_compiled_once_into_the_bytecode_cache(app, client):
+    cache_dir = app.config['JINJA_CACHE_DIR']
+    assert client.get('/family-login').status_code == 200
+    assert any(name.endswith('.cache') for name in os.listdir(cache_dir))
+
+    # A fresh worker finds the compiled template instead of parsing it again
+    env = app.jinja_env
+    source, filename, _ = env.loader.get_source(env, 'family_login.html')
+    bucket = env.bytecode_cache.get_bucket(env, 'family_login.html', filename, source)
+    assert bucket.code is not None
@@ -0,0 +1,109 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import app as wishlist
+from app import db, Family, Child, Gift, LinkMetadata
+from enrichment import canonical_url, parse_metadata
+
+PRODUCT_PAGE = b"""<!DOCTYPE html>
+<html><head>
+<title>Obchod - Lopta</title>
+<meta property="og:title" content="Futbalova lopta">
+<script type="application/ld+json">
+{"@context": "https://schema.org", "@type": "Product", "name": "Lopta",
+ "image": "/img/lopta.jpg", "offers": {"@type": "Offer", "price": "24.90", "priceCurrency": "EUR"}}
+</script>
+</head><body>Lopta</body></html>"""
+
+
+class StubShop(BaseHTTPRequestHandler):
+    hits = 0
+
+    def do_GET(self):
+        StubShop.hits += 1
+        if self.path.startswith('/redirect'):
+            # Sends a visitor of the public name on to the loopback address
+            self.send_response(302)
+            self.send_header('Location', f'http://127.0.0.1:{self.server.server_address[1]}/p/1')
+            self.end_headers()
+            return
+        if self.path.startswith('/img/'):
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/jpeg')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(PRODUCT_PAGE)))
+        self.end_headers()
+        self.wfile.write(PRODUCT_PAGE)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def shop():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubShop)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    StubShop.hits = 0
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+
+
+def test_canonical_url_drops_tracking_and_fragments():
+    assert canonical_url('HTTPS://Shop.example:443/p?utm_source=x&b=2&a=1#top') == 'https://shop.example/p?a=1&b=2'
+
+
+def test_parse_metadata_prefers_opengraph_and_falls_back_to_json_ld():
+    data = parse_metadata(PRODUCT_PAGE.decode(), 'https://shop.example/p/1')
+    assert data == {
+        'title': 'Futbalova lopta',
+        'image': 'https://shop.example/img/lopta.jpg',
+        'price': '24.90',
+        'currency': 'EUR',
+    }
+
+
+def test_enrichment_fills_empty_price_and_caches_by_canonical_url(app, shop, monkeypatch):
+    monkeypatch.setattr(wishlist.link_fetcher, 'allow_private', True)
+    monkeypatch.setattr(wishlist.link_fetcher.rate_limiter, 'min_interval', 0)
+
+    family = Family(name='Rodina', password_hash='x')
+    db.session.add(family)
+    db.session.flush()
+    child = Child(name='Ema', family_id=family.id)
+    db.session.add(child)
+    db.session.flush()
+    first = Gift(name='Lopta', link=f'{shop}/p/1?utm_source=mail', child_id=child.id)
+    second = Gift(name='Lopta 2', link=f'{shop}/p/1', price_range='20 €', child_id=child.id)
+    db.session.add_all([first, second])
+    db.session.commit()
+
+    wishlist.enrich_gift_links(first.id)
+    wishlist.enrich_gift_links(second.id)
+
+    assert StubShop.hits == 1
+    assert LinkMetadata.query.count() == 1
+    assert db.session.get(Gift, first.id).price_range == '24.90 €'
+    assert db.session.get(Gift, second.id).price_range == '20 €'
+
+
+def test_private_hosts_are_not_fetched(app, shop):
+    metadata = wishlist.get_link_metadata(f'{shop}/p/1')
+    assert metadata.status == 'error'
+    assert StubShop.hits == 0
+
+
+def test_redirects_to_private_hosts_are_not_followed(app, shop, monkeypatch):
+    import enrichment
+
+    monkeypatch.setattr(wishlist.link_fetcher.rate_limiter, 'min_interval', 0)
+    # Pretend "localhost" is a public shop; the address it redirects to is not
+    monkeypatch.setattr(enrichment, 'is_public_host', lambda host: host == 'localhost')
+    metadata = wishlist.get_link_metadata(shop.replace('127.0.0.1', 'localhost') + '/redirect')
+    assert metadata.status == 'error' and metadata.title is None
+    assert StubShop.hits == 1
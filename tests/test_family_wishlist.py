@@ -0,0 +1,34 @@
+from app import db, Family, Child, Gift
+
+
+def test_whole_family_page_streams_every_child(app, client):
+    family = Family(name='Rodina', password_hash='x')
+    db.session.add(family)
+    db.session.flush()
+    jano, ema, adam = (Child(name=name, family_id=family.id) for name in ('Jano', 'Ema', 'Adam'))
+    db.session.add_all([jano, ema, adam])
+    db.session.flush()
+    db.session.add_all([
+        Gift(name='Lego', child_id=ema.id, rank='2'),
+        Gift(name='Kniha', child_id=ema.id, rank='1', is_purchased=True, purchased_by='Babka'),
+        Gift(name='Lopta', child_id=ema.id, rank='3'),
+        Gift(name='Bicykel', child_id=jano.id, rank='1'),
+    ])
+    db.session.commit()
+    ema_id = ema.id
+    lopta = Gift.query.filter_by(name='Lopta').one().id
+
+    with client.session_transaction() as sess:
+        sess['family_id'] = family.id
+    response = client.get('/family-wishlist')
+    assert response.is_streamed
+    page = response.get_data(as_text=True)
+    # Children by name, each list available first and in rank order
+    order = [page.index(text) for text in ('id="child-', 'Adam', 'Ema', 'Lego', 'Lopta', 'Kniha', 'Jano', 'Bicykel')]
+    assert order == sorted(order)
+    assert 'Zoznam darčekov tohto dieťaťa je prázdny' in page
+    assert 'Kúpil/a: <strong>Babka</strong>' in page
+
+    response = client.post(f'/gift/{lopta}/purchase', data={'buyer_name': 'Teta', 'return_to': 'family'})
+    assert response.location.endswith(f'/family-wishlist#child-{ema_id}')
+    assert db.session.get(Gift, lopta).purchased_by == 'Teta'
@@ -0,0 +1,105 @@
+import requests
+
+from imagecheck import ImageURLValidator
+from outbound import OutboundClient
+
+ADDRESSES = {
+    'shop.example': ('93.184.216.34',),
+    'public172.example': ('172.64.1.1',),
+    'intranet.example': ('10.0.0.5',),
+    'v6.example': ('2606:4700::1', 'fd00::1'),
+    'nat64.example': ('64:ff9b::a00:1',),
+    'sixtofour.example': ('2002:a00:1::',),
+    'public-nat64.example': ('64:ff9b::808:808',),
+}
+
+
+class FakeDNS:
+    def __init__(self):
+        self.lookups = []
+
+    def addresses(self, host):
+        self.lookups.append(host)
+        return ADDRESSES.get(host, ())
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers):
+        self.status_code = status_code
+        self.headers = requests.structures.CaseInsensitiveDict(headers)
+        self.is_redirect = 'Location' in self.headers
+
+
+class FakeClient(OutboundClient):
+    """Answers from `responses`; redirects are followed by the real OutboundClient.follow"""
+
+    def __init__(self, responses):
+        super().__init__()
+        self.responses = responses
+        self.requested = []
+
+    def request(self, method, url, **kwargs):
+        assert method == 'HEAD' and kwargs.get('allow_redirects') is False
+        self.requested.append(url)
+        return self.responses[url]
+
+
+def test_cheap_checks_run_before_any_lookup_or_request():
+    dns, client = FakeDNS(), FakeClient({})
+    validator = ImageURLValidator(client, dns)
+    assert validator.validate('') == (True, None)
+    assert validator.validate('/static/uploads/lopta.jpg') == (True, None)
+    assert validator.validate('ftp://shop.example/a.jpg')[0] is False
+    assert validator.validate('https://shop.example/a.jpg?x=<script>')[1] == 'URL contains potentially dangerous content'
+    assert validator.validate('http://127.0.0.1/a.jpg')[1] == 'Private network URLs are not allowed'
+    assert validator.validate('http://[::1]/a')[1] == 'Private network URLs are not allowed'
+    assert validator.validate('http://[64:ff9b::7f00:1]/a.jpg')[1] == 'Private network URLs are not allowed'
+    # Local upload paths are no way around the dangerous-content check
+    assert validator.validate('/static/uploads/x.jpg" onerror="alert(1)')[1] == \
+        'URL contains potentially dangerous content'
+    assert dns.lookups == [] and client.requested == []
+
+
+def test_addresses_are_classified_after_resolving():
+    validator = ImageURLValidator(FakeClient({}), FakeDNS())
+    assert validator.validate('https://public172.example/a.png') == (True, None)
+    assert validator.validate('https://intranet.example/a.png')[0] is False
+    assert validator.validate('https://v6.example/a.png')[0] is False
+    # NAT64 and 6to4 addresses count as global, so the IPv4 address inside them decides
+    assert validator.validate('https://nat64.example/a.png')[0] is False
+    assert validator.validate('https://sixtofour.example/a.png')[0] is False
+    assert validator.validate('https://public-nat64.example/a.png') == (True, None)
+    # Plain image links to names that do not resolve here still load for users
+    assert validator.validate('https://unknown.example/a.png') == (True, None)
+
+
+def test_probe_follows_redirects_only_to_public_hosts():
+    client = FakeClient({
+        'https://shop.example/img': FakeResponse(302, {'Location': '/img/1'}),
+        'https://shop.example/img/1': FakeResponse(200, {'Content-Type': 'image/webp'}),
+        'https://shop.example/page': FakeResponse(200, {'Content-Type': 'text/html'}),
+        'https://shop.example/sneaky': FakeResponse(301, {'Location': 'http://intranet.example/admin'}),
+    })
+    validator = ImageURLValidator(client, FakeDNS())
+    results = validator.validate_many([
+        'https://shop.example/img', 'https://shop.example/page', 'https://shop.example/sneaky',
+        'https://shop.example/img', 'javascript:alert(1)',
+    ])
+    assert results['https://shop.example/img'] == (True, None)
+    assert results['https://shop.example/page'] == (False, 'URL does not point to an image file')
+    assert results['https://shop.example/sneaky'] == (False, 'Private network URLs are not allowed')
+    assert results['javascript:alert(1)'][0] is False
+    assert sorted(client.requested) == sorted(['https://shop.example/img', 'https://shop.example/img/1',
+                                               'https://shop.example/page', 'https://shop.example/sneaky'])
+    assert 'http://intranet.example/admin' not in client.requested
+
+
+def test_probe_gives_up_on_loops_and_odd_redirects():
+    client = FakeClient({
+        'https://shop.example/loop': FakeResponse(302, {'Location': '/loop'}),
+        'https://shop.example/ftp': FakeResponse(302, {'Location': 'ftp://shop.example/a'}),
+    })
+    validator = ImageURLValidator(client, FakeDNS())
+    assert validator.validate('https://shop.example/loop') == (False, 'Could not verify image URL: More than 5 redirects')
+    assert client.requested.count('https://shop.example/loop') == 6
+    assert validator.validate('https://shop.example/ftp')[1].startswith('Could not verify image URL: Redirect to')
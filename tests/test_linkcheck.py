@@ -0,0 +1,86 @@
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import app as wishlist
+from app import db, Family, Child, Gift, UrlCheck
+from linkcheck import LinkChecker, DEAD, ERROR
+from outbound import OutboundClient
+
+
+class StubShop(BaseHTTPRequestHandler):
+    conditional = 0
+
+    def do_HEAD(self):
+        if self.path.startswith('/gone'):
+            self.send_response(404)
+        elif self.path.startswith('/moved'):
+            self.send_response(301)
+            self.send_header('Location', f'http://127.0.0.1:{self.server.server_address[1]}/gone')
+        elif self.headers.get('If-None-Match') == '"v1"':
+            StubShop.conditional += 1
+            self.send_response(304)
+        else:
+            self.send_response(200)
+            self.send_header('ETag', '"v1"')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def shop(monkeypatch):
+    monkeypatch.setattr(wishlist.link_checker, 'allow_private', True)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubShop)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    StubShop.conditional = 0
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+
+
+def test_sweep_marks_dead_links_and_revalidates_conditionally(app, client, shop):
+    family = Family(name='Rodina', password_hash='x')
+    db.session.add(family)
+    db.session.flush()
+    child = Child(name='Ema', family_id=family.id)
+    db.session.add(child)
+    db.session.flush()
+    gift = Gift(name='Lopta', link=f'{shop}/p/1', link2=f'{shop}/gone',
+                image_url='/static/uploads/lopta.jpg', child_id=child.id)
+    db.session.add(gift)
+    db.session.commit()
+
+    assert wishlist.sweep_links() == 1
+    gift = db.session.get(Gift, gift.id)
+    assert (gift.link_status, gift.link2_status, gift.image_status) == ('ok', 'dead', None)
+    assert wishlist.sweep_links() == 0
+
+    # Once the results are old enough, the next sweep sends the stored ETag
+    UrlCheck.query.update({'checked_at': datetime.utcnow() - timedelta(days=30)})
+    Gift.query.update({'links_checked_at': datetime.utcnow() - timedelta(days=30)})
+    db.session.commit()
+    assert wishlist.sweep_links() == 1
+    assert StubShop.conditional == 1
+    assert db.session.get(Gift, gift.id).link_status == 'ok'
+
+    with client.session_transaction() as sess:
+        sess['admin_id'] = 1
+        sess['family_id'] = family.id
+    response = client.get('/admin/broken-links')
+    assert 'Lopta' in response.get_data(as_text=True)
+
+
+def test_each_redirect_hop_is_checked(shop, monkeypatch):
+    import linkcheck
+
+    public = shop.replace('127.0.0.1', 'localhost')
+    monkeypatch.setattr(linkcheck, 'is_public_host', lambda host: host == 'localhost')
+    checker = LinkChecker(OutboundClient())
+    # Only "localhost" counts as public, so its redirect to the loopback address is refused
+    assert checker.check_one(f'{public}/moved').status == ERROR
+    checker.allow_private = True
+    assert checker.check_one(f'{public}/moved') == (f'{public}/moved', DEAD, 404, None, None)
@@ -0,0 +1,69 @@
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from outbound import CircuitOpenError, OutboundClient, ResponseTooLarge
+
+
+def closed_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def test_breaker_fails_fast_after_repeated_failures():
+    client = OutboundClient(timeout=(0.5, 0.5), breaker_threshold=2, breaker_cooldown=60)
+    url = f'http://127.0.0.1:{closed_port()}/'
+
+    for _ in range(2):
+        with pytest.raises(requests.exceptions.ConnectionError):
+            client.get(url)
+    with pytest.raises(CircuitOpenError):
+        client.get(url)
+
+    stats = client.stats()['127.0.0.1']
+    assert (stats['requests'], stats['errors'], stats['rejected'], stats['breaker']) == (2, 2, 1, 'open')
+
+
+class BigPage(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.end_headers()
+        self.wfile.write(b'x' * 1000)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_oversized_response_closes_a_half_open_breaker():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), BigPage)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = OutboundClient(timeout=(0.5, 0.5), breaker_threshold=1, breaker_cooldown=0.05)
+    try:
+        with pytest.raises(requests.exceptions.ConnectionError):
+            client.get(f'http://127.0.0.1:{closed_port()}/')
+        time.sleep(0.1)
+        assert client.stats()['127.0.0.1']['breaker'] == 'half-open'
+
+        # The trial call reached the host, so the breaker closes even though the body was refused
+        with pytest.raises(ResponseTooLarge, match='127.0.0.1 is larger than 100 bytes'):
+            client.get(f'http://127.0.0.1:{server.server_address[1]}/', max_bytes=100)
+        stats = client.stats()['127.0.0.1']
+        assert (stats['requests'], stats['errors'], stats['breaker']) == (2, 1, 'closed')
+        assert client.get(f'http://127.0.0.1:{server.server_address[1]}/', max_bytes=100, truncate=True).truncated
+    finally:
+        server.shutdown()
+
+
+def test_addresses_embedding_private_ipv4_are_not_public():
+    from outbound import is_public_address
+
+    assert is_public_address('93.184.216.34') and is_public_address('64:ff9b::808:808')
+    for address in ('10.0.0.1', '::ffff:127.0.0.1', '64:ff9b::a00:1', '2002:a00:1::', '2002:7f00:1::',
+                    '64:ff9b:1::808:808', 'fd00::1'):
+        assert not is_public_address(address), address
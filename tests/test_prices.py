@@ -0,0 +1,64 @@
+import pytest
+
+import app as wishlist
+from app import db, Family, Child, Gift
+from prices import parse_price
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('50 €', (50.0, 50.0, 'EUR')),
+    ('20-30 EUR', (20.0, 30.0, 'EUR')),
+    ('$10–$20', (10.0, 20.0, 'USD')),
+    ('približne 1 299 Kč', (1299.0, 1299.0, 'CZK')),
+    ('19,99', (19.99, 19.99, None)),
+    ('1.250,50 €', (1250.5, 1250.5, 'EUR')),
+    ('do 30 €', (0.0, 30.0, 'EUR')),
+    ('od 20', (20.0, None, None)),
+    ('podľa dohody', (None, None, None)),
+    ('', (None, None, None)),
+])
+def test_parse_price(text, expected):
+    assert parse_price(text) == expected
+
+
+def test_backfill_and_filters(app, client, monkeypatch):
+    family = Family(name='Rodina', password_hash='x')
+    db.session.add(family)
+    db.session.flush()
+    child = Child(name='Ema', family_id=family.id)
+    db.session.add(child)
+    db.session.flush()
+    # Gifts from before the price columns existed
+    db.session.add_all([
+        Gift(name='Lego', price_range='40-60 €', child_id=child.id, rank='1'),
+        Gift(name='Kniha', price_range='12 €', child_id=child.id, rank='2'),
+        Gift(name='Ponožky', price_range='5 €', child_id=child.id, rank='3', is_purchased=True),
+        Gift(name='Prekvapenie', price_range='?', child_id=child.id, rank='4'),
+    ])
+    db.session.commit()
+    family_id, child_id = family.id, child.id
+
+    monkeypatch.setitem(app.config, 'PRICE_BACKFILL_BATCH', 2)
+    assert wishlist.backfill_prices() == 3
+    assert wishlist.backfill_prices() == 0
+    lego = Gift.query.filter_by(name='Lego').one()
+    assert (lego.price_min, lego.price_max, lego.price_currency) == (40.0, 60.0, 'EUR')
+
+    with client.session_transaction() as sess:
+        sess.update(admin_id=1, admin_email='a@example.com', family_id=family_id)
+    assert 'nevyhovujú filtru' in client.get(f'/admin/child/{child_id}/gifts?max_price=1').get_data(as_text=True)
+    form = {'name': 'Bicykel', 'description': '', 'link': '', 'link2': '', 'image_url': '', 'price_range': '150 €'}
+    client.post(f'/admin/child/{child_id}/gift/add', data=form)
+    bike = Gift.query.filter_by(name='Bicykel').one()
+    assert bike.price_min == 150.0
+    client.post(f'/admin/gift/{bike.id}/edit', data=dict(form, price_range='do 20 €'))
+    db.session.refresh(bike)
+    assert (bike.price_min, bike.price_max) == (0.0, 20.0)
+
+    page = client.get(f'/child/{child_id}?max_price=30&available=1&sort=price').get_data(as_text=True)
+    assert page.index('Bicykel') < page.index('Kniha')
+    assert 'Lego' not in page and 'Ponožky' not in page and 'Prekvapenie' not in page
+
+    page = client.get(f'/admin/child/{child_id}/gifts?sort=price_desc').get_data(as_text=True)
+    assert page.index('Lego') < page.index('Kniha') < page.index('Ponožky')
+    assert 'data-reorder-url' not in page
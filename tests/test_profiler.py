@@ -0,0 +1,95 @@
+import os
+import time
+
+import pytest
+from flask import Flask
+
+import app as wishlist
+from profiler import CONTROL_FILE, SamplingProfiler
+
+
+def make_app(directory, **config):
+    app = Flask(__name__)
+    app.config.update(SECRET_KEY='test', PROFILER_DIR=str(directory), PROFILER_INTERVAL=0.001, **config)
+    profiler = SamplingProfiler(app)
+
+    @app.route('/slow')
+    def slow():
+        time.sleep(0.02)
+        return 'slow'
+
+    @app.route('/fast')
+    def fast():
+        return 'fast'
+
+    return app, profiler
+
+
+def test_signed_header_profiles_one_request(tmp_path):
+    app, profiler = make_app(tmp_path)
+    client = app.test_client()
+
+    client.get('/slow')
+    client.get('/slow', headers={'X-Profile': 'forged'})
+    assert profiler.recent_profiles() == []
+
+    client.get('/slow', headers={'X-Profile': profiler.make_token()})
+    [meta] = profiler.recent_profiles()
+    assert (meta['endpoint'], meta['path'], meta['method']) == ('slow', '/slow', 'GET')
+    assert meta['samples'] > 0 and meta['duration_ms'] >= 20
+    with open(profiler.profile_path(meta['name'])) as f:
+        stacks = f.read().splitlines()
+    # Collapsed stacks, outermost frame first, each with its sample count
+    assert any('slow (test_profiler.py' in line for line in stacks)
+    assert all(line.rsplit(' ', 1)[1].isdigit() for line in stacks)
+
+
+def test_sample_rate_is_shared_through_the_control_file(tmp_path, monkeypatch):
+    monkeypatch.setattr('profiler.CONTROL_REFRESH_SECONDS', 0)
+    app, profiler = make_app(tmp_path)
+    # Another worker process sharing PROFILER_DIR
+    worker, worker_profiler = make_app(tmp_path)
+
+    profiler.configure(1.0, endpoint='slow', minutes=5)
+    assert os.path.isfile(tmp_path / CONTROL_FILE)
+    worker.test_client().get('/fast')
+    worker.test_client().get('/slow')
+    assert [meta['endpoint'] for meta in worker_profiler.recent_profiles()] == ['slow']
+    assert worker_profiler.settings()['sample_rate'] == 1.0
+
+    profiler.configure(0)
+    worker.test_client().get('/slow')
+    assert len(worker_profiler.recent_profiles()) == 1
+    assert worker_profiler.settings()['expires_at'] is None
+
+
+def test_old_profiles_are_rotated_out(tmp_path):
+    app, profiler = make_app(tmp_path, PROFILER_MAX_PROFILES=2)
+    client = app.test_client()
+    for path in ('/fast', '/slow', '/fast'):
+        client.get(path, headers={'X-Profile': profiler.make_token()})
+    assert [meta['endpoint'] for meta in profiler.recent_profiles()] == ['fast', 'slow']
+    assert len(os.listdir(tmp_path)) == 4
+
+
+def test_profiles_page(app, client, tmp_path, monkeypatch):
+    monkeypatch.setattr(wishlist.profiler, 'directory', str(tmp_path))
+    assert client.get('/superadmin/profiles').status_code == 302
+    with client.session_transaction() as sess:
+        sess['superadmin_id'] = 1
+
+    client.get('/manifest.webmanifest', headers={'X-Profile': wishlist.profiler.make_token()})
+    [meta] = wishlist.profiler.recent_profiles()
+    page = client.get('/superadmin/profiles').get_data(as_text=True)
+    assert meta['name'] in page and '/manifest.webmanifest' in page
+
+    download = client.get(f"/superadmin/profiles/{meta['name']}")
+    assert download.status_code == 200 and download.mimetype == 'text/plain'
+    assert client.get('/superadmin/profiles/..%2Fsecret').status_code == 404
+
+    response = client.post('/superadmin/profiles', data={'sample_rate': '0.5', 'endpoint': 'nope', 'minutes': '5'})
+    assert 'Neznámy endpoint' in response.get_data(as_text=True)
+    client.post('/superadmin/profiles', data={'sample_rate': '0.5', 'endpoint': 'child_gifts', 'minutes': '5'})
+    monkeypatch.setattr(wishlist.profiler, '_control_checked', 0.0)
+    assert wishlist.profiler.settings()['sample_rate'] == pytest.approx(0.5)
+    wishlist.profiler.configure(0)
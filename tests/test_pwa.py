@@ -0,0 +1,160 @@
+import json
+import shutil
+import subprocess
+
+import pytest
+
+from app import db, Family, Child, Gift
+
+# Runs replayQueue of the rendered service worker in node, with the browser APIs stubbed
+REPLAY_HARNESS = """
+const result = {dequeued: [], notified: []};
+queued = async () => [{id: 1, url: 'http://localhost/gift/1/purchase', body: 'buyer_name=Teta'}];
+dequeue = async id => { result.dequeued.push(id); };
+notify = async message => { result.notified.push(message.type); };
+globalThis.fetch = async (url, options) => url === '/family-dashboard'
+    ? {ok: true, redirected: false, text: async () => '<meta name="csrf-token" content="t">'}
+    : Object.assign({ok: false, status: 0, type: 'basic'}, RESPONSE);
+replayQueue().then(() => console.log(JSON.stringify(result)));
+"""
+
+# Sends fetch events through the rendered service worker, recording the caches it drops
+EVENTS_HARNESS = """
+const result = {deleted: [], queueCleared: false, notified: []};
+caches.delete = async name => { result.deleted.push(name); return true; };
+transaction = async () => { result.queueCleared = true; };
+openQueue = async () => null;
+notify = async message => { result.notified.push(message.type); };
+const pages = {};
+caches.open = async () => ({
+    match: async request => pages[request.url] && new Response(pages[request.url]),
+    put: async () => null,
+});
+const page = (list, token) => `<meta name="csrf-token" content="${token}"><ul>${list}</ul>` +
+    `<input type="hidden" name="csrf_token" value="${token}"/>`;
+async function dispatch(method, path, mode) {
+    const event = {
+        request: {method: method, url: 'http://localhost' + path, mode: mode || 'same-origin'},
+        resultingClientId: 'tab',
+        waitUntil() {},
+        respondWith(response) { this.response = response; },
+    };
+    listeners.fetch(event);
+    await event.response;
+    await new Promise(resolve => setTimeout(resolve, 20));
+    return event;
+}
+(async () => {
+    const report = {};
+    for (const [name, method, path] of [['admin-logout', 'GET', '/admin-logout'],
+                                        ['family-logout', 'GET', '/family-logout'],
+                                        ['family-login', 'POST', '/family-login'],
+                                        ['admin-login', 'POST', '/admin-login']]) {
+        Object.assign(result, {deleted: [], queueCleared: false});
+        await dispatch(method, path);
+        report[name] = {deleted: result.deleted.sort(), queueCleared: result.queueCleared};
+    }
+    for (const [name, fresh] of [['new-token', page('Lego', 'b')], ['new-gift', page('Lego, Bábika', 'b')]]) {
+        pages['http://localhost/family-dashboard'] = page('Lego', 'a');
+        const response = {ok: true, type: 'basic', redirected: false, text: async () => fresh};
+        response.clone = () => response;
+        globalThis.fetch = async () => response;
+        result.notified = [];
+        await dispatch('GET', '/family-dashboard', 'navigate');
+        report[name] = result.notified;
+    }
+    console.log(JSON.stringify(report));
+})();
+"""
+
+
+def run_service_worker(client, tmp_path, harness):
+    """Run the rendered service worker in node followed by `harness`, returns what it printed as JSON"""
+    script = client.get('/service-worker.js').get_data(as_text=True)
+    stubs = ("globalThis.listeners = {};\n"
+             "globalThis.self = {addEventListener(type, listener) { listeners[type] = listener; }, "
+             "location: {origin: 'http://localhost'}};\n"
+             "globalThis.caches = {delete: async () => true};\n"
+             "globalThis.fetch = async () => new Response('');\n")
+    path = tmp_path / 'worker.js'
+    path.write_text(stubs + script + harness)
+    output = subprocess.run(['node', str(path)], capture_output=True, text=True, timeout=30, check=True).stdout
+    return json.loads(output)
+
+
+def test_manifest_and_service_worker(client):
+    manifest = client.get('/manifest.webmanifest')
+    assert manifest.mimetype == 'application/manifest+json'
+    assert manifest.get_json()['start_url'] == '/family-dashboard'
+
+    worker = client.get('/service-worker.js')
+    assert worker.mimetype == 'text/javascript'
+    assert 'no-cache' in worker.headers['Cache-Control']
+    script = worker.get_data(as_text=True)
+    assert 'const SHELL_URLS = ["/static/' in script and '{{' not in script
+
+
+def test_replayed_purchase_does_not_take_over_a_bought_gift(app, client):
+    family = Family(name='Rodina', password_hash='x')
+    db.session.add(family)
+    db.session.flush()
+    child = Child(name='Ema', family_id=family.id)
+    db.session.add(child)
+    db.session.flush()
+    gift = Gift(name='Lego', child_id=child.id, is_purchased=True, purchased_by='Babka')
+    db.session.add(gift)
+    db.session.commit()
+    gift_id = gift.id
+
+    with client.session_transaction() as sess:
+        sess['family_id'] = family.id
+    queued = {'buyer_name': 'Teta', 'if_available': '1'}
+    assert client.post(f'/gift/{gift_id}/purchase', data=queued).status_code == 409
+    assert db.session.get(Gift, gift_id).purchased_by == 'Babka'
+    assert client.post(f'/gift/{gift_id}/purchase', data=dict(queued, buyer_name='Babka')).status_code == 302
+
+
+def test_replayed_actions_answer_without_a_redirect(app, client):
+    family = Family(name='Rodina', password_hash='x')
+    db.session.add(family)
+    db.session.flush()
+    child = Child(name='Ema', family_id=family.id)
+    db.session.add(child)
+    db.session.flush()
+    gift = Gift(name='Lego', child_id=child.id)
+    db.session.add(gift)
+    db.session.commit()
+    gift_id = gift.id
+
+    replayed = {'buyer_name': 'Teta', 'if_available': '1', 'replay': '1'}
+    # Signed out, the action is answered with the login redirect, which the worker must not take for success
+    assert client.post(f'/gift/{gift_id}/purchase', data=replayed).status_code == 302
+    with client.session_transaction() as sess:
+        sess['family_id'] = family.id
+    assert client.post(f'/gift/{gift_id}/purchase', data=replayed).status_code == 204
+    assert client.post(f'/gift/{gift_id}/unmark', data=replayed).status_code == 204
+
+
+@pytest.mark.skipif(shutil.which('node') is None, reason='needs node')
+@pytest.mark.parametrize('response, dequeued, notified', [
+    ({'type': 'opaqueredirect'}, [], ['action-login-required']),
+    ({'status': 503}, [], []),
+    ({'ok': True, 'status': 204}, [1], ['action-replayed']),
+    ({'status': 409}, [1], ['action-conflict']),
+    ({'status': 404}, [1], ['action-failed']),
+])
+def test_service_worker_keeps_actions_the_server_did_not_take(client, tmp_path, response, dequeued, notified):
+    harness = REPLAY_HARNESS.replace('RESPONSE', json.dumps(response))
+    assert run_service_worker(client, tmp_path, harness) == {'dequeued': dequeued, 'notified': notified}
+
+
+@pytest.mark.skipif(shutil.which('node') is None, reason='needs node')
+def test_service_worker_forgets_the_family_on_logout_and_login(client, tmp_path):
+    report = run_service_worker(client, tmp_path, EVENTS_HARNESS)
+    for logout in ('family-logout', 'admin-logout'):
+        assert report[logout] == {'deleted': ['images', 'pages'], 'queueCleared': True}
+    # Actions queued while signed out are replayed after the login, so they stay
+    for login in ('family-login', 'admin-login'):
+        assert report[login] == {'deleted': ['images', 'pages'], 'queueCleared': False}
+    # A page rendered with a fresh CSRF token is not a changed list
+    assert report['new-token'] == [] and report['new-gift'] == ['page-updated']
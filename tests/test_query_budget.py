@@ -0,0 +1,176 @@
+"""
+Query-count budgets for every route.
+
+Each route is requested against a small and a large data set. The number of
+SQL statements it issues must not depend on the data size (no N+1 patterns)
+and must stay within the budget declared below. New routes must declare a
+budget before the suite passes again.
+"""
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import bcrypt
+import pytest
+from sqlalchemy import event
+
+from app import db, family_cache, Family, AdminUser, SuperAdmin, Child, Gift, PasswordResetToken, hash_reset_token
+
+PASSWORD = 'heslo123'
+PASSWORD_HASH = bcrypt.hashpw(PASSWORD.encode('utf-8'), bcrypt.gensalt(4)).decode('utf-8')
+RESET_TOKEN = 'budget-test-token'
+
+SMALL = {'families': 1, 'children': 2, 'gifts': 1}
+LARGE = {'families': 5, 'children': 8, 'gifts': 12}
+
+GIFT_FORM = {'name': 'Bicykel', 'description': '', 'link': '', 'link2': '', 'image_url': '', 'price_range': '50 €'}
+
+# endpoint: (session, method, url, form data, expected status, statement budget)
+ROUTES = {
+    'index': (None, 'GET', '/', None, 302, 0),
+    'family_login': (None, 'POST', '/family-login', {'password': PASSWORD}, 302, 1),
+    'family_logout': ('family', 'GET', '/family-logout', None, 302, 0),
+    'family_dashboard': ('family', 'GET', '/family-dashboard', None, 200, 3),
+    'child_gifts': ('family', 'GET', '/child/{child_id}', None, 200, 3),
+    'web_manifest': (None, 'GET', '/manifest.webmanifest', None, 200, 0),
+    'service_worker': (None, 'GET', '/service-worker.js', None, 200, 0),
+    'family_wishlist': ('family', 'GET', '/family-wishlist', None, 200, 1),
+    'purchase_gift': ('family', 'POST', '/gift/{gift_id}/purchase', {'buyer_name': 'Babka'}, 302, 6),
+    'unmark_gift': ('family', 'POST', '/gift/{gift_id}/unmark', None, 302, 5),
+    'admin_login': (None, 'POST', '/admin-login', {'email': 'admin1@example.com', 'password': PASSWORD}, 302, 2),
+    'admin_logout': ('admin', 'GET', '/admin-logout', None, 302, 0),
+    'admin_dashboard': ('admin', 'GET', '/admin', None, 200, 2),
+    'admin_add_child': ('admin', 'POST', '/admin/child/add', {'name': 'Nové', 'age': '3'}, 302, 3),
+    'admin_edit_child': ('admin', 'POST', '/admin/child/{child_id}/edit', {'name': 'Upravené', 'age': ''}, 302, 4),
+    'admin_delete_child': ('admin', 'POST', '/admin/child/{child_id}/delete', None, 302, 7),
+    'admin_child_gifts': ('admin', 'GET', '/admin/child/{child_id}/gifts', None, 200, 3),
+    'admin_bulk_gifts': ('admin', 'POST', '/admin/child/{child_id}/gifts/bulk', {
+        'action': 'copy', 'gift_ids': ['1', '2', '3'], 'target_child_id': '2'}, 302, 7),
+    'admin_broken_links': ('admin', 'GET', '/admin/broken-links', None, 200, 1),
+    'admin_add_gift': ('admin', 'POST', '/admin/child/{child_id}/gift/add', GIFT_FORM, 302, 6),
+    'admin_edit_gift': ('admin', 'POST', '/admin/gift/{gift_id}/edit', GIFT_FORM, 302, 5),
+    'admin_delete_gift': ('admin', 'POST', '/admin/gift/{gift_id}/delete', None, 302, 5),
+    'admin_reorder_gift': ('admin', 'POST', '/admin/gift/{gift_id}/reorder', {'after': '', 'before': ''}, 200, 4),
+    'admin_family_settings': ('admin', 'GET', '/admin/family-settings', None, 200, 1),
+    'reset_password_request': (None, 'POST', '/reset-password-request', {'email': 'admin1@example.com'}, 200, 3),
+    'reset_password': (None, 'POST', '/reset-password/{token}', {'password': 'nove-heslo', 'confirm_password': 'nove-heslo'}, 302, 4),
+    'superadmin_login': (None, 'POST', '/superadmin-login', {'email': 'super@example.com', 'password': PASSWORD}, 302, 1),
+    'superadmin_logout': ('superadmin', 'GET', '/superadmin-logout', None, 302, 0),
+    'superadmin_dashboard': ('superadmin', 'GET', '/superadmin', None, 200, 7),
+    'superadmin_add_family': ('superadmin', 'POST', '/superadmin/family/add', {
+        'name': 'Nová rodina', 'password': 'rodina-heslo', 'confirm_password': 'rodina-heslo',
+        'admin_email': 'novy@example.com', 'admin_password': 'spravca-heslo'}, 302, 4),
+    'superadmin_reset_family_password': ('superadmin', 'POST', '/superadmin/family/{family_id}/reset-password', None, 302, 2),
+    'superadmin_delete_family': ('superadmin', 'POST', '/superadmin/family/{family_id}/delete', None, 302, 2),
+    'superadmin_family_admins': ('superadmin', 'GET', '/superadmin/family/{family_id}/admins', None, 200, 2),
+    'superadmin_add_family_admin': ('superadmin', 'POST', '/superadmin/family/{family_id}/admin/add', {
+        'email': 'druhy@example.com', 'password': 'spravca-heslo'}, 302, 3),
+    'superadmin_edit_family_admin': ('superadmin', 'POST', '/superadmin/admin/{admin_id}/edit', {
+        'email': 'admin1@example.com', 'password': 'ine-heslo'}, 302, 5),
+    'superadmin_delete_family_admin': ('superadmin', 'POST', '/superadmin/admin/{admin_id}/delete', None, 302, 3),
+    'superadmin_cache_stats': ('superadmin', 'GET', '/superadmin/cache-stats', None, 200, 0),
+    'superadmin_outbound_stats': ('superadmin', 'GET', '/superadmin/outbound-stats', None, 200, 0),
+    'superadmin_analytics': ('superadmin', 'GET', '/superadmin/analytics?days=90', None, 200, 2),
+    'superadmin_analytics_csv': ('superadmin', 'GET', '/superadmin/analytics.csv?family=1', None, 200, 1),
+    'superadmin_changes': ('superadmin', 'GET', '/superadmin/changes?after=0', None, 200, 1),
+    'superadmin_profiles': ('superadmin', 'GET', '/superadmin/profiles', None, 200, 0),
+    'superadmin_profile_download': ('superadmin', 'GET', '/superadmin/profiles/missing', None, 404, 0),
+}
+
+IGNORED_ENDPOINTS = {'static'}
+
+
+def seed(families, children, gifts):
+    """Create `families` families with `children` children of `gifts` gifts each"""
+    db.session.add(SuperAdmin(email='super@example.com', password_hash=PASSWORD_HASH))
+    for f in range(1, families + 1):
+        family = Family(name=f'Rodina {f}', password_hash=PASSWORD_HASH)
+        db.session.add(family)
+        db.session.flush()
+        for a in range(1, 3):
+            db.session.add(AdminUser(email=f'admin{(f - 1) * 2 + a}@example.com',
+                                     password_hash=PASSWORD_HASH, family_id=family.id))
+        for c in range(children):
+            child = Child(name=f'Dieťa {f}-{c}', age=5, family_id=family.id)
+            db.session.add(child)
+            db.session.flush()
+            for n in range(gifts):
+                db.session.add(Gift(name=f'Darček {n}', description='Popis', price_range='10 €',
+                                    is_purchased=n % 2 == 1, purchased_by='Teta' if n % 2 else None,
+                                    child_id=child.id))
+    db.session.add(PasswordResetToken(email='admin1@example.com', token_hash=hash_reset_token(RESET_TOKEN),
+                                      expires_at=datetime.utcnow() + timedelta(hours=1)))
+    db.session.commit()
+    db.session.remove()
+    family_cache.clear()
+
+
+@contextmanager
+def count_statements():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def measure(client, endpoint, size):
+    db.drop_all()
+    db.create_all()
+    seed(**size)
+
+    kind, method, url, data, expected_status, budget = ROUTES[endpoint]
+    url = url.format(child_id=1, gift_id=1, family_id=1, admin_id=1, token=RESET_TOKEN)
+    with client.session_transaction() as sess:
+        sess.clear()
+        if kind in ('family', 'admin'):
+            sess['family_id'] = 1
+            sess['family_name'] = 'Rodina 1'
+        if kind == 'admin':
+            sess['admin_id'] = 1
+            sess['admin_email'] = 'admin1@example.com'
+        if kind == 'superadmin':
+            sess['superadmin_id'] = 1
+            sess['superadmin_email'] = 'super@example.com'
+
+    with count_statements() as statements:
+        response = client.open(url, method=method, data=data)
+        response.get_data()  # streamed pages query while they render
+    db.session.remove()
+
+    assert response.status_code == expected_status, f'{endpoint} returned {response.status_code}'
+    return statements
+
+
+def test_every_route_declares_a_budget(app):
+    endpoints = set(app.view_functions) - IGNORED_ENDPOINTS
+    assert endpoints - set(ROUTES) == set(), 'routes without a query budget'
+    assert set(ROUTES) - endpoints == set(), 'budgets for routes that no longer exist'
+
+
+@pytest.mark.parametrize('endpoint', sorted(ROUTES))
+def test_query_count_is_constant_and_within_budget(client, endpoint):
+    budget = ROUTES[endpoint][-1]
+    small = measure(client, endpoint, SMALL)
+    large = measure(client, endpoint, LARGE)
+
+    assert len(large) == len(small), (
+        f'{endpoint} issues {len(small)} statements on small data but {len(large)} on large data:\n'
+        + '\n'.join(large)
+    )
+    assert len(large) <= budget, (
+        f'{endpoint} issues {len(large)} statements, budget is {budget}:\n' + '\n'.join(large)
+    )
+
+
+def test_cached_family_pages_issue_one_statement(client):
+    measure(client, 'family_dashboard', LARGE)
+    for url in ('/family-dashboard', '/child/1'):
+        with count_statements() as statements:
+            response = client.get(url)
+        assert response.status_code == 200
+        assert len(statements) == 1, '\n'.join(statements)
@@ -0,0 +1,65 @@
+import random
+
+import pytest
+
+import app as wishlist
+from app import db, Family, Child, Gift
+from ranking import key_between, spread
+
+
+def test_keys_sort_between_their_neighbours():
+    keys = []
+    rng = random.Random(7)
+    for _ in range(1000):
+        n = rng.randint(0, len(keys))
+        key = key_between(keys[n - 1] if n else None, keys[n] if n < len(keys) else None)
+        keys.insert(n, key)
+    assert keys == sorted(keys) and len(set(keys)) == len(keys)
+    assert all(not key.endswith('0') for key in keys)
+
+    appended = None
+    for _ in range(200):
+        appended = key_between(appended, None)
+    assert len(appended) < 10
+
+    with pytest.raises(ValueError):
+        key_between('b', 'a')
+
+
+def test_spread_gives_short_ordered_keys():
+    for count in (1, 3, 61, 62, 500):
+        keys = spread(count)
+        assert keys == sorted(keys) and len(set(keys)) == count
+    assert max(len(key) for key in spread(500)) == 2
+
+
+def test_reorder_rewrites_one_rank_and_rebalance_backfills(app, client):
+    family = Family(name='Rodina', password_hash='x')
+    db.session.add(family)
+    db.session.flush()
+    child = Child(name='Ema', family_id=family.id)
+    db.session.add(child)
+    db.session.flush()
+    db.session.add_all([Gift(name=f'Darček {n}', child_id=child.id) for n in range(3)])
+    db.session.commit()
+    family_id, child_id = family.id, child.id
+
+    # Gifts from before ranking existed keep their order
+    assert wishlist.rebalance_ranks() == 1
+    assert wishlist.rebalance_ranks() == 0
+    first, second, third = [gift.id for gift in Gift.query.order_by(Gift.rank)]
+
+    with client.session_transaction() as sess:
+        sess.update(admin_id=1, admin_email='a@example.com', family_id=family_id)
+    form = {'name': 'Bicykel', 'description': '', 'link': '', 'link2': '', 'image_url': '', 'price_range': ''}
+    client.post(f'/admin/child/{child_id}/gift/add', data=form)
+    fourth = Gift.query.filter_by(name='Bicykel').one().id
+
+    ranks_before = dict(db.session.query(Gift.id, Gift.rank))
+    response = client.post(f'/admin/gift/{fourth}/reorder', json={'after': first, 'before': second})
+    assert response.status_code == 200
+    ranks_after = dict(db.session.query(Gift.id, Gift.rank))
+    assert {gift_id for gift_id in ranks_after if ranks_after[gift_id] != ranks_before[gift_id]} == {fourth}
+    assert [gift.id for gift in db.session.get(Child, child_id).gifts] == [first, fourth, second, third]
+
+    assert client.post(f'/admin/gift/{fourth}/reorder', json={'after': 9999}).status_code == 400
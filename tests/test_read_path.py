@@ -0,0 +1,30 @@
+import app as wishlist
+from app import db, Family, Child, Gift
+
+
+def test_list_pages_read_plain_rows(app, client):
+    family = Family(name='Rodina', password_hash='x')
+    db.session.add(family)
+    db.session.flush()
+    child = Child(name='Ema', family_id=family.id)
+    db.session.add(child)
+    db.session.flush()
+    db.session.add_all([
+        Gift(name='Lego', description='a' * 80, child_id=child.id, rank='1'),
+        Gift(name='Kniha', description='krátky popis', child_id=child.id, rank='2'),
+    ])
+    db.session.commit()
+    # Rows from before is_purchased had a default
+    db.session.execute(Gift.__table__.update().values(is_purchased=None))
+    db.session.commit()
+    family_id, child_id = family.id, child.id
+
+    (snapshot,) = wishlist.build_family_snapshot(family_id)
+    assert [gift.is_purchased for gift in snapshot.gifts] == [False, False]
+    assert snapshot.gifts[0].description == 'a' * 80
+
+    with client.session_transaction() as sess:
+        sess.update(admin_id=1, family_id=family_id)
+    page = client.get(f'/admin/child/{child_id}/gifts').get_data(as_text=True)
+    assert 'a' * 50 + '...' in page and 'a' * 51 not in page
+    assert 'krátky popis' in page and 'Dostupné' in page
@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, inspect, text
+
+import app as wishlist
+from app import db, Family, AdminUser, PasswordResetToken
+
+
+def setup_admin():
+    family = Family(name='Rodina', password_hash='x')
+    db.session.add(family)
+    db.session.flush()
+    db.session.add(AdminUser(email='a@example.com', password_hash='x', family_id=family.id))
+    db.session.commit()
+
+
+def request_reset(client, monkeypatch):
+    """Ask for a reset link, returns (the token the e-mail would carry or None, the page)"""
+    sent = []
+    monkeypatch.setattr(wishlist, 'send_reset_email', lambda email, token, user_type='admin': sent.append(token) or True)
+    response = client.post('/reset-password-request', data={'email': 'a@example.com'})
+    return (sent[0] if sent else None), response.get_data(as_text=True)
+
+
+def test_only_the_token_hash_is_stored(app, client, monkeypatch):
+    setup_admin()
+    token, _ = request_reset(client, monkeypatch)
+
+    stored = db.session.execute(db.select(PasswordResetToken.__table__)).mappings().one()
+    assert token not in [str(value) for value in stored.values()]
+    assert stored['token_hash'] == wishlist.hash_reset_token(token)
+    # The hash itself is no key to the account
+    assert client.get(f"/reset-password/{stored['token_hash']}").status_code == 302
+
+    response = client.post(f'/reset-password/{token}', data={'password': 'nove-heslo', 'confirm_password': 'nove-heslo'})
+    assert response.location.endswith('/admin-login')
+    assert wishlist.check_password('nove-heslo', AdminUser.query.one().password_hash)
+    assert PasswordResetToken.query.one().used
+
+
+def test_fourth_outstanding_link_is_refused(app, client, monkeypatch):
+    setup_admin()
+    tokens = [request_reset(client, monkeypatch)[0] for _ in range(3)]
+    assert None not in tokens and len(set(tokens)) == 3
+
+    token, page = request_reset(client, monkeypatch)
+    assert token is None and 'Link na reset hesla už bol odoslaný' in page
+    assert PasswordResetToken.query.count() == 3
+
+    # Expired links no longer count
+    PasswordResetToken.query.update({'expires_at': datetime.utcnow() - timedelta(minutes=1)})
+    db.session.commit()
+    assert request_reset(client, monkeypatch)[0] is not None
+
+
+def test_used_and_expired_tokens_are_pruned(app):
+    now = datetime.utcnow()
+    db.session.add_all([
+        PasswordResetToken(email='a@example.com', token_hash='used', expires_at=now + timedelta(hours=1), used=True),
+        PasswordResetToken(email='a@example.com', token_hash='expired', expires_at=now - timedelta(minutes=1)),
+        PasswordResetToken(email='a@example.com', token_hash='valid', expires_at=now + timedelta(hours=1)),
+    ])
+    db.session.commit()
+
+    assert wishlist.prune_reset_tokens(batch_size=1) == 2
+    assert [token.token_hash for token in PasswordResetToken.query] == ['valid']
+
+
+def test_plaintext_token_table_is_dropped_on_upgrade(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE password_reset_token (id INTEGER PRIMARY KEY, email VARCHAR(120), '
+                          'token VARCHAR(100), expires_at DATETIME, used BOOLEAN, created_at DATETIME)'))
+        conn.execute(text("INSERT INTO password_reset_token (email, token) VALUES ('a@example.com', 'plaintext')"))
+
+    wishlist.migrate_schema(engine)
+    assert not inspect(engine).has_table('password_reset_token')
+    engine.dispose()
@@ -0,0 +1,106 @@
+import pytest
+
+import app as wishlist
+from app import db, Family, Child, Gift, ChangeEvent
+from sharding import ShardRouter, use_family, move_family
+
+
+@pytest.fixture
+def router(app, tmp_path, monkeypatch):
+    shards = {name: f'sqlite:///{tmp_path / name}.db' for name in ('a', 'b')}
+    router = ShardRouter(db, f'sqlite:///{tmp_path}/directory.db', shards, wishlist.SHARDED_TABLES, cache_ttl=0)
+    router.create_all()
+    monkeypatch.setitem(app.extensions, 'shard_router', router)
+    return router
+
+
+def add_family(name, gifts):
+    family = Family(name=name, password_hash='x')
+    db.session.add(family)
+    db.session.commit()
+    wishlist.get_router().assign(family.id)
+    with use_family(family.id):
+        child = Child(name=f'Dieťa {name}', family_id=family.id)
+        db.session.add(child)
+        db.session.flush()
+        db.session.add_all([Gift(name=f'Darček {n}', child_id=child.id) for n in range(gifts)])
+        db.session.commit()
+    return family.id
+
+
+def count_rows(router, shard, table):
+    with router.engine(shard).connect() as conn:
+        return conn.execute(db.select(db.func.count()).select_from(db.metadata.tables[table])).scalar()
+
+
+def test_families_are_spread_over_shards_and_counted_together(router, client):
+    first, second = add_family('Prvá', 2), add_family('Druhá', 3)
+    assert {router.lookup(first)[0], router.lookup(second)[0]} == {'a', 'b'}
+    assert count_rows(router, 'default', 'gift') == 0
+    assert count_rows(router, router.lookup(second)[0], 'gift') == 3
+
+    with client.session_transaction() as sess:
+        sess['family_id'] = second
+    assert 'Dieťa Druhá' in client.get('/family-dashboard').get_data(as_text=True)
+
+    with client.session_transaction() as sess:
+        sess['superadmin_id'] = 1
+    page = client.get('/superadmin').get_data(as_text=True)
+    assert '<div class="stat-number">2</div>' in page
+    assert '<div class="stat-number">5</div>' in page
+
+    wishlist.rebuild_gift_activity()
+    assert wishlist.gift_activity(0, days=1)[0]['added'] == 5
+
+
+def test_move_family_renumbers_rows_and_pauses_writes(router, client, monkeypatch):
+    monkeypatch.setattr('sharding.time.sleep', lambda seconds: None)
+    add_family('Iná', 1)
+    family_id = add_family('Rodina', 4)
+    source = router.lookup(family_id)[0]
+    target = 'a' if source == 'b' else 'b'
+    with use_family(family_id):
+        gift_id = Gift.query.first().id
+
+    with client.session_transaction() as sess:
+        sess['family_id'] = family_id
+    router.set(family_id, source, moving=True)
+    response = client.post(f'/gift/{gift_id}/purchase', data={'buyer_name': 'Babka'})
+    assert response.status_code == 503
+    router.set(family_id, source)
+
+    switched = []
+    assert move_family(router, family_id, target, chunk_size=3, on_switched=lambda new_ids: switched.append(router.lookup(family_id))) == 4
+    assert switched == [(target, True)]
+    assert router.lookup(family_id) == (target, False)
+    with use_family(family_id):
+        assert sorted(gift.name for gift in Gift.query.join(Child).filter(Child.family_id == family_id)) == [
+            'Darček 0', 'Darček 1', 'Darček 2', 'Darček 3']
+    assert count_rows(router, source, 'gift') == 0
+    assert count_rows(router, target, 'gift') == 5
+
+
+def test_move_command_carries_counters_and_history_to_the_new_ids(router, app, monkeypatch):
+    monkeypatch.setattr('sharding.time.sleep', lambda seconds: None)
+    family_id = add_family('Rodina', 2)
+    source = router.lookup(family_id)[0]
+    target = 'a' if source == 'b' else 'b'
+    add_family('Iná', 3)  # its ids on the target collide with the moved ones
+    with use_family(family_id):
+        old_ids = sorted(gift.id for gift in Gift.query.join(Child).filter(Child.family_id == family_id))
+    for gift_id in old_ids:
+        wishlist.record_change(family_id, ('gift', gift_id), 'added')
+    db.session.commit()
+    wishlist.write_behind.increment(Gift.__table__, old_ids[0], 'view_count', amount=3, shard=source)
+
+    result = app.test_cli_runner().invoke(args=['move-family', str(family_id), target])
+    assert result.exit_code == 0, result.output
+    assert len(wishlist.write_behind) == 0
+    with use_family(family_id):
+        gifts = Gift.query.join(Child).filter(Child.family_id == family_id).order_by(Gift.name).all()
+        new_ids = [gift.id for gift in gifts]
+        assert [gift.view_count for gift in gifts] == [3, 0]
+    assert new_ids != old_ids
+    for gift_id in new_ids:
+        assert [change.action for change in wishlist.gift_history(family_id, gift_id)] == ['added']
+    assert ChangeEvent.query.filter_by(family_id=family_id).count() == 2
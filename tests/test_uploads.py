@@ -0,0 +1,43 @@
+import os
+
+import pytest
+
+import app as wishlist
+
+
+@pytest.fixture
+def upload(app):
+    upload_dir = os.path.join(app.static_folder, 'uploads')
+    os.makedirs(upload_dir, exist_ok=True)
+    path = os.path.join(upload_dir, 'test_upload.png')
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG' + b'0' * 100)
+    yield 'uploads/test_upload.png'
+    os.remove(path)
+
+
+def test_send_file_fallback_supports_conditional_and_range_requests(client, upload):
+    response = client.get(f'/static/{upload}')
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    assert client.get(f'/static/{upload}', headers={'If-None-Match': etag}).status_code == 304
+    partial = client.get(f'/static/{upload}', headers={'Range': 'bytes=0-3'})
+    assert (partial.status_code, partial.data) == (206, b'\x89PNG')
+
+
+@pytest.mark.parametrize('mode, header, value', [
+    ('x-accel', 'X-Accel-Redirect', '/protected-uploads/test_upload.png'),
+    ('x-sendfile', 'X-Sendfile', None),
+])
+def test_offload_hands_the_file_to_the_front_server(client, upload, monkeypatch, mode, header, value):
+    fallback_etag = client.get(f'/static/{upload}').headers['ETag']
+    monkeypatch.setattr(wishlist.static_assets, 'offload', mode)
+
+    response = client.get(f'/static/{upload}')
+    assert response.status_code == 200
+    assert response.data == b''
+    assert response.headers[header] == (value or os.path.join(wishlist.app.static_folder, upload))
+    assert response.headers['ETag'] == fallback_etag
+    assert response.headers['Content-Type'] == 'image/png'
+    assert client.get(f'/static/{upload}', headers={'If-None-Match': fallback_etag}).status_code == 304
+    assert client.get('/static/uploads/missing.png').status_code == 404
@@ -0,0 +1,79 @@
+import os
+import runpy
+import threading
+import time
+
+import app as wishlist
+import wsgi
+from app import db, Family, Child, Gift
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_drain_finishes_background_work(app):
+    family = Family(name='Rodina', password_hash='x')
+    db.session.add(family)
+    db.session.flush()
+    child = Child(name='Ema', family_id=family.id)
+    db.session.add(child)
+    db.session.flush()
+    gift = Gift(name='Lopta', child_id=child.id)
+    db.session.add(gift)
+    db.session.commit()
+
+    finished = threading.Event()
+
+    def slow_job():
+        time.sleep(0.2)
+        finished.set()
+
+    wishlist.scheduler.start()
+    assert wishlist.link_pool.submit(slow_job)
+    wishlist.write_behind.increment(Gift.__table__, gift.id, 'view_count')
+
+    wishlist.drain_background_work(timeout=5)
+    # The queued job ran to the end, pending counters were written and the scheduler stopped
+    assert finished.is_set()
+    db.session.expire_all()
+    assert db.session.get(Gift, gift.id).view_count == 1
+    assert not any(thread.name == 'scheduler' for thread in threading.enumerate())
+    # The pool takes jobs again afterwards, e.g. in the next test
+    assert wishlist.link_pool.submit(lambda: None)
+
+
+def test_init_worker_drops_inherited_connections(app, monkeypatch):
+    calls = []
+    monkeypatch.setattr(db.engine, 'dispose', lambda close=True: calls.append(('dispose', close)))
+    monkeypatch.setattr(wishlist.scheduler, 'start', lambda: calls.append('scheduler'))
+    if wishlist.family_cache.backend:
+        monkeypatch.setattr(wishlist.family_cache.backend, 'reopen', lambda: calls.append('cache'))
+    monkeypatch.setitem(app.config, 'SCHEDULER_ENABLED', True)
+
+    wishlist.init_worker()
+    # close=False: the parent's sockets stay open for the parent
+    assert ('dispose', False) in calls and calls[-1] == 'scheduler'
+    assert ('cache' in calls) == bool(wishlist.family_cache.backend)
+
+    calls.clear()
+    monkeypatch.setitem(app.config, 'SCHEDULER_ENABLED', False)
+    wishlist.init_worker()
+    assert 'scheduler' not in calls
+
+
+def test_gunicorn_hooks(monkeypatch):
+    monkeypatch.setenv('SCHEDULER_AUTOSTART', 'false')
+    monkeypatch.setenv('GUNICORN_GRACEFUL_TIMEOUT', '12')
+    config = runpy.run_path(os.path.join(ROOT, 'gunicorn.conf.py'))
+    assert config['preload_app'] and config['graceful_timeout'] == 12
+
+    calls = []
+    monkeypatch.setattr(wishlist, 'init_worker', lambda: calls.append('init'))
+    monkeypatch.setattr(wishlist, 'drain_background_work', lambda timeout=None: calls.append(('drain', timeout)))
+    config['post_fork'](None, None)
+    config['worker_exit'](None, None)
+    assert calls == ['init', ('drain', 12)]
+
+
+def test_wsgi_rejects_unknown_servers(capsys):
+    assert wsgi.main(['wsgi.py', 'uwsgi']) == 1
+    assert 'Usage' in capsys.readouterr().out
@@ -0,0 +1,37 @@
+import app as wishlist
+from app import db, Family, AdminUser, Child, Gift
+from writebehind import WriteBehindBuffer
+
+
+def test_logins_and_views_are_written_in_one_batch(app, client):
+    family = Family(name='Rodina', password_hash='x')
+    db.session.add(family)
+    db.session.flush()
+    admin = AdminUser(email='a@example.com', password_hash='x', family_id=family.id)
+    child = Child(name='Ema', family_id=family.id)
+    db.session.add_all([admin, child])
+    db.session.flush()
+    gift = Gift(name='Lopta', child_id=child.id)
+    db.session.add(gift)
+    db.session.commit()
+
+    with client.session_transaction() as sess:
+        sess['family_id'] = family.id
+    for _ in range(3):
+        assert client.get(f'/child/{child.id}').status_code == 200
+    wishlist.write_behind.set(AdminUser.__table__, admin.id, 'last_login', wishlist.datetime(2026, 1, 2, 3, 4, 5))
+
+    assert db.session.get(Gift, gift.id).view_count == 0
+    assert wishlist.write_behind.flush() == 2
+    db.session.expire_all()
+    assert db.session.get(Gift, gift.id).view_count == 3
+    assert db.session.get(AdminUser, admin.id).last_login == wishlist.datetime(2026, 1, 2, 3, 4, 5)
+
+
+def test_buffer_is_bounded():
+    buffer = WriteBehindBuffer(max_keys=2)
+    for gift_id in range(5):
+        buffer.increment(Gift.__table__, gift_id, 'view_count')
+    buffer.increment(Gift.__table__, 0, 'view_count')
+    assert buffer.stats()['pending'] == 2
+    assert buffer.dropped == 3
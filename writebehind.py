@@ -0,0 +1,120 @@
+"""
+Write-behind buffer for low-value, high-frequency updates.
+
+Request handlers record updates such as ``last_login`` or view counters in
+memory; ``flush()`` writes everything that accumulated in one transaction.
+Repeated updates to the same row and column coalesce: ``set`` keeps the last
+value and ``increment`` sums, so a busy page costs one UPDATE per row per
+flush instead of one commit per request, and never takes SQLite's write lock
+on the request path.
+
+What can be lost: everything recorded since the last successful flush lives
+only in this process's memory. A crash, ``kill -9`` or power loss drops it:
+``last_login`` then shows an earlier login and view counters undercount by
+the views of that interval. A clean shutdown flushes first. If a flush fails,
+the updates are put back and retried on the next one. The buffer holds at most
+``max_keys`` distinct (table, column, row) entries; updates to new keys beyond
+that are dropped and counted in ``dropped``. Only record data here that the app
+can afford to lose this way, never purchases or anything a user edits.
+
+Rows of sharded tables are recorded with their shard name; ``engines`` maps
+a shard name to the engine its updates are written to.
+"""
+import threading
+
+from sqlalchemy import bindparam, func
+
+SET = 'set'
+INCREMENT = 'increment'
+
+
+class WriteBehindBuffer:
+    """Coalesces updates in memory and writes them in one batched transaction"""
+
+    def __init__(self, app=None, db=None, max_keys=10000, engines=None):
+        self.app = app
+        self.db = db
+        self.engines = engines
+        self.max_keys = max_keys
+        self.dropped = 0
+        self.flushed = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def set(self, table, row_id, column, value, shard=None):
+        """Record `table.column = value` for a row; the last value wins"""
+        self._record((shard, table.name, column, row_id), SET, value)
+
+    def increment(self, table, row_id, column, amount=1, shard=None):
+        """Record `table.column += amount` for a row; increments add up"""
+        self._record((shard, table.name, column, row_id), INCREMENT, amount)
+
+    def _record(self, key, kind, value):
+        with self._lock:
+            current = self._pending.get(key)
+            if current is None:
+                if len(self._pending) >= self.max_keys:
+                    self.dropped += 1
+                    return
+                self._pending[key] = (kind, value)
+            elif kind == INCREMENT:
+                self._pending[key] = (kind, current[1] + value)
+            else:
+                self._pending[key] = (kind, value)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        """Write all pending updates in one transaction, returns how many rows were updated"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        # One transaction per shard, one executemany per (table, column, kind)
+        shards = {}
+        for (shard, table_name, column, row_id), (kind, value) in pending.items():
+            shards.setdefault(shard, {}).setdefault((table_name, column, kind), []).append(
+                {'row_id': row_id, 'value': value})
+        written = 0
+        for shard, groups in shards.items():
+            try:
+                with self.app.app_context():
+                    engine = self.engines(shard) if shard is not None and self.engines else self.db.engine
+                    with engine.begin() as conn:
+                        for (table_name, column, kind), rows in groups.items():
+                            table = self.db.metadata.tables[table_name]
+                            target = table.c[column]
+                            value = bindparam('value', type_=target.type)
+                            if kind == INCREMENT:
+                                value = func.coalesce(target, 0) + value
+                            conn.execute(table.update().where(table.c.id == bindparam('row_id')).values({column: value}), rows)
+            except Exception as e:
+                print(f"Write-behind flush failed, retrying later: {e}")
+                self._restore({key: update for key, update in pending.items() if key[0] == shard})
+                continue
+            written += sum(len(rows) for rows in groups.values())
+
+        with self._lock:
+            self.flushed += written
+        return written
+
+    def _restore(self, pending):
+        with self._lock:
+            for key, (kind, value) in pending.items():
+                newer = self._pending.get(key)
+                if newer is None:
+                    if len(self._pending) >= self.max_keys:
+                        self.dropped += 1
+                        continue
+                    self._pending[key] = (kind, value)
+                elif kind == INCREMENT:
+                    self._pending[key] = (kind, newer[1] + value)
+                # a newer SET already replaces the failed one
+
+    def stats(self):
+        with self._lock:
+            return {'pending': len(self._pending), 'max_keys': self.max_keys,
+                    'flushed': self.flushed, 'dropped': self.dropped}
@@ -0,0 +1,67 @@
+"""
+Production entry point.
+
+``wsgi:app`` is the WSGI application for any server. ``python wsgi.py``
+starts it with gunicorn (gunicorn.conf.py) where available, otherwise with
+waitress, which also runs on Windows::
+
+    python wsgi.py                   # gunicorn, falling back to waitress
+    python wsgi.py waitress          # force waitress
+"""
+import os
+import signal
+import sys
+
+from app import app, drain_background_work
+
+
+def serve_gunicorn():
+    config = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gunicorn.conf.py')
+    os.execvp(sys.executable, [sys.executable, '-m', 'gunicorn', '-c', config, 'wsgi:app'])
+
+
+def serve_waitress():
+    from waitress import serve
+
+    # waitress only stops cleanly on KeyboardInterrupt, so treat SIGTERM the same way
+    def interrupt(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, interrupt)
+    try:
+        serve(
+            app,
+            host=os.environ.get('HOST', '0.0.0.0'),
+            port=int(os.environ.get('PORT', 5000)),
+            threads=int(os.environ.get('WAITRESS_THREADS', 8)),
+            connection_limit=int(os.environ.get('WAITRESS_CONNECTION_LIMIT', 100)),
+            channel_timeout=int(os.environ.get('WAITRESS_CHANNEL_TIMEOUT', 30)),
+            clear_untrusted_proxy_headers=True,
+        )
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print("Draining background jobs...")
+        drain_background_work(timeout=30)
+
+
+def main(argv):
+    server = argv[1] if len(argv) > 1 else None
+    if server not in (None, 'gunicorn', 'waitress'):
+        print("Usage: python wsgi.py [gunicorn|waitress]")
+        return 1
+    if server is None:
+        try:
+            import gunicorn  # noqa: F401
+            server = 'gunicorn' if os.name != 'nt' else 'waitress'
+        except ImportError:
+            server = 'waitress'
+    if server == 'gunicorn':
+        serve_gunicorn()
+    else:
+        serve_waitress()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))